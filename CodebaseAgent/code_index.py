@@ -0,0 +1,447 @@
+"""Local symbol and token index over the Python sources of a git repository."""
+import ast
+import bisect
+import hashlib
+import json
+import logging
+import os
+import re
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, Optional, Protocol
+
+from CodebaseAgent.schema import CodeSnippet, LogSourceJoin, ResolvedLogSite
+from consts import CODE_INDEX_DIR, CODE_INDEX_REFRESH_SECONDS, CODE_INDEX_LOCAL_ROOTS
+from instrumentation import span
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 1
+TOKEN_PATTERN = re.compile(r'[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+')
+GITHUB_SLUG_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9-]*/(?!\.\.?$)[\w.-]+$')
+
+
+class _HasLogSite(Protocol):
+    filename: str
+    funcName: str
+    lineno: int
+
+
+@dataclass(frozen=True)
+class Symbol:
+    """A function, method or class definition and the lines it spans."""
+    qualname: str
+    kind: str
+    path: str
+    start: int
+    end: int
+
+    @property
+    def name(self) -> str:
+        return self.qualname.rsplit('.', 1)[-1]
+
+
+def tokenize(text: str) -> set[str]:
+    """Lowercase word tokens of identifiers and text, splitting snake_case and CamelCase."""
+    return {token.lower() for token in TOKEN_PATTERN.findall(text) if len(token) > 1}
+
+
+def git_blob_hash(data: bytes) -> str:
+    """Hash of file contents as git computes it for blobs."""
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
+
+def _parse_symbols(path: str, source: str) -> list[tuple[str, str, int, int, list[str]]]:
+    """(qualname, kind, start, end, tokens) of every definition in a module, tokens cover name, body and strings."""
+    tree = ast.parse(source, filename=path)
+    symbols = []
+
+    def visit(node: ast.AST, prefix: str, in_class: bool) -> None:
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                qualname = f"{prefix}{child.name}"
+                kind = 'class' if isinstance(child, ast.ClassDef) else ('method' if in_class else 'function')
+                start = min([child.lineno] + [decorator.lineno for decorator in child.decorator_list])
+                words = {child.name}
+                for inner in ast.walk(child):
+                    if isinstance(inner, ast.Name):
+                        words.add(inner.id)
+                    elif isinstance(inner, ast.Attribute):
+                        words.add(inner.attr)
+                    elif isinstance(inner, ast.Constant) and isinstance(inner.value, str):
+                        words.add(inner.value)
+                symbols.append((qualname, kind, start, child.end_lineno, sorted(tokenize(' '.join(words)))))
+                visit(child, f"{qualname}.", isinstance(child, ast.ClassDef))
+            else:
+                visit(child, prefix, in_class)
+
+    visit(tree, '', False)
+    return symbols
+
+
+class CodeIndex:
+    """
+    Symbol table and inverted token index of the Python files in one repository.
+
+    Files are re-parsed only when their git blob hash changes, and the index is persisted
+    under CODE_INDEX_DIR so a new process starts from the previous run's state. Lookups are
+    dictionary and bisect operations over the in-memory tables.
+    """
+
+    def __init__(self, repo: str, index_dir: str = CODE_INDEX_DIR, local_roots: Iterable[str] = CODE_INDEX_LOCAL_ROOTS):
+        local = _local_checkout(repo, local_roots)
+        self.repo = repo
+        self.root = local or os.path.join(index_dir, 'repos', _repo_key(repo))
+        self.index_path = os.path.join(index_dir, f"{_repo_key(local or repo)}.json")
+        self.commit: Optional[str] = None
+        self.refreshed_at = 0.0
+        self._files: dict[str, dict] = {}
+        self._by_name: dict[str, list[Symbol]] = {}
+        self._by_path: dict[str, list[Symbol]] = {}
+        self._starts_by_path: dict[str, list[int]] = {}
+        self._paths_by_basename: dict[str, list[str]] = {}
+        self._postings: dict[str, set[Symbol]] = {}
+        self._lines: dict[str, list[str]] = {}
+        self._resolved_sites: dict[tuple[str, str, int], Optional[Symbol]] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def refresh(self, fetch: bool = False) -> None:
+        """
+        Bring the index up to date with the checkout, re-parsing only files whose blob changed.
+
+        Args:
+            fetch: Pull the remote before indexing, only for repositories cloned from GitHub
+        """
+        with self._lock, span("code_index.refresh", "index") as refresh_span:
+            if fetch or not os.path.isdir(self.root):
+                self._sync_checkout()
+            blobs = self._current_blobs()
+            changed = [path for path, blob in blobs.items() if self._files.get(path, {}).get('blob') != blob]
+            removed = [path for path in self._files if path not in blobs]
+            for path in removed:
+                del self._files[path]
+            for path in changed:
+                self._files[path] = self._index_file(path, blobs[path])
+            refresh_span.count("files_parsed", len(changed))
+            commit = self._git('rev-parse', 'HEAD', check=False) or None
+            self.refreshed_at = time.time()
+            if commit != self.commit:
+                self._resolved_sites.clear()
+            self.commit = commit
+            if changed or removed or not self._by_path:
+                self._lines.clear()
+                self._resolved_sites.clear()
+                self._build_tables()
+                self._save()
+            logger.info(f"Indexed {self.repo} at {self.commit}: {len(changed)} files parsed, {len(removed)} removed, "
+                        f"{len(self._files)} total")
+
+    def find_symbol(self, name: str) -> list[Symbol]:
+        """Definitions whose name or qualified name equals name, e.g. 'process' or 'QueueProcessor.process'."""
+        return list(self._by_name.get(name, ()))
+
+    def symbol_at(self, path: str, line: int) -> Optional[Symbol]:
+        """Innermost definition enclosing line in path, path may be a bare file name if it is unique."""
+        for candidate in self._resolve_paths(path):
+            symbol = self._innermost(candidate, line)
+            if symbol is not None:
+                return symbol
+        return None
+
+    def resolve_log_site(self, filename: str, func_name: str, lineno: int) -> Optional[Symbol]:
+        """
+        Definition that emitted a log line, from the LogItem's filename, funcName and lineno.
+
+        Prefers the innermost definition enclosing lineno named func_name, then any definition named
+        func_name in a file with that name, then whatever encloses lineno.
+        """
+        paths = self._resolve_paths(filename)
+        enclosing = [self._innermost(path, lineno, func_name) for path in paths]
+        for symbol in enclosing:
+            if symbol is not None:
+                return symbol
+        named = [symbol for symbol in self._by_name.get(func_name, ()) if symbol.path in paths]
+        if named:
+            return named[0]
+        return self.symbol_at(filename, lineno)
+
+    def resolve_log_sites(self, sites: Iterable[tuple[str, str, int]]) -> dict[tuple[str, str, int], Optional[Symbol]]:
+        """
+        Resolve many (filename, funcName, lineno) log sites in one pass, see resolve_log_site.
+
+        Results are cached until the checkout moves to another commit or a file changes.
+
+        Args:
+            sites: Log sites, duplicates are resolved once
+
+        Returns:
+            dict: Emitting definition of every distinct site, None where it was not found
+        """
+        resolved = {}
+        for site in sites:
+            if site in resolved:
+                continue
+            if site not in self._resolved_sites:
+                self._resolved_sites[site] = self.resolve_log_site(*site)
+            resolved[site] = self._resolved_sites[site]
+        return resolved
+
+    def search(self, query: str, limit: int = 10) -> list[Symbol]:
+        """Definitions ranked by how many query tokens occur in their name, body or string literals."""
+        scores: dict[Symbol, int] = {}
+        for token in tokenize(query):
+            for symbol in self._postings.get(token, ()):
+                scores[symbol] = scores.get(symbol, 0) + 1
+        ranked = sorted(scores, key=lambda symbol: (-scores[symbol], symbol.end - symbol.start, symbol.path))
+        return ranked[:limit]
+
+    def snippet(self, symbol: Optional[Symbol] = None, path: Optional[str] = None, start: int = 1,
+                end: Optional[int] = None) -> CodeSnippet:
+        """Exact source of a symbol, or of a line range in path."""
+        if symbol is not None:
+            path, start, end = symbol.path, symbol.start, symbol.end
+        lines = self._file_lines(path)
+        end = min(end or len(lines), len(lines))
+        return CodeSnippet(
+            file_path=path,
+            function_name=symbol.qualname if symbol else '',
+            start_line_number=start,
+            end_line_numebr=end,
+            source_code=''.join(lines[start - 1:end]),
+        )
+
+    def _innermost(self, path: str, line: int, name: Optional[str] = None) -> Optional[Symbol]:
+        symbols = self._by_path.get(path, [])
+        position = bisect.bisect_right(self._starts_by_path.get(path, []), line)
+        best = None
+        for symbol in symbols[:position]:
+            if symbol.start <= line <= symbol.end and (name is None or symbol.name == name):
+                if best is None or symbol.start >= best.start:
+                    best = symbol
+        return best
+
+    def sources(self) -> dict[str, str]:
+        """Contents of every indexed file by path, e.g. to snapshot the indexed code."""
+        with self._lock:
+            return {path: ''.join(self._file_lines(path)) for path in sorted(self._files)}
+
+    def _resolve_paths(self, path: str) -> list[str]:
+        path = path.replace(os.sep, '/').removeprefix('./')
+        if path in self._by_path or path in self._files:
+            return [path]
+        return [candidate for candidate in self._paths_by_basename.get(os.path.basename(path), [])
+                if candidate.endswith(path) or path.endswith(f"/{candidate}")]
+
+    def _file_lines(self, path: str) -> list[str]:
+        lines = self._lines.get(path)
+        if lines is None:
+            with open(os.path.join(self.root, path), 'r', encoding='utf-8', errors='replace') as file:
+                lines = self._lines[path] = file.readlines()
+        return lines
+
+    def _index_file(self, path: str, blob: str) -> dict:
+        try:
+            with open(os.path.join(self.root, path), 'r', encoding='utf-8', errors='replace') as file:
+                symbols = _parse_symbols(path, file.read())
+        except (SyntaxError, ValueError) as e:
+            logger.warning(f"Skipping unparsable file {path}: {e}")
+            symbols = []
+        return {'blob': blob, 'symbols': symbols}
+
+    def _build_tables(self) -> None:
+        self._by_name, self._by_path, self._starts_by_path = {}, {}, {}
+        self._paths_by_basename, self._postings = {}, {}
+        for path, entry in self._files.items():
+            self._paths_by_basename.setdefault(os.path.basename(path), []).append(path)
+            symbols = []
+            for qualname, kind, start, end, tokens in entry['symbols']:
+                symbol = Symbol(qualname, kind, path, start, end)
+                symbols.append(symbol)
+                self._by_name.setdefault(symbol.name, []).append(symbol)
+                if symbol.qualname != symbol.name:
+                    self._by_name.setdefault(symbol.qualname, []).append(symbol)
+                for token in tokens:
+                    self._postings.setdefault(token, set()).add(symbol)
+            self._by_path[path] = sorted(symbols, key=lambda symbol: (symbol.start, -symbol.end))
+            self._starts_by_path[path] = [symbol.start for symbol in self._by_path[path]]
+
+    def _current_blobs(self) -> dict[str, str]:
+        """Blob hash of every Python file in the checkout, hashing working-tree contents of modified and new files."""
+        listing = self._git('ls-files', '-s', '-z', '--', '*.py', check=False)
+        if listing is None:
+            blobs = {}
+            for directory, _, names in os.walk(self.root):
+                for name in names:
+                    if name.endswith('.py'):
+                        full = os.path.join(directory, name)
+                        with open(full, 'rb') as file:
+                            blobs[os.path.relpath(full, self.root)] = git_blob_hash(file.read())
+            return blobs
+
+        blobs = {}
+        for record in filter(None, listing.split('\0')):
+            meta, path = record.split('\t', 1)
+            blobs[path] = meta.split()[1]
+        modified = self._git('ls-files', '-m', '-z', '--', '*.py', check=False) or ''
+        untracked = self._git('ls-files', '-o', '--exclude-standard', '-z', '--', '*.py', check=False) or ''
+        for path in filter(None, (modified + '\0' + untracked).split('\0')):
+            full = os.path.join(self.root, path)
+            if os.path.exists(full):
+                with open(full, 'rb') as file:
+                    blobs[path] = git_blob_hash(file.read())
+            else:
+                blobs.pop(path, None)
+        return blobs
+
+    def _sync_checkout(self) -> None:
+        if not GITHUB_SLUG_PATTERN.match(self.repo):
+            return
+        if os.path.isdir(os.path.join(self.root, '.git')):
+            self._git('pull', '--ff-only', '--quiet')
+        else:
+            os.makedirs(os.path.dirname(self.root), exist_ok=True)
+            logger.info(f"Cloning {self.repo} into {self.root}")
+            subprocess.run(['git', 'clone', '--quiet', '--depth', '1', f"https://github.com/{self.repo}.git",
+                            self.root], check=True, capture_output=True)
+
+    def _git(self, *args: str, check: bool = True) -> Optional[str]:
+        try:
+            result = subprocess.run(['git', '-C', self.root, *args], check=True, capture_output=True, text=True)
+            return result.stdout.strip('\n')
+        except (subprocess.CalledProcessError, FileNotFoundError):
+            if check:
+                raise
+            return None
+
+    def _load(self) -> None:
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as file:
+                stored = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable code index {self.index_path}: {e}")
+            return
+        if stored.get('version') != INDEX_FORMAT_VERSION:
+            return
+        self.commit = stored['commit']
+        self._files = stored['files']
+        self._build_tables()
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        temporary = f"{self.index_path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump({'version': INDEX_FORMAT_VERSION, 'repo': self.repo, 'commit': self.commit,
+                       'files': self._files}, file)
+        os.replace(temporary, self.index_path)
+
+
+
+def _local_checkout(repo: str, local_roots: Iterable[str]) -> Optional[str]:
+    """
+    Resolved path of a local checkout to index, None for a GitHub slug.
+
+    Raises:
+        ValueError: If repo is neither a GitHub owner/name slug nor a directory under one of local_roots
+    """
+    if GITHUB_SLUG_PATTERN.match(repo):
+        return None
+    path = os.path.realpath(repo)
+    for root in map(os.path.realpath, local_roots):
+        if os.path.commonpath([path, root]) == root and os.path.isdir(path):
+            return path
+    raise ValueError(f"Unknown repo {repo!r}: expected a GitHub owner/name slug or a checkout under "
+                     f"CODE_INDEX_LOCAL_ROOTS")
+
+
+def _repo_key(repo: str) -> str:
+    if GITHUB_SLUG_PATTERN.match(repo):
+        return repo.replace('/', '__')
+    return hashlib.sha256(repo.encode('utf-8')).hexdigest()[:16]
+
+
+_indexes: dict[str, CodeIndex] = {}
+_indexes_lock = threading.Lock()
+_code_index_override: ContextVar[Optional[Callable[[str], CodeIndex]]] = ContextVar('code_index_override',
+                                                                                     default=None)
+
+
+@contextmanager
+def use_code_indexes(resolve: Callable[[str], CodeIndex]) -> Iterator[None]:
+    """
+    Make every get_code_index call in the block, including in tasks and tools started in it, return resolve(repo).
+
+    Used to record the indexed code and to replay it from a snapshot, see replay.
+    """
+    token = _code_index_override.set(resolve)
+    try:
+        yield
+    finally:
+        _code_index_override.reset(token)
+
+
+def get_code_index(repo: str) -> CodeIndex:
+    """
+    Return the index of a repository, given as a GitHub 'owner/name' slug or a checkout under CODE_INDEX_LOCAL_ROOTS.
+
+    The shared index, see shared_code_index, unless a use_code_indexes block resolves it.
+
+    Raises:
+        ValueError: If repo is neither a slug nor a checkout under an allowed root
+    """
+    resolve = _code_index_override.get()
+    return resolve(repo) if resolve is not None else shared_code_index(repo)
+
+
+def shared_code_index(repo: str) -> CodeIndex:
+    """
+    Return the process-wide index of a repository.
+
+    The first call clones (for slugs) and indexes the repository, later calls refresh it
+    incrementally at most every CODE_INDEX_REFRESH_SECONDS.
+
+    Raises:
+        ValueError: If repo is neither a slug nor a checkout under an allowed root
+    """
+    with _indexes_lock:
+        index = _indexes.get(repo)
+        if index is None:
+            index = _indexes[repo] = CodeIndex(repo)
+    if time.time() - index.refreshed_at > CODE_INDEX_REFRESH_SECONDS:
+        index.refresh(fetch=index.refreshed_at > 0)
+    return index
+
+
+def join_log_sources(repo: str, sites: Iterable[_HasLogSite]) -> LogSourceJoin:
+    """
+    Join log lines or log sites with the source of the functions that emitted them.
+
+    Args:
+        repo: Github repo as owner/name
+        sites: LogItems or LogSites, only their filename, funcName and lineno are used
+
+    Returns:
+        LogSourceJoin: Every distinct site in input order, each emitting function's source included once
+    """
+    index = get_code_index(repo)
+    keys = list(dict.fromkeys((site.filename, site.funcName, site.lineno) for site in sites))
+    resolved = index.resolve_log_sites(keys)
+    snippet_indices: dict[Symbol, int] = {}
+    snippets, joined = [], []
+    for filename, func_name, lineno in keys:
+        symbol = resolved[(filename, func_name, lineno)]
+        if symbol is not None and symbol not in snippet_indices:
+            snippet_indices[symbol] = len(snippets)
+            snippets.append(index.snippet(symbol=symbol))
+        joined.append(ResolvedLogSite(
+            filename=filename, funcName=func_name, lineno=lineno,
+            snippet_index=snippet_indices.get(symbol) if symbol is not None else None,
+        ))
+    logger.info(f"Joined {len(keys)} log sites with {len(snippets)} functions of {repo}")
+    return LogSourceJoin(repo=repo, commit=index.commit, snippets=snippets, sites=joined)
@@ -2,32 +2,131 @@ from anthropic import Anthropic
 from dotenv import load_dotenv
 from langchain.chat_models import init_chat_model
 from langchain_anthropic import ChatAnthropic
-from langchain_core.messages import HumanMessage
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages.utils import count_tokens_approximately
 from langchain_core.tools import StructuredTool
 from langgraph.graph.state import CompiledStateGraph
 from langgraph.prebuilt import create_react_agent
 from langchain_mcp_adapters.client import MultiServerMCPClient
 import asyncio
+from typing import Optional
 from langchain_mcp_adapters.tools import load_mcp_tools
 from langsmith.wrappers import wrap_anthropic
 from pydantic import BaseModel, Field
 from langsmith import traceable
-from consts import CLAUDE_SONNET_4_LATEST
+from langchain_core.tools import tool
+from CodebaseAgent.code_index import get_code_index
+from CodebaseAgent.mcp_session import MCPSessionManager, get_mcp_manager
+from CodebaseAgent.schema import CodeSnippet
+from consts import CLAUDE_SONNET_4_LATEST, DEEPWIKI_MCP_SSE_ENDPOINT, CODE_INDEX_SEARCH_LIMIT
+from context_budget import ContextBudget, recall_context
+from instrumentation import span
+from ledger import current_ledger
+from models import chat_model
 
 
-async def get_deepwiki_tools()->[StructuredTool]:
-    client = MultiServerMCPClient({
-        "deepwiki": {
-            "url": "https://mcp.deepwiki.com/sse",
-            "transport": "sse"
-        }
-    })
-    tools = await client.get_tools()
-    return tools
+async def get_deepwiki_tools(mcp_manager: Optional[MCPSessionManager] = None)->[StructuredTool]:
+    """
+    Deepwiki tools served over the process-wide MCP session, or over mcp_manager when given.
+
+    Returns immediately from the on-disk tool cache when one exists, the session connects in the background.
+    """
+    with span("deepwiki.get_tools", "mcp"):
+        return await (mcp_manager or get_mcp_manager(DEEPWIKI_MCP_SSE_ENDPOINT)).get_tools()
+
+def _record_snippets(snippets: list[Optional[CodeSnippet]]) -> None:
+    ledger = current_ledger()
+    if ledger is not None:
+        ledger.record_code(snippet.source_code for snippet in snippets if snippet is not None)
+
+@tool
+def get_symbol_source(repo: str, symbol: str) -> list[CodeSnippet]:
+    """
+    Exact source of every function, method or class with the given name, from a local index of the repo.
+
+    Args:
+        repo (str): Github repo as owner/name
+        symbol (str): Function or class name, optionally qualified e.g. QueueProcessor.process
+
+    Returns:
+        list[CodeSnippet]: One snippet per definition with its file and exact line span
+    """
+    index = get_code_index(repo)
+    snippets = [index.snippet(symbol=match) for match in index.find_symbol(symbol)]
+    _record_snippets(snippets)
+    return snippets
+
+@tool
+def get_source_at_line(repo: str, file_path: str, line_number: int) -> Optional[CodeSnippet]:
+    """
+    Exact source of the innermost function or class enclosing a line, from a local index of the repo.
+
+    Args:
+        repo (str): Github repo as owner/name
+        file_path (str): Path of the file in the repo, a bare file name works when it is unique
+        line_number (int): 1-based line number
+
+    Returns:
+        Optional[CodeSnippet]: The enclosing definition, None if the line is at module level or the file is unknown
+    """
+    index = get_code_index(repo)
+    symbol = index.symbol_at(file_path, line_number)
+    snippet = index.snippet(symbol=symbol) if symbol else None
+    _record_snippets([snippet])
+    return snippet
+
+@tool
+def get_log_site_source(repo: str, filename: str, func_name: str, lineno: int) -> Optional[CodeSnippet]:
+    """
+    Exact source of the function that emitted a log line, from the filename, funcName and lineno fields of the log.
+
+    Args:
+        repo (str): Github repo as owner/name
+        filename (str): filename field of the log line
+        func_name (str): funcName field of the log line
+        lineno (int): lineno field of the log line
+
+    Returns:
+        Optional[CodeSnippet]: The emitting function, None if it is not found in the repo
+    """
+    index = get_code_index(repo)
+    symbol = index.resolve_log_site(filename, func_name, lineno)
+    snippet = index.snippet(symbol=symbol) if symbol else None
+    _record_snippets([snippet])
+    return snippet
+
+@tool
+def search_code(repo: str, query: str) -> list[CodeSnippet]:
+    """
+    Find functions and classes whose names, identifiers or string literals match the words of the query.
+
+    Use it to locate code by the text of a log message or by a concept when the exact name is unknown.
+
+    Args:
+        repo (str): Github repo as owner/name
+        query (str): Words to look for, e.g. part of a log message
+
+    Returns:
+        list[CodeSnippet]: Best matching definitions, most query words first
+    """
+    index = get_code_index(repo)
+    snippets = [index.snippet(symbol=match) for match in index.search(query, CODE_INDEX_SEARCH_LIMIT)]
+    _record_snippets(snippets)
+    return snippets
 
 @traceable
-async def codebase_agent() -> CompiledStateGraph:
-    tools: [StructuredTool] = await get_deepwiki_tools()
+async def codebase_agent(model: Optional[BaseChatModel] = None,
+                         mcp_manager: Optional[MCPSessionManager] = None) -> CompiledStateGraph:
+    """
+    Agent extracting source code from the local code index and deepwiki.
+
+    Args:
+        model: Chat model driving the agent, the shared chat_model() by default
+        mcp_manager: Session serving the deepwiki tools, the process-wide one by default
+    """
+    code_index_tools = [get_symbol_source, get_source_at_line, get_log_site_source, search_code, recall_context]
+    tools: [StructuredTool] = code_index_tools + await get_deepwiki_tools(mcp_manager)
     class Output(BaseModel):
         source_code: str = Field(description="Actual Source code extraction related to the query")
         start_line_number: int = Field(description="Start Line number of the source-code extraction")
@@ -38,6 +137,8 @@ async def codebase_agent() -> CompiledStateGraph:
        You will be given a natural language codebase query and a github repo.
        You have to use the tools to ask the right questions to get the relevant codebase, the start and end line number and the function name if any. 
        We only care about the acutal source code so you will need to modify the user query if needed to focus on code extraction. 
+       Prefer get_log_site_source, get_source_at_line, get_symbol_source and search_code, they read a local index of the repo and return exact line numbers.
+       Only use the deepwiki tools when those do not find the code or the query is about documentation rather than source.
        Ensure to only get the source-code, the start and end line number and the function name.
       
        Use the following format:
@@ -56,9 +157,10 @@ async def codebase_agent() -> CompiledStateGraph:
     load_dotenv()
     agent = create_react_agent(
         # model="openai:gpt-4.1",
-        model=init_chat_model(f"anthropic:{CLAUDE_SONNET_4_LATEST}"),
+        model=model or chat_model(),
         tools=tools,
         prompt=template,
+        pre_model_hook=ContextBudget(reserved_tokens=count_tokens_approximately([SystemMessage(template)])),
         response_format= Output,
         name="codebase_agent"
     )
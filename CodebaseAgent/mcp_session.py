@@ -0,0 +1,233 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Optional
+
+from langchain_core.tools import StructuredTool, ToolException
+from mcp import ClientSession
+from mcp.client.sse import sse_client
+from mcp.types import TextContent
+
+from consts import CACHE_DIR, DEEPWIKI_MCP_SSE_ENDPOINT, MCP_RESULT_TTL_SECONDS, MCP_RESULT_MAX_ENTRIES, \
+    MCP_CONNECT_TIMEOUT_SECONDS, MCP_RECONNECT_MAX_BACKOFF_SECONDS
+from instrumentation import span
+
+logger = logging.getLogger(__name__)
+
+
+class MCPSessionManager:
+    """
+    Keeps one long-lived MCP session open in a background task and serves tool calls over it.
+
+    The session reconnects with exponential backoff when it drops or a call fails on the
+    transport. The tool list is persisted to disk and only re-listed when the server reports
+    a different name/version, so agents can be built from the cached list without waiting
+    for the server. Identical tool calls are memoized for result_ttl_seconds, keeping at most
+    result_max_entries results and evicting the least recently used one first.
+    """
+
+    def __init__(self, url: str = DEEPWIKI_MCP_SSE_ENDPOINT, cache_path: Optional[str] = None,
+                 result_ttl_seconds: float = MCP_RESULT_TTL_SECONDS,
+                 result_max_entries: int = MCP_RESULT_MAX_ENTRIES):
+        self.url = url
+        self.cache_path = cache_path or os.path.join(
+            CACHE_DIR, f"mcp_tools_{hashlib.sha256(url.encode('utf-8')).hexdigest()[:16]}.json"
+        )
+        self.result_ttl_seconds = result_ttl_seconds
+        self.result_max_entries = result_max_entries
+        self.stats = {"connects": 0, "calls": 0, "memo_hits": 0, "reconnects": 0}
+        self._session: Optional[ClientSession] = None
+        self._ready = asyncio.Event()
+        self._tools_ready = asyncio.Event()
+        self._reconnect = asyncio.Event()
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+        self._tool_specs: list[dict] = []
+        self._server_version: Optional[str] = None
+        self._results: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._load_tool_cache()
+
+    def start(self) -> None:
+        """Start the background connection task if it is not running, returns immediately."""
+        if self._task is None or self._task.done():
+            self._closing = False
+            self._task = asyncio.create_task(self._run(), name=f"mcp-session:{self.url}")
+
+    async def close(self) -> None:
+        """Close the session and stop reconnecting."""
+        self._closing = True
+        self._reconnect.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def get_tools(self) -> list[StructuredTool]:
+        """
+        LangChain tools for every tool the server exposes.
+
+        Served from the on-disk cache when one exists, otherwise waits for the first listing.
+
+        Returns:
+            list[StructuredTool]: Tools whose calls go through this manager's session
+        """
+        self.start()
+        if not self._tool_specs:
+            await asyncio.wait_for(self._tools_ready.wait(), MCP_CONNECT_TIMEOUT_SECONDS)
+        return [self._to_langchain_tool(spec) for spec in self._tool_specs]
+
+    async def call_tool(self, name: str, arguments: dict[str, Any]) -> str:
+        """
+        Call a tool over the shared session, memoizing identical calls.
+
+        Args:
+            name: Tool name
+            arguments: Tool arguments
+
+        Returns:
+            str: Text content of the tool result
+
+        Raises:
+            ToolException: If the tool reports an error
+        """
+        key = json.dumps([name, arguments], sort_keys=True)
+        with span(f"mcp.{name}", "mcp") as call_span:
+            cached = self._results.get(key)
+            if cached is not None and time.monotonic() - cached[0] <= self.result_ttl_seconds:
+                self._results.move_to_end(key)
+                self.stats["memo_hits"] += 1
+                call_span.count("cache_hits.mcp")
+                return cached[1]
+
+            self.start()
+            for attempt in range(2):
+                session = await self._wait_for_session()
+                try:
+                    result = await session.call_tool(name, arguments)
+                    break
+                except Exception as e:
+                    if attempt:
+                        raise
+                    logger.warning(f"MCP call {name} failed on the transport, reconnecting: {e}")
+                    self._drop_session()
+
+            self.stats["calls"] += 1
+            text = "\n".join(content.text for content in result.content if isinstance(content, TextContent))
+            call_span.count("bytes_fetched", len(text.encode('utf-8')))
+            if result.isError:
+                raise ToolException(text)
+            self._remember(key, text)
+            return text
+
+    def _remember(self, key: str, text: str) -> None:
+        """Memoize a result, dropping expired ones and the least recently used beyond result_max_entries."""
+        now = time.monotonic()
+        for expired in [key for key, (stored, _) in self._results.items() if now - stored > self.result_ttl_seconds]:
+            del self._results[expired]
+        self._results[key] = (now, text)
+        self._results.move_to_end(key)
+        while len(self._results) > self.result_max_entries:
+            self._results.popitem(last=False)
+
+    async def _wait_for_session(self) -> ClientSession:
+        await asyncio.wait_for(self._ready.wait(), MCP_CONNECT_TIMEOUT_SECONDS)
+        return self._session
+
+    def _drop_session(self) -> None:
+        self._ready.clear()
+        self._reconnect.set()
+
+    async def _run(self) -> None:
+        backoff = 0.5
+        while not self._closing:
+            try:
+                async with sse_client(self.url) as (read, write), ClientSession(read, write) as session:
+                    initialized = await session.initialize()
+                    self.stats["connects"] += 1
+                    server = f"{initialized.serverInfo.name}/{initialized.serverInfo.version}"
+                    logger.info(f"Connected to MCP server {server} at {self.url}")
+                    if server != self._server_version or not self._tool_specs:
+                        await self._refresh_tools(session, server)
+                    self._session = session
+                    self._reconnect.clear()
+                    self._ready.set()
+                    backoff = 0.5
+                    await self._reconnect.wait()
+            except Exception as e:
+                logger.warning(f"MCP session to {self.url} failed: {e}")
+            finally:
+                self._ready.clear()
+                self._session = None
+
+            if not self._closing:
+                self.stats["reconnects"] += 1
+                logger.info(f"Reconnecting to {self.url} in {backoff:.1f}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, MCP_RECONNECT_MAX_BACKOFF_SECONDS)
+
+    async def _refresh_tools(self, session: ClientSession, server: str) -> None:
+        specs, cursor = [], None
+        while True:
+            listed = await session.list_tools(cursor)
+            specs.extend(
+                {"name": tool.name, "description": tool.description or "", "input_schema": tool.inputSchema}
+                for tool in listed.tools
+            )
+            cursor = listed.nextCursor
+            if not cursor:
+                break
+        logger.info(f"Listed {len(specs)} tools from {server}")
+        self._tool_specs, self._server_version = specs, server
+        self._results.clear()
+        self._tools_ready.set()
+        if self.cache_path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+            with open(self.cache_path, 'w', encoding='utf-8') as file:
+                json.dump({"server": server, "tools": specs}, file)
+
+    def _load_tool_cache(self) -> None:
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as file:
+                cached = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable MCP tool cache {self.cache_path}: {e}")
+            return
+        self._tool_specs = cached["tools"]
+        self._server_version = cached["server"]
+        self._tools_ready.set()
+        logger.info(f"Loaded {len(self._tool_specs)} cached tools of {self._server_version}")
+
+    def _to_langchain_tool(self, spec: dict) -> StructuredTool:
+        async def call(**arguments: Any) -> str:
+            return await self.call_tool(spec["name"], arguments)
+
+        return StructuredTool(
+            name=spec["name"],
+            description=spec["description"],
+            args_schema=spec["input_schema"],
+            coroutine=call,
+        )
+
+
+# A session's streams and background task belong to the loop that opened them, so there are managers per loop
+_managers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, MCPSessionManager]]" = \
+    weakref.WeakKeyDictionary()
+_managers_lock = threading.Lock()
+
+
+def get_mcp_manager(url: str = DEEPWIKI_MCP_SSE_ENDPOINT) -> MCPSessionManager:
+    """Return the session manager for url shared by everything running on the current event loop."""
+    loop = asyncio.get_running_loop()
+    with _managers_lock:
+        managers = _managers.setdefault(loop, {})
+        manager = managers.get(url)
+        if manager is None:
+            manager = managers[url] = MCPSessionManager(url)
+        return manager
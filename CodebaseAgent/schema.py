@@ -0,0 +1,34 @@
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+
+class CodeSnippet(BaseModel):
+    """Exact source of a symbol extracted from a local checkout of a repository"""
+    file_path: str = Field(description="Path of the file relative to the repository root")
+    function_name: str = Field(description="Qualified name of the enclosing function or class, empty at module level")
+    start_line_number: int = Field(description="First line of the snippet, 1-based")
+    end_line_numebr: int = Field(description="Last line of the snippet, inclusive")
+    source_code: str = Field(description="Source code of the snippet")
+
+
+class LogSite(BaseModel):
+    """Code location a log line was emitted from, as carried by every LogItem"""
+    filename: str = Field(description="filename field of the log line")
+    funcName: str = Field(description="funcName field of the log line")
+    lineno: int = Field(description="lineno field of the log line")
+
+
+class ResolvedLogSite(LogSite):
+    snippet_index: Optional[int] = Field(
+        default=None,
+        description="Index into LogSourceJoin.snippets of the enclosing function, None if it was not found"
+    )
+
+
+class LogSourceJoin(BaseModel):
+    """Log sites joined with the source of the functions that emitted them, each function included once"""
+    repo: str = Field(description="Repository the sites were resolved against")
+    commit: Optional[str] = Field(default=None, description="Commit of the checkout that was indexed")
+    snippets: list[CodeSnippet] = Field(description="Source of every distinct emitting function")
+    sites: list[ResolvedLogSite] = Field(description="Every distinct log site, in input order")
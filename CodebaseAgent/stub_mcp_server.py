@@ -0,0 +1,58 @@
+"""
+Local stand-in for the deepwiki MCP server, exposing the same tools over SSE with canned answers.
+
+Run from the repository root:
+    python -m CodebaseAgent.stub_mcp_server --port 8765 --version 1.0.0
+"""
+import argparse
+import asyncio
+import logging
+
+from mcp.server.fastmcp import FastMCP
+
+logger = logging.getLogger(__name__)
+
+
+def build_stub_server(port: int, version: str = "stub", latency_seconds: float = 0.0) -> FastMCP:
+    """
+    Build a FastMCP server mimicking deepwiki's read_wiki_structure, read_wiki_contents and ask_question.
+
+    Args:
+        port: Port to serve SSE on, on 127.0.0.1
+        version: Server version reported on initialize, change it to invalidate client tool caches
+        latency_seconds: Artificial delay added to every tool call
+
+    Returns:
+        FastMCP: Server ready to run with transport="sse"
+    """
+    server = FastMCP("deepwiki-stub", host="127.0.0.1", port=port, log_level="WARNING")
+    server._mcp_server.version = version
+
+    @server.tool()
+    async def read_wiki_structure(repoName: str) -> str:
+        """Get a list of documentation topics for a GitHub repository"""
+        await asyncio.sleep(latency_seconds)
+        return f"Topics for {repoName}:\n- 1 Overview\n- 2 Queue processor\n- 3 WebSocket server"
+
+    @server.tool()
+    async def read_wiki_contents(repoName: str) -> str:
+        """View documentation about a GitHub repository"""
+        await asyncio.sleep(latency_seconds)
+        return f"# {repoName}\nThe queue processor drains market data messages and broadcasts them to clients."
+
+    @server.tool()
+    async def ask_question(repoName: str, question: str) -> str:
+        """Ask any question about a GitHub repository"""
+        await asyncio.sleep(latency_seconds)
+        return f"[{repoName}] {question}\n```python\ndef check_staleness(orderbook):\n    ...\n```"
+
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--version', default='stub')
+    parser.add_argument('--latency', type=float, default=0.0)
+    args = parser.parse_args()
+    build_stub_server(args.port, args.version, args.latency).run(transport="sse")
@@ -0,0 +1,46 @@
+import pytest
+
+from CodebaseAgent.code_index import CodeIndex, GITHUB_SLUG_PATTERN
+
+SOURCE = '''import logging
+
+logger = logging.getLogger(__name__)
+
+
+class QueueProcessor:
+    def process(self, message):
+        if message.stale:
+            logger.error("Orderbook stale")
+        return message
+'''
+
+
+@pytest.fixture
+def checkout(tmp_path):
+    repo = tmp_path / "checkouts" / "publisher"
+    repo.mkdir(parents=True)
+    (repo / "queue_processor.py").write_text(SOURCE)
+    return repo
+
+
+def test_checkout_under_an_allowed_root_is_indexed(checkout, tmp_path):
+    index = CodeIndex(str(checkout), index_dir=str(tmp_path / "index"), local_roots=[str(tmp_path / "checkouts")])
+    index.refresh()
+
+    symbol = index.resolve_log_site("queue_processor.py", "process", 9)
+
+    assert symbol.qualname == "QueueProcessor.process"
+    assert "Orderbook stale" in index.snippet(symbol=symbol).source_code
+
+
+@pytest.mark.parametrize("repo", ["/etc", "..", "../checkouts/publisher", "acme/..", "~/publisher"])
+def test_paths_outside_the_allowed_roots_are_rejected(repo, checkout, tmp_path):
+    with pytest.raises(ValueError):
+        CodeIndex(repo, index_dir=str(tmp_path / "index"), local_roots=[str(checkout)])
+
+
+def test_github_slugs_are_accepted_without_a_local_root(tmp_path):
+    index = CodeIndex("acme/marketdata-publisher", index_dir=str(tmp_path / "index"), local_roots=())
+
+    assert GITHUB_SLUG_PATTERN.match("acme/marketdata.publisher")
+    assert index.root == str(tmp_path / "index" / "repos" / "acme__marketdata-publisher")
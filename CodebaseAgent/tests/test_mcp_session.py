@@ -0,0 +1,94 @@
+import asyncio
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from CodebaseAgent.mcp_session import MCPSessionManager, get_mcp_manager
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_stub_server(port: int) -> subprocess.Popen:
+    process = subprocess.Popen([sys.executable, '-m', 'CodebaseAgent.stub_mcp_server', '--port', str(port)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"Stub MCP server did not start on port {port}")
+
+
+@pytest.fixture
+def stub_server():
+    processes = []
+
+    def start(port: int) -> subprocess.Popen:
+        processes.append(start_stub_server(port))
+        return processes[-1]
+
+    yield start
+    for process in processes:
+        process.kill()
+        process.wait()
+
+
+def test_session_reconnects_after_the_server_restarts(stub_server, tmp_path):
+    port = free_port()
+    server = stub_server(port)
+
+    async def run():
+        manager = MCPSessionManager(f"http://127.0.0.1:{port}/sse", cache_path=str(tmp_path / "tools.json"))
+        try:
+            first = await manager.call_tool("read_wiki_structure", {"repoName": "acme/before"})
+            server.kill()
+            server.wait()
+            stub_server(port)
+            second = await manager.call_tool("read_wiki_structure", {"repoName": "acme/after"})
+            return first, second, manager.stats
+        finally:
+            await manager.close()
+
+    first, second, stats = asyncio.run(run())
+
+    assert "acme/before" in first and "acme/after" in second
+    assert stats["reconnects"] >= 1
+    assert stats["connects"] == 2
+
+
+def test_memoized_results_expire_and_are_capped(tmp_path):
+    manager = MCPSessionManager("http://127.0.0.1:1/sse", cache_path=str(tmp_path / "tools.json"),
+                                result_ttl_seconds=60, result_max_entries=2)
+    key = '["ask_question", {"question": "%s", "repoName": "acme/app"}]'
+    manager._remember(key % "stale", "old")
+    manager._results[key % "stale"] = (time.monotonic() - 61, "old")
+    manager._remember(key % "a", "1")
+    manager._remember(key % "b", "2")
+    assert list(manager._results) == [key % "a", key % "b"]
+
+    hit = asyncio.run(manager.call_tool("ask_question", {"repoName": "acme/app", "question": "a"}))
+    manager._remember(key % "c", "3")
+
+    assert hit == "1"
+    assert list(manager._results) == [key % "a", key % "c"]
+
+
+def test_managers_are_shared_per_loop_only():
+    async def managers():
+        return get_mcp_manager("http://127.0.0.1:1/sse"), get_mcp_manager("http://127.0.0.1:1/sse")
+
+    first, same = asyncio.run(managers())
+    other, _ = asyncio.run(managers())
+
+    assert first is same
+    assert first is not other
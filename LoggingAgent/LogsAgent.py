@@ -1,8 +1,10 @@
-
+import asyncio
 import json
 import logging
 import os
-from typing import TypedDict, Optional, Dict, Any
+import time
+from functools import lru_cache
+from typing import Annotated, TypedDict, Optional, Dict, Any
 
 from anthropic import Anthropic
 from langchain.chat_models import init_chat_model
@@ -10,23 +12,45 @@ from langsmith import traceable
 from dotenv import load_dotenv
 from langchain.agents import AgentExecutor
 from langchain_anthropic import ChatAnthropic
+from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages.utils import count_tokens_approximately
 from langchain_core.prompts import PromptTemplate
-from langchain_core.tools import tool
+from langchain_core.runnables import Runnable
+from langchain_core.tools import StructuredTool, tool
 from langgraph.graph.state import CompiledStateGraph
 from langgraph.prebuilt import create_react_agent
 from langsmith.wrappers import wrap_anthropic
 from pydantic import BaseModel, Field
 from langchain import hub, __all__
+import httpx
 import requests
 
-from LoggingAgent.schema import LogQLOutput, LogItem, LogAgentOutput
-from consts import CLAUDE_SONNET_4_LATEST, LOGS_LOOKBACK_DAYS, LOGS_LIMIT_ON_EACH_FETCH, \
-    LOGS_FETCH_QUERY_ENDPOINT, CLAUDE_SONNET_3_5_LATEST
+from LoggingAgent.condense import condense_logs
+from LoggingAgent.metrics import detect_anomalies
+from LoggingAgent.loki_tail import get_live_window
+from LoggingAgent.schema import LogQLOutput, LogItem, LogAgentOutput, LogSummary, AnomalyReport, LiveLogs, TailStatus, \
+    LogQLMetricOutput, LogQLMetricResult
+from LoggingAgent.logql_cache import get_logql_cache
+from LoggingAgent.logql_metrics import afetch_matrix, fetch_matrix, metric_step_seconds, metric_window, with_step
+from LoggingAgent.log_decode import decode_log_items
+from LoggingAgent.loki_async import afetch_entries, get_async_client
+from LoggingAgent.loki_client import fetch_log_columns, iter_logs, get_session, NANOS_PER_SECOND
+from LoggingAgent.loki_result_cache import LokiResultCache, get_loki_result_cache
+from consts import CLAUDE_SONNET_4_LATEST, LOGS_LOOKBACK_DAYS, CLAUDE_SONNET_3_5_LATEST, LOGS_FETCH_SHARDS, \
+    LOGQL_CACHE_ENABLED, LOGS_MAX_LINES_PER_SUMMARY, ANOMALY_BUCKET_SECONDS, LOKI_TAIL_WINDOW_SECONDS, \
+    LOKI_TAIL_FIRST_LINES_TIMEOUT_SECONDS, LOKI_RESULT_CACHE_ENABLED, LOGS_FETCH_DEADLINE_SECONDS, \
+    LOGQL_LLM_DEADLINE_SECONDS, LOGS_PAGE_DEADLINE_SECONDS, LOGS_MAX_LINES_PER_TOOL_CALL, \
+    LOGS_MAX_LINES_PER_TOOL_CALL_LIMIT
 from datetime import datetime, timezone
 
 import os
 from schema import RootAgentState
+from context_budget import ContextBudget, recall_context
+from instrumentation import span
+from ledger import FetchLedger, current_ledger
+from models import chat_model, cached_system_message, chat_model_override
+from prompts import PromptRegistry
 from utils import read_file, pretty_print_message, pretty_print_messages
 
 # Configure logging
@@ -72,14 +96,88 @@ def datetime_to_unix_epoch(datetime_str: str) -> int:
         logger.error(f"Failed to parse datetime string '{datetime_str}': {e}")
         raise ValueError(f"Invalid datetime format '{datetime_str}'. Expected format: YYYY-MM-DD HH:MM:SS") from e
 
-@tool
-def get_logql_from_nl_query(query: str, user_application: str) -> LogQLOutput:
+LOGQL_PROMPTS = PromptRegistry(os.path.join(os.path.dirname(os.path.abspath(__file__)), "system_prompts"))
+LOGQL_PROMPTS.register("logql_guide", "logql_guide.md")
+LOGQL_PROMPTS.register("sample_logs_wiki", "sample_logs_wiki.md")
+LOGQL_PROMPTS.register("sp_logql_refresher", "sp_logql_refresher.md", ("knowledge_wiki", "sample_logs"))
+LOGQL_PROMPTS.register("sp_logql_metric", "sp_logql_metric.md", ("knowledge_wiki", "sample_logs"))
+LOGQL_PROMPTS.register("sp_logql_context", "sp_logql_context.md", ("utc_date_and_time", "user_application"))
+
+
+def logql_static_prompt(prompt: str = "sp_logql_refresher") -> str:
+    """
+    LogQL system prompt without the per-call request context, rendered once and reused.
+
+    Args:
+        prompt (str): sp_logql_refresher for log queries, sp_logql_metric for metric queries
+
+    Returns:
+        str: Prompt with the LogQL guide and sample logs embedded
+    """
+    return LOGQL_PROMPTS.render(prompt, knowledge_wiki="logql_guide", sample_logs="sample_logs_wiki")
+
+
+def logql_llm(schema: type[LogQLOutput] = LogQLOutput) -> Runnable:
+    """
+    Structured-output model used for LogQL generation, created on first use and shared by every call.
+
+    Args:
+        schema: LogQLOutput or LogQLMetricOutput
+
+    Returns:
+        Runnable: ChatAnthropic wrapped to return schema, or the model set by use_chat_model
+    """
+    override = chat_model_override()
+    if override is not None:
+        return override.with_structured_output(schema)
+    return _anthropic_logql_llm(schema)
+
+
+@lru_cache(maxsize=2)
+def _anthropic_logql_llm(schema: type[LogQLOutput]) -> Runnable:
+    llm = ChatAnthropic(
+        model_name=CLAUDE_SONNET_4_LATEST,
+        temperature=0.1,
+        timeout=60,
+        stop=None
+    )
+    return llm.with_structured_output(schema)
+
+
+def resolve_time_window(from_time: Optional[str], to_time: Optional[str]) -> tuple[int, int]:
+    """
+    Resolve optional from/to timestamps into a query window in Unix nanoseconds.
+
+    Falls back to the last LOGS_LOOKBACK_DAYS days when either bound is missing or invalid.
+
+    Args:
+        from_time (Optional[str]): Start time in format YYYY-MM-DD HH:MM:SS
+        to_time (Optional[str]): End time in format YYYY-MM-DD HH:MM:SS
+
+    Returns:
+        tuple[int, int]: (start, end) in Unix nanoseconds
+    """
+    if from_time and to_time:
+        try:
+            start_ns = datetime_to_unix_epoch(from_time) * NANOS_PER_SECOND
+            end_ns = datetime_to_unix_epoch(to_time) * NANOS_PER_SECOND
+            logger.debug(f"Using time range: {from_time} to {to_time}")
+            return start_ns, end_ns
+        except ValueError as e:
+            logger.warning(f"Invalid time format, using default lookback: {e}")
+
+    end_ns = time.time_ns()
+    start_ns = end_ns - LOGS_LOOKBACK_DAYS * 24 * 3600 * NANOS_PER_SECOND
+    return start_ns, end_ns
+
+def _get_logql_from_nl_query(query: str, user_application: str, bypass_cache: bool = False) -> LogQLOutput:
     """
     Convert natural language query to LogQL query for Grafana execution.
 
     Args:
         query (str): Natural language query describing log search requirements
         user_application (str): Target application name for log filtering
+        bypass_cache (bool): Set to True to force a fresh translation instead of reusing an earlier one
 
     Returns:
         LogQLOutput: Structured output containing LogQL query and optional time filters
@@ -98,54 +196,144 @@ def get_logql_from_nl_query(query: str, user_application: str) -> LogQLOutput:
     Raises:
         Exception: If system prompt files cannot be read or LLM invocation fails
     """
-    try:
-        # Load system prompts and resources
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        wiki = read_file(os.path.join(current_dir, "system_prompts/logql_guide.md"))
-        system_prompt = read_file(os.path.join(current_dir, "system_prompts/sp_logql_refresher.md"))
-        sample_logs = read_file(os.path.join(current_dir, "system_prompts/sample_logs_wiki.md"))
+    return _LogQLRequest(query, user_application, bypass_cache).run()
 
-        # Get current UTC time for reference
-        utc_date_time = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-        logger.info(f"Processing LogQL query generation at UTC: {utc_date_time}")
 
-    except Exception as e:
-        logger.error(f"Failed to load system prompt files: {e}")
-        raise Exception(f"Failed to initialize LogQL query generation: {e}") from e
-
-    system_prompt = system_prompt.format(
-        knowledge_wiki=wiki,
-        utc_date_and_time=utc_date_time,
-        user_application=user_application,
-        sample_logs=sample_logs
-    )
+async def _aget_logql_from_nl_query(query: str, user_application: str, bypass_cache: bool = False) -> LogQLOutput:
+    request = await asyncio.to_thread(_LogQLRequest, query, user_application, bypass_cache)
+    return await request.arun()
 
-    try:
-        llm = ChatAnthropic(
-            model_name=CLAUDE_SONNET_4_LATEST,
-            temperature=0.1,
-            timeout=60,
-            stop=None
-        )
 
-        llm_with_output = llm.with_structured_output(LogQLOutput)
+# Runs natively on the event loop when the agent is awaited, on an executor thread when it is invoked
+get_logql_from_nl_query = StructuredTool.from_function(
+    func=_get_logql_from_nl_query, coroutine=_aget_logql_from_nl_query, name="get_logql_from_nl_query"
+)
+
+
+def _get_logql_metric_from_nl_query(query: str, user_application: str,
+                                    bypass_cache: bool = False) -> LogQLMetricOutput:
+    """
+    Convert a natural language question about how often, how fast or how high something got in the logs
+    into a LogQL metric query, to run with get_log_metrics.
+
+    Args:
+        query (str): Natural language question, e.g. "how often did staleness go critical in the last day"
+        user_application (str): Target application name for log filtering
+        bypass_cache (bool): Set to True to force a fresh translation instead of reusing an earlier one
+
+    Returns:
+        LogQLMetricOutput: Metric query with [$__interval] as its range, optional time filters and step
+
+    Examples:
+        -   get_logql_metric_from_nl_query("How often did staleness go critical?", "marketdata-publisher")
+            returns:
+            LogQLMetricOutput(logql_query='sum(count_over_time({application="marketdata-publisher"} '
+                                          '|~ "(?i)staleness critical" [$__interval]))',
+                              from_time='', to_time='', step_seconds=None)
+
+    Raises:
+        Exception: If system prompt files cannot be read or LLM invocation fails
+    """
+    return _LogQLRequest(query, user_application, bypass_cache, "sp_logql_metric", LogQLMetricOutput).run()
+
+
+async def _aget_logql_metric_from_nl_query(query: str, user_application: str,
+                                           bypass_cache: bool = False) -> LogQLMetricOutput:
+    request = await asyncio.to_thread(_LogQLRequest, query, user_application, bypass_cache, "sp_logql_metric",
+                                      LogQLMetricOutput)
+    return await request.arun()
+
+
+get_logql_metric_from_nl_query = StructuredTool.from_function(
+    func=_get_logql_metric_from_nl_query, coroutine=_aget_logql_metric_from_nl_query,
+    name="get_logql_metric_from_nl_query"
+)
+
 
-        messages = [
-            SystemMessage(content=system_prompt),
+class _LogQLRequest:
+    """
+    Prompt, cache lookup and model call of one LogQL translation, shared by the sync and async tools.
+
+    Building one reads the prompt files and the cache's disk tier, so async callers build it on a worker thread.
+    """
+
+    def __init__(self, query: str, user_application: str, bypass_cache: bool, prompt: str = "sp_logql_refresher",
+                 schema: type[LogQLOutput] = LogQLOutput):
+        self.query = query
+        self.schema = schema
+        # Get current UTC time for reference
+        utc_date_time = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        logger.info(f"Processing LogQL query generation at UTC: {utc_date_time}")
+
+        try:
+            with span("logql.prompt", "prompt"):
+                static_prompt = logql_static_prompt(prompt)
+                request_context = LOGQL_PROMPTS.get("sp_logql_context").text.format(
+                    utc_date_and_time=utc_date_time,
+                    user_application=user_application
+                )
+        except Exception as e:
+            logger.error(f"Failed to load system prompt files: {e}")
+            raise Exception(f"Failed to initialize LogQL query generation: {e}") from e
+        self.messages = [
+            cached_system_message(static_prompt, request_context),
             HumanMessage(content=query)
         ]
 
-        logger.debug(f"Sending query to LLM: {query}")
-        result = llm_with_output.invoke(messages)
+        # Answers of a replayed or fake model must neither be served from nor stored in the shared cache
+        self.cache = get_logql_cache() if LOGQL_CACHE_ENABLED and chat_model_override() is None else None
+        self.cached = None
+        if self.cache is not None:
+            # The prompt used comes first, so log and metric translations of one question are kept apart
+            self.cache_key = self.cache.make_key(query, user_application,
+                                                 LOGQL_PROMPTS.digest(prompt, *LOGQL_PROMPTS.templates))
+            self.cached = self.cache.get(self.cache_key, bypass=bypass_cache, schema=schema)
+            if self.cached is not None:
+                logger.info(f"Using cached LogQL query: {self.cached} (cache stats: {self.cache.stats})")
+
+    def run(self) -> LogQLOutput:
+        if self.cached is not None:
+            return self.cached
+        try:
+            logger.debug(f"Sending query to LLM: {self.query}")
+            return self.store(logql_llm(self.schema).invoke(self.messages))
+        except Exception as e:
+            logger.error(f"Failed to generate LogQL query: {e}")
+            raise Exception(f"LogQL query generation failed: {e}") from e
+
+    async def arun(self) -> LogQLOutput:
+        if self.cached is not None:
+            return self.cached
+        try:
+            logger.debug(f"Sending query to LLM: {self.query}")
+            result = await asyncio.wait_for(logql_llm(self.schema).ainvoke(self.messages),
+                                            LOGQL_LLM_DEADLINE_SECONDS)
+            return await asyncio.to_thread(self.store, result)
+        except asyncio.TimeoutError as e:
+            logger.error(f"LogQL query generation timed out after {LOGQL_LLM_DEADLINE_SECONDS}s")
+            raise Exception(f"LogQL query generation timed out after {LOGQL_LLM_DEADLINE_SECONDS}s") from e
+        except Exception as e:
+            logger.error(f"Failed to generate LogQL query: {e}")
+            raise Exception(f"LogQL query generation failed: {e}") from e
+
+    def store(self, result: LogQLOutput) -> LogQLOutput:
         logger.info(f"Generated LogQL query: {result}")
+        if self.cache is not None and self.cache.cacheable(self.query, result):
+            self.cache.put(self.cache_key, result)
         return result
 
-    except Exception as e:
-        logger.error(f"Failed to generate LogQL query: {e}")
-        raise Exception(f"LogQL query generation failed: {e}") from e
+def result_cache() -> Optional[LokiResultCache]:
+    """Cache of fetched Loki lines shared by the log tools, None when disabled."""
+    return get_loki_result_cache() if LOKI_RESULT_CACHE_ENABLED else None
 
-@tool
-def get_logs(logql_query: str, from_time: Optional[str] = None, to_time: Optional[str] = None) -> list[LogItem]:
+# Lines a single tool call may put into the agent's context
+ToolMaxLines = Annotated[int, Field(gt=0, le=LOGS_MAX_LINES_PER_TOOL_CALL_LIMIT,
+                                    description="Maximum number of lines to return, newest first")]
+
+AnomalyBucketSeconds = Annotated[int, Field(gt=0, description="Width of the resampling buckets in seconds")]
+
+def fetch_logs(logql_query: str, from_time: Optional[str] = None, to_time: Optional[str] = None,
+               max_lines: int = LOGS_MAX_LINES_PER_TOOL_CALL) -> list[LogItem]:
     """
     Fetch logs from Grafana using LogQL query.
 
@@ -153,83 +341,25 @@ def get_logs(logql_query: str, from_time: Optional[str] = None, to_time: Optiona
         logql_query (str): LogQL query to execute
         from_time (Optional[str]): Start time in format YYYY-MM-DD HH:MM:SS
         to_time (Optional[str]): End time in format YYYY-MM-DD HH:MM:SS
+        max_lines (int): Maximum number of lines to return
 
     Returns:
-        dict: Dictionary containing logs - {"logs": [LogItem]}
+        list[LogItem]: Log entries, newest first, up to max_lines lines
 
     Raises:
         ValueError: If time format is invalid
         Exception: If API request fails
     """
-    endpoint = LOGS_FETCH_QUERY_ENDPOINT
     logger.info(f"Fetching logs with query: {logql_query} for from time: {from_time} to time: {to_time}")
-
-    # Validate and convert time parameters
-    start_time = None
-    end_time = None
-
-    if from_time and to_time:
-        try:
-            # Validate time format
-            datetime.strptime(from_time, '%Y-%m-%d %H:%M:%S')
-            datetime.strptime(to_time, '%Y-%m-%d %H:%M:%S')
-            # Convert to epoch
-            start_time = datetime_to_unix_epoch(from_time)
-            end_time = datetime_to_unix_epoch(to_time)
-            logger.debug(f"Using time range: {from_time} to {to_time}")
-        except ValueError as e:
-            logger.warning(f"Invalid time format, using default lookback: {e}")
-
-    # Build query parameters
-    query_params = {
-        "query": logql_query,
-        "limit": LOGS_LIMIT_ON_EACH_FETCH,
-    }
-
-    if start_time and end_time:
-        query_params["start"] = start_time
-        query_params["end"] = end_time
-    else:
-        query_params["since"] = f"{LOGS_LOOKBACK_DAYS}d"
-        query_params["direction"] = "backward"
-
-    # Get credentials with validation
-    username = os.getenv('GRAFANA_USERNAME')
-    password = os.getenv('GRAFANA_PWD')
-
-    logger.info(f"Quering with username - {username} and pwd - {password}")
-
-    if not username or not password:
-        logger.error("Missing Grafana credentials in environment variables")
-        raise ValueError("GRAFANA_USERNAME and GRAFANA_PWD environment variables are required")
+    start_ns, end_ns = resolve_time_window(from_time, to_time)
+    # Fail fast on missing credentials before any request is attempted
+    get_session()
 
     # Execute query
     try:
-        logger.debug(f"Executing query with params: {query_params}")
-        response = requests.get(
-            endpoint,
-            params=query_params,
-            auth=(username, password),
-            timeout=30
-        )
-        response.raise_for_status()
-        result = response.json()
-
-        # Process results
-        logs = []
-        if result.get('data', {}).get('result'):
-            result_data = result['data']['result']
-            for entry in result_data:
-                values = entry.get('values' ,[])
-                for value in values:
-                    log_str = value[-1]
-                    log_item = LogItem.model_validate_json(log_str)
-                    logs.append(log_item)
-            logger.info(f"Successfully retrieved {len(logs)} log entries")
-        elif 'error' in result:
-            logger.error(f"Grafana API error: {result['error']}")
-            raise Exception(f"Grafana API error: {result['error']}")
-
+        logs = list(iter_logs(logql_query, start_ns, end_ns, max_lines=max_lines, shards=LOGS_FETCH_SHARDS,
+                              cache=result_cache()))
+        logger.info(f"Successfully retrieved {len(logs)} log entries")
         return logs
 
     except requests.exceptions.Timeout:
@@ -245,14 +375,294 @@ def get_logs(logql_query: str, from_time: Optional[str] = None, to_time: Optiona
         logger.error(f"Unexpected error while fetching logs: {e}")
         raise Exception(f"Unexpected error occurred: {e}") from e
 
+async def afetch_logs(logql_query: str, from_time: Optional[str] = None, to_time: Optional[str] = None,
+                      max_lines: int = LOGS_MAX_LINES_PER_TOOL_CALL) -> list[LogItem]:
+    """
+    Async fetch_logs over the shared httpx pool, giving up after LOGS_FETCH_DEADLINE_SECONDS.
+
+    Cancelling the calling task stops every page in flight, see fetch_logs for the arguments.
+    """
+    logger.info(f"Fetching logs with query: {logql_query} for from time: {from_time} to time: {to_time}")
+    start_ns, end_ns = resolve_time_window(from_time, to_time)
+    # Fail fast on missing credentials before any request is attempted
+    get_async_client()
+
+    try:
+        async with asyncio.timeout(LOGS_FETCH_DEADLINE_SECONDS):
+            entries = await afetch_entries(logql_query, start_ns, end_ns, max_lines=max_lines,
+                                           shards=LOGS_FETCH_SHARDS, cache=result_cache())
+        logs, malformed = await asyncio.to_thread(decode_log_items, [line for _, line in entries])
+        if malformed:
+            logger.warning(f"Skipped {malformed} malformed log lines")
+        logger.info(f"Successfully retrieved {len(logs)} log entries")
+        return logs
+
+    except TimeoutError:
+        logger.error(f"Fetching logs took longer than {LOGS_FETCH_DEADLINE_SECONDS}s")
+        raise Exception(f"Fetching logs from Grafana took longer than {LOGS_FETCH_DEADLINE_SECONDS}s")
+    except httpx.TimeoutException:
+        logger.error("Request timeout while fetching logs")
+        raise Exception("Request timeout while fetching logs from Grafana")
+    except httpx.ConnectError:
+        logger.error("Connection error while fetching logs")
+        raise Exception("Failed to connect to Grafana API")
+    except httpx.HTTPError as e:
+        logger.error(f"Request failed: {e}")
+        raise Exception(f"Failed to fetch logs from Grafana: {e}") from e
+    except Exception as e:
+        logger.error(f"Unexpected error while fetching logs: {e}")
+        raise Exception(f"Unexpected error occurred: {e}") from e
+
+def _get_logs(logql_query: str, from_time: Optional[str] = None, to_time: Optional[str] = None,
+              max_lines: ToolMaxLines = LOGS_MAX_LINES_PER_TOOL_CALL) -> list[LogItem]:
+    """
+    Fetch logs from Grafana using LogQL query.
+
+    Args:
+        logql_query (str): LogQL query to execute
+        from_time (Optional[str]): Start time in format YYYY-MM-DD HH:MM:SS
+        to_time (Optional[str]): End time in format YYYY-MM-DD HH:MM:SS
+        max_lines (int): Maximum number of lines to return, narrow the query rather than raising it
+
+    Returns:
+        list[LogItem]: Log entries, newest first, up to max_lines lines
+
+    Raises:
+        Exception: If API request fails
+    """
+    return _record_fetched(fetch_logs(logql_query, from_time, to_time, max_lines))
+
+
+async def _aget_logs(logql_query: str, from_time: Optional[str] = None, to_time: Optional[str] = None,
+                     max_lines: ToolMaxLines = LOGS_MAX_LINES_PER_TOOL_CALL) -> list[LogItem]:
+    return _record_fetched(await afetch_logs(logql_query, from_time, to_time, max_lines))
+
+
+def _record_fetched(logs: list[LogItem]) -> list[LogItem]:
+    ledger = current_ledger()
+    if ledger is not None:
+        ledger.record_logs(logs)
+    return logs
+
+
+get_logs = StructuredTool.from_function(func=_get_logs, coroutine=_aget_logs, name="get_logs")
+
+
+def _get_logs_since_last_fetch(logql_query: str,
+                               max_lines: ToolMaxLines = LOGS_MAX_LINES_PER_TOOL_CALL) -> list[LogItem]:
+    """
+    Fetch only the logs newer than the newest log already fetched for this incident.
+
+    Use it for follow-up questions on an ongoing incident such as "what happened since", instead of
+    fetching the whole window again. Without earlier logs it fetches the default lookback window.
+
+    Args:
+        logql_query (str): LogQL query to execute
+        max_lines (int): Maximum number of lines to return
+
+    Returns:
+        list[LogItem]: Log entries not fetched before, newest first
+
+    Raises:
+        Exception: If API request fails
+    """
+    ledger = current_ledger()
+    logs = fetch_logs(logql_query, *_since_last_fetch(ledger), max_lines)
+    return ledger.record_logs(logs) if ledger is not None else logs
+
+
+async def _aget_logs_since_last_fetch(logql_query: str,
+                                      max_lines: ToolMaxLines = LOGS_MAX_LINES_PER_TOOL_CALL) -> list[LogItem]:
+    ledger = current_ledger()
+    logs = await afetch_logs(logql_query, *_since_last_fetch(ledger), max_lines)
+    return ledger.record_logs(logs) if ledger is not None else logs
+
+
+def _since_last_fetch(ledger: Optional[FetchLedger]) -> tuple[Optional[str], Optional[str]]:
+    since = ledger.last_log_time() if ledger is not None else None
+    if since is None:
+        return None, None
+    # asctime has second precision, lines of the last stored second are fetched again and dropped
+    return since, datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+get_logs_since_last_fetch = StructuredTool.from_function(
+    func=_get_logs_since_last_fetch, coroutine=_aget_logs_since_last_fetch, name="get_logs_since_last_fetch"
+)
+
+
+def _get_log_metrics(logql_query: str, from_time: Optional[str] = None, to_time: Optional[str] = None,
+                     step_seconds: Optional[int] = None) -> LogQLMetricResult:
+    """
+    Run a LogQL metric query in Loki and return the resulting series as a compact table.
+
+    Use it to count lines, or take rates, percentiles and maxima of numbers in them, e.g. "how often did
+    staleness go critical in the last day": Loki aggregates the lines and only one value per series and
+    step comes back, instead of the raw lines. Write the range of the query as [$__interval], it is
+    replaced by the step so every line is counted once.
+
+    Args:
+        logql_query (str): LogQL metric query, e.g. from get_logql_metric_from_nl_query
+        from_time (Optional[str]): Start time in format YYYY-MM-DD HH:MM:SS
+        to_time (Optional[str]): End time in format YYYY-MM-DD HH:MM:SS
+        step_seconds (Optional[int]): Resolution, made coarser if the window would hold more than
+            LOGQL_METRIC_MAX_POINTS steps
+
+    Returns:
+        LogQLMetricResult: Up to LOGQL_METRIC_MAX_SERIES series, highest peak first
+
+    Raises:
+        ValueError: If Loki rejects the query or it is not a metric query
+        Exception: If API request fails
+    """
+    logql_query, start_ns, end_ns, step = _metric_request(logql_query, from_time, to_time, step_seconds)
+    get_session()
+
+    try:
+        return fetch_matrix(logql_query, start_ns, end_ns, step).to_result(logql_query, step)
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Request failed: {e}")
+        raise Exception(f"Failed to fetch metrics from Grafana: {e}") from e
+
+
+async def _aget_log_metrics(logql_query: str, from_time: Optional[str] = None, to_time: Optional[str] = None,
+                            step_seconds: Optional[int] = None) -> LogQLMetricResult:
+    logql_query, start_ns, end_ns, step = _metric_request(logql_query, from_time, to_time, step_seconds)
+    get_async_client()
+
+    try:
+        return (await afetch_matrix(logql_query, start_ns, end_ns, step)).to_result(logql_query, step)
+    except TimeoutError:
+        logger.error(f"Metric query took longer than {LOGS_PAGE_DEADLINE_SECONDS}s")
+        raise Exception(f"Fetching metrics from Grafana took longer than {LOGS_PAGE_DEADLINE_SECONDS}s")
+    except httpx.HTTPError as e:
+        logger.error(f"Request failed: {e}")
+        raise Exception(f"Failed to fetch metrics from Grafana: {e}") from e
+
+
+def _metric_request(logql_query: str, from_time: Optional[str], to_time: Optional[str],
+                    step_seconds: Optional[int]) -> tuple[str, int, int, int]:
+    logger.info(f"Log metrics with query: {logql_query} for from time: {from_time} to time: {to_time}")
+    start_ns, end_ns = resolve_time_window(from_time, to_time)
+    step = metric_step_seconds(start_ns, end_ns, step_seconds)
+    return (with_step(logql_query, step), *metric_window(start_ns, end_ns, step), step)
+
+
+get_log_metrics = StructuredTool.from_function(func=_get_log_metrics, coroutine=_aget_log_metrics,
+                                               name="get_log_metrics")
+
+@tool
+def get_logs_summary(logql_query: str, from_time: Optional[str] = None, to_time: Optional[str] = None) -> LogSummary:
+    """
+    Fetch logs from Grafana using LogQL query and condense them into per-template statistics.
+
+    Prefer this over get_logs for broad queries: lines are grouped by message template (numbers and
+    ids masked) with counts, first/last timestamps, min/max/percentiles of the numbers and a few
+    exemplar lines, so the result stays small no matter how many lines match.
+
+    Args:
+        logql_query (str): LogQL query to execute
+        from_time (Optional[str]): Start time in format YYYY-MM-DD HH:MM:SS
+        to_time (Optional[str]): End time in format YYYY-MM-DD HH:MM:SS
+
+    Returns:
+        LogSummary: Bounded-size summary of up to LOGS_MAX_LINES_PER_SUMMARY lines
+
+    Raises:
+        Exception: If API request fails
+    """
+    logger.info(f"Summarizing logs with query: {logql_query} for from time: {from_time} to time: {to_time}")
+    start_ns, end_ns = resolve_time_window(from_time, to_time)
+    get_session()
+
+    try:
+        # Streams page by page so memory stays bounded by the number of templates, the result cache
+        # would hold every line of a piece before yielding it
+        return condense_logs(iter_logs(logql_query, start_ns, end_ns, max_lines=LOGS_MAX_LINES_PER_SUMMARY))
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Request failed: {e}")
+        raise Exception(f"Failed to fetch logs from Grafana: {e}") from e
+
+@tool
+def detect_log_anomalies(logql_query: str, from_time: Optional[str] = None, to_time: Optional[str] = None,
+                         bucket_seconds: AnomalyBucketSeconds = ANOMALY_BUCKET_SECONDS) -> AnomalyReport:
+    """
+    Fetch logs using LogQL query and find anomalous time windows in the metrics they carry.
+
+    Message rate (msg/sec), memory (MB), queue depth, processing time (ms) and orderbook staleness (ms)
+    are parsed out of the log messages, resampled to fixed buckets and checked for threshold breaches,
+    z-score outliers and sudden mean shifts. Use the returned windows to narrow follow-up log queries.
+
+    Args:
+        logql_query (str): LogQL query to execute, should match the status and alert lines carrying the metrics
+        from_time (Optional[str]): Start time in format YYYY-MM-DD HH:MM:SS
+        to_time (Optional[str]): End time in format YYYY-MM-DD HH:MM:SS
+        bucket_seconds (int): Width of the resampling buckets in seconds
+
+    Returns:
+        AnomalyReport: Per-metric statistics and anomalous windows, oldest first
+
+    Raises:
+        Exception: If API request fails
+    """
+    logger.info(f"Detecting anomalies with query: {logql_query} for from time: {from_time} to time: {to_time}")
+    start_ns, end_ns = resolve_time_window(from_time, to_time)
+    get_session()
+
+    try:
+        logs = fetch_log_columns(logql_query, start_ns, end_ns, max_lines=LOGS_MAX_LINES_PER_SUMMARY,
+                                 shards=LOGS_FETCH_SHARDS, cache=result_cache())
+        return detect_anomalies(logs, bucket_seconds)
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Request failed: {e}")
+        raise Exception(f"Failed to fetch logs from Grafana: {e}") from e
+
+@tool
+async def get_live_logs(logql_query: str, last_seconds: int = LOKI_TAIL_WINDOW_SECONDS) -> LiveLogs:
+    """
+    Follow a LogQL query live and return the most recent lines, for incidents that are still ongoing.
+
+    The first call starts a background tail that keeps receiving new lines, later calls with the same
+    query return the current sliding window right away without downloading the history again.
+
+    Args:
+        logql_query (str): LogQL query to follow
+        last_seconds (int): Only return lines logged in the last last_seconds seconds
+
+    Returns:
+        LiveLogs: Lines of the window, newest first, and the tail's drop accounting
+
+    Raises:
+        Exception: If Grafana credentials are missing
+    """
+    logger.info(f"Live logs with query: {logql_query} for the last {last_seconds}s")
+    get_session()
+    window = get_live_window(logql_query, lookback_seconds=last_seconds)
+    await window.wait_for_lines(LOKI_TAIL_FIRST_LINES_TIMEOUT_SECONDS)
+    logs = window.window(last_seconds)
+    ledger = current_ledger()
+    if ledger is not None:
+        ledger.record_logs(logs)
+    return LiveLogs(logs=logs, status=TailStatus(**window.status()))
+
 @traceable
-def logging_agent() -> CompiledStateGraph:
+def logging_agent(model: Optional[BaseChatModel] = None) -> CompiledStateGraph:
     """
     Main agent to handle log extraction and parsing logic.
+
+    Args:
+        model: Chat model driving the agent, the shared chat_model() by default
     """
     template = '''You are an expert log extractor. You will be given a natural language log query and an application name from the user.
     You have to extract the logs for the application given the tools you have access to. You can always assume that there are logs present, if 
     you're not getting logs then try to make the query a bit more inclusive to get more details.
+    Start with get_logs_summary to see which kinds of lines occur, how often and when, then use get_logs on a narrower
+    query or time window only if you need the raw lines. For questions about rates, memory, queue depth, processing
+    time or staleness use detect_log_anomalies to find when they went wrong. For follow-ups asking what happened
+    since the last look at an incident use get_logs_since_last_fetch, it only returns lines that were not fetched before.
+    For questions about how often, how many or how fast, e.g. how often staleness went critical in the last day, get a
+    metric query from get_logql_metric_from_nl_query and run it with get_log_metrics instead of counting raw lines.
+    For incidents that are still happening use get_live_logs, calling it again returns the latest lines cheaply.
 
     Use the following format:
 
@@ -269,11 +679,13 @@ def logging_agent() -> CompiledStateGraph:
     '''
     user_query = "Logs for issues regarding data being stale encountered by my application - marketdata-publisher?",
     agent = create_react_agent(
-        model=init_chat_model(f"anthropic:{CLAUDE_SONNET_4_LATEST}"),
+        model=model or chat_model(),
         # model="openai:gpt-4.1",
-        tools=[get_logql_from_nl_query, get_logs],
+        tools=[get_logql_from_nl_query, get_logql_metric_from_nl_query, get_logs_summary, get_log_metrics,
+               detect_log_anomalies, get_logs, get_logs_since_last_fetch, get_live_logs, recall_context],
         response_format=LogAgentOutput,
         prompt=template,
+        pre_model_hook=ContextBudget(reserved_tokens=count_tokens_approximately([SystemMessage(template)])),
         name="logs_agent"
     )
     return agent
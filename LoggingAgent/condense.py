@@ -0,0 +1,175 @@
+"""Condenses streams of log lines into bounded-size template summaries for the LLM context."""
+import logging
+import random
+import re
+from typing import Iterable, Optional
+
+from LoggingAgent.schema import LogItem, LogSummary, LogTemplateSummary, NumericFieldSummary
+from consts import LOGS_SUMMARY_MAX_TEMPLATES, LOGS_SUMMARY_EXEMPLARS, LOGS_SUMMARY_RESERVOIR_SIZE
+
+logger = logging.getLogger(__name__)
+
+ID_PATTERN = re.compile(
+    r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b'
+    r'|\b0x[0-9a-fA-F]+\b'
+    r'|\b(?=[0-9a-fA-F]*[a-fA-F])(?=[0-9a-fA-F]*\d)[0-9a-fA-F]{12,}\b'
+)
+NUMBER_PATTERN = re.compile(r'(?<![\w.])[-+]?\d+(?:\.\d+)?')
+WORD_PATTERN = re.compile(r'([A-Za-z_]+)[^A-Za-z_]*$')
+
+LEVEL_PRIORITY = {'ERROR': 0, 'WARNING': 1, 'INFO': 2}
+PERCENTILES = (50, 90, 99)
+
+
+def mask_message(message: str) -> tuple[str, list[str], list[float]]:
+    """
+    Turn a log message into a template by masking ids and numbers.
+
+    Args:
+        message: Raw log message
+
+    Returns:
+        tuple: (template, label of each masked number, value of each masked number)
+    """
+    message = ID_PATTERN.sub('<id>', message)
+    labels, values, parts = [], [], []
+    occurrences: dict[str, int] = {}
+    position = 0
+    for match in NUMBER_PATTERN.finditer(message):
+        parts.append(message[position:match.start()])
+        parts.append('<num>')
+        word = WORD_PATTERN.search(message[max(0, match.start() - 40):match.start()])
+        label = word.group(1) if word else 'value'
+        occurrences[label] = occurrences.get(label, 0) + 1
+        labels.append(label if occurrences[label] == 1 else f"{label}_{occurrences[label]}")
+        values.append(float(match.group()))
+        position = match.end()
+    parts.append(message[position:])
+    return ''.join(parts), labels, values
+
+
+class _NumericField:
+    """Exact min/max plus a fixed-size reservoir sample for percentiles."""
+
+    def __init__(self, label: str, rng: random.Random):
+        self.label = label
+        self.seen = 0
+        self.min = float('inf')
+        self.max = float('-inf')
+        self.sample: list[float] = []
+        self._rng = rng
+
+    def add(self, value: float) -> None:
+        self.seen += 1
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self.sample) < LOGS_SUMMARY_RESERVOIR_SIZE:
+            self.sample.append(value)
+        else:
+            slot = self._rng.randrange(self.seen)
+            if slot < LOGS_SUMMARY_RESERVOIR_SIZE:
+                self.sample[slot] = value
+
+    def summary(self) -> NumericFieldSummary:
+        ordered = sorted(self.sample)
+        percentiles = {
+            f"p{p}": ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] for p in PERCENTILES
+        }
+        return NumericFieldSummary(field=self.label, min=self.min, max=self.max, **percentiles)
+
+
+class _TemplateStats:
+    def __init__(self, template: str, item: LogItem, labels: list[str], rng: random.Random):
+        self.template = template
+        self.levelname = item.levelname
+        self.name = item.name
+        self.count = 0
+        self.first_seen = item.asctime
+        self.last_seen = item.asctime
+        self.fields = [_NumericField(label, rng) for label in labels]
+        self.exemplars: list[LogItem] = []
+
+    def add(self, item: LogItem, values: list[float]) -> None:
+        self.count += 1
+        # Loki may return lines newest or oldest first, asctime compares chronologically
+        self.first_seen = min(self.first_seen, item.asctime)
+        self.last_seen = max(self.last_seen, item.asctime)
+        for field, value in zip(self.fields, values):
+            field.add(value)
+        if len(self.exemplars) < LOGS_SUMMARY_EXEMPLARS:
+            self.exemplars.append(item)
+
+    def summary(self) -> LogTemplateSummary:
+        return LogTemplateSummary(
+            template=self.template,
+            levelname=self.levelname,
+            name=self.name,
+            count=self.count,
+            first_seen=self.first_seen,
+            last_seen=self.last_seen,
+            numbers=[field.summary() for field in self.fields if field.seen],
+            exemplars=self.exemplars,
+        )
+
+
+class LogCondenser:
+    """
+    Streaming condensation of log lines into per-template statistics.
+
+    Memory grows with the number of distinct templates, not with the number of lines:
+    every template keeps counters, exact min/max and a bounded reservoir per number, and
+    a handful of exemplar lines.
+    """
+
+    def __init__(self, seed: int = 0):
+        self.total_lines = 0
+        self._templates: dict[tuple[str, str, str], _TemplateStats] = {}
+        self._rng = random.Random(seed)
+
+    def add(self, item: LogItem) -> None:
+        """Account one log line."""
+        template, labels, values = mask_message(item.message)
+        key = (item.levelname, item.name, template)
+        stats = self._templates.get(key)
+        if stats is None:
+            stats = self._templates[key] = _TemplateStats(template, item, labels, self._rng)
+        stats.add(item, values)
+        self.total_lines += 1
+
+    def summary(self, max_templates: int = LOGS_SUMMARY_MAX_TEMPLATES) -> LogSummary:
+        """
+        Bounded summary of everything added so far.
+
+        Args:
+            max_templates: Maximum number of templates to include, errors and warnings are kept first
+
+        Returns:
+            LogSummary: Summary whose size does not depend on the number of lines
+        """
+        ranked = sorted(self._templates.values(), key=lambda t: (LEVEL_PRIORITY.get(t.levelname, 3), -t.count))
+        kept = ranked[:max_templates]
+        return LogSummary(
+            total_lines=self.total_lines,
+            template_count=len(ranked),
+            templates=[stats.summary() for stats in kept],
+            other_lines=sum(stats.count for stats in ranked[max_templates:]),
+        )
+
+
+def condense_logs(items: Iterable[LogItem], max_templates: Optional[int] = None) -> LogSummary:
+    """
+    Condense a stream of log lines, consuming it lazily.
+
+    Args:
+        items: Log lines, typically straight from the Loki fetch generator
+        max_templates: Maximum number of templates in the summary, defaults to LOGS_SUMMARY_MAX_TEMPLATES
+
+    Returns:
+        LogSummary: Bounded-size summary of the stream
+    """
+    condenser = LogCondenser()
+    for item in items:
+        condenser.add(item)
+    summary = condenser.summary(max_templates or LOGS_SUMMARY_MAX_TEMPLATES)
+    logger.info(f"Condensed {summary.total_lines} lines into {summary.template_count} templates")
+    return summary
@@ -0,0 +1,285 @@
+"""Local stand-ins for Loki's query_range and tail endpoints, used to exercise the fetch engine offline."""
+import asyncio
+import bisect
+import json
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+
+from websockets.asyncio.server import serve
+
+logger = logging.getLogger(__name__)
+
+QUERY_RANGE_PATH = '/loki/api/v1/query_range'
+TAIL_PATH = '/loki/api/v1/tail'
+
+# Message shapes taken from system_prompts/sample_logs_wiki.md
+SAMPLE_LOG_SHAPES = [
+    ("queue_processor", "INFO", "queue_processor.py", "log_status", 88,
+     "System status: Rate: {f1:.1f} msg/sec, Memory: {f2:.1f}MB, Queue: {i1}"),
+    ("queue_processor", "INFO", "queue_processor.py", "log_status", 95,
+     "Queue utilization: {i1}/10000 messages"),
+    ("queue_processor", "WARNING", "queue_processor.py", "check_memory", 132,
+     "Memory usage elevated: {f2:.1f}MB (threshold: 150MB), Queue backlog: {i1} messages (1.5% capacity)"),
+    ("queue_processor", "WARNING", "queue_processor.py", "process_message", 171,
+     "Processing latency elevated: {f3:.1f}ms"),
+    ("queue_processor", "ERROR", "queue_processor.py", "check_memory", 140,
+     "Memory usage critical: {f2:.1f}MB (threshold: 150MB), Queue: {i1}, Processing: {i2}ms"),
+    ("system_events", "WARNING", "main.py", "check_staleness", 180,
+     "Data staleness detected: orderbook {i3} aged {f4:.1f}ms"),
+    ("system_events", "ERROR", "main.py", "check_staleness", 184,
+     "Data staleness critical: orderbook {i3} aged {f4:.1f}ms"),
+    ("main", "INFO", "main.py", "websocket_endpoint", 212,
+     "Client connected. Total clients: {i4}"),
+    ("main", "ERROR", "main.py", "broadcast", 251,
+     "Error broadcasting to client: WebSocket connection closed"),
+]
+
+
+def synthetic_entries(count: int, end_ns: Optional[int] = None, step_ns: int = 250_000_000,
+                      seed: int = 7) -> list[tuple[int, str]]:
+    """
+    Generate log lines shaped like the marketdata-publisher samples, oldest first.
+
+    Args:
+        count (int): Number of entries to generate
+        end_ns (Optional[int]): Timestamp of the newest entry in Unix nanoseconds, defaults to now
+        step_ns (int): Spacing between consecutive entries in nanoseconds
+        seed (int): Seed for the random metric values
+
+    Returns:
+        list[tuple[int, str]]: (timestamp in ns, JSON log line) pairs
+    """
+    rng = random.Random(seed)
+    end_ns = end_ns if end_ns is not None else time.time_ns()
+    start_ns = end_ns - (count - 1) * step_ns
+    entries = []
+    for i in range(count):
+        ts = start_ns + i * step_ns
+        name, level, filename, func, lineno, template = rng.choice(SAMPLE_LOG_SHAPES)
+        message = template.format(
+            f1=rng.uniform(1, 12), f2=rng.uniform(30, 180), f3=rng.uniform(50, 300), f4=rng.uniform(500, 3000),
+            i1=rng.randint(0, 400), i2=rng.randint(40, 400), i3=rng.randint(40000, 50000), i4=rng.randint(0, 10),
+        )
+        asctime = datetime.fromtimestamp(ts // 1_000_000_000, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        line = json.dumps({
+            "asctime": asctime, "name": name, "levelname": level, "filename": filename,
+            "lineno": lineno, "funcName": func, "message": message,
+        })
+        entries.append((ts, line))
+    return entries
+
+
+def _to_ns(value: str) -> int:
+    """Loki accepts both Unix seconds and nanoseconds for start/end."""
+    if value.isdigit() and len(value) > 12:
+        return int(value)
+    return int(float(value) * 1_000_000_000)
+
+
+class FakeLoki:
+    """
+    In-memory Loki serving query_range over a fixed set of entries.
+
+    The LogQL text is not evaluated, every entry belongs to a single stream. Start is
+    inclusive and end exclusive, as in Loki. Requests with a step, i.e. metric queries, are
+    answered as count_over_time of all entries with the step as range. An artificial latency
+    can be added to every request to mimic a remote server.
+    """
+
+    def __init__(self, entries: list[tuple[int, str]], latency_seconds: float = 0.0,
+                 labels: Optional[dict] = None):
+        self.entries = sorted(entries)
+        self.latency_seconds = latency_seconds
+        self.labels = labels or {"application": "marketdata-publisher"}
+        self.request_count = 0
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{QUERY_RANGE_PATH}"
+
+    def query_range(self, params: dict) -> dict:
+        """Build a query_range response body for the given query parameters."""
+        end_ns = _to_ns(params['end']) if 'end' in params else time.time_ns()
+        start_ns = _to_ns(params['start']) if 'start' in params else end_ns - 3600 * 1_000_000_000
+        if 'step' in params:
+            return self.count_over_time(start_ns, end_ns, _to_ns(params['step']))
+        limit = int(params.get('limit', 100))
+        direction = params.get('direction', 'backward')
+
+        selected = [entry for entry in self.entries if start_ns <= entry[0] < end_ns]
+        if direction == 'backward':
+            selected = selected[::-1]
+        selected = selected[:limit]
+        values = [[str(ts), line] for ts, line in selected]
+        return {
+            "status": "success",
+            "data": {
+                "resultType": "streams",
+                "result": [{"stream": self.labels, "values": values}] if values else [],
+            },
+        }
+
+    def count_over_time(self, start_ns: int, end_ns: int, step_ns: int) -> dict:
+        """Matrix of the entries counted in (t - step, t] for every evaluation time t, zero counts left out."""
+        stamps = [ts for ts, _ in self.entries]
+        values = []
+        for t in range(start_ns, end_ns + 1, step_ns):
+            count = bisect.bisect_right(stamps, t) - bisect.bisect_right(stamps, t - step_ns)
+            if count:
+                values.append([t / 1_000_000_000, str(count)])
+        return {
+            "status": "success",
+            "data": {
+                "resultType": "matrix",
+                "result": [{"metric": self.labels, "values": values}] if values else [],
+            },
+        }
+
+    def start(self) -> str:
+        """Start serving on a free local port in a background thread and return the endpoint."""
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                if parsed.path != QUERY_RANGE_PATH:
+                    self.send_error(404)
+                    return
+                fake.request_count += 1
+                if fake.latency_seconds:
+                    time.sleep(fake.latency_seconds)
+                params = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+                body = json.dumps(fake.query_range(params)).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Fake Loki serving {len(self.entries)} entries at {self.endpoint}")
+        return self.endpoint
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> 'FakeLoki':
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+class FakeLokiTail:
+    """
+    In-memory Loki tail websocket, entries are pushed by the test and broadcast to every client.
+
+    A client connecting with a start parameter first receives the pushed entries at or after
+    start, like Loki does. Runs its own event loop in a background thread so it can be driven
+    from synchronous code as well.
+    """
+
+    def __init__(self, labels: Optional[dict] = None, batch_size: int = 100):
+        self.labels = labels or {"application": "marketdata-publisher"}
+        self.batch_size = batch_size
+        self.entries: list[tuple[int, str]] = []
+        self.connection_count = 0
+        self._clients: set = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server = None
+        self._thread: Optional[threading.Thread] = None
+        self._port: Optional[int] = None
+
+    @property
+    def endpoint(self) -> str:
+        return f"ws://127.0.0.1:{self._port}{TAIL_PATH}"
+
+    def push(self, entries: list[tuple[int, str]], dropped: int = 0) -> None:
+        """Append entries and send them to the connected clients, optionally reporting dropped entries."""
+        self.entries.extend(entries)
+        self._loop.call_soon_threadsafe(self._broadcast, list(entries), dropped)
+
+    def disconnect_all(self) -> None:
+        """Close every client connection, as when Loki restarts."""
+        for websocket in list(self._clients):
+            asyncio.run_coroutine_threadsafe(websocket.close(), self._loop)
+
+    def _message(self, entries: list[tuple[int, str]], dropped: int = 0) -> str:
+        payload = {"streams": [{"stream": self.labels, "values": [[str(ts), line] for ts, line in entries]}]}
+        if dropped:
+            payload["dropped_entries"] = [{"labels": self.labels, "timestamp": str(time.time_ns())}] * dropped
+        return json.dumps(payload)
+
+    def _broadcast(self, entries: list[tuple[int, str]], dropped: int) -> None:
+        for start in range(0, max(len(entries), 1), self.batch_size):
+            message = self._message(entries[start:start + self.batch_size], dropped if start == 0 else 0)
+            for websocket in list(self._clients):
+                asyncio.ensure_future(websocket.send(message))
+
+    async def _handle(self, websocket) -> None:
+        parsed = urlparse(websocket.request.path)
+        if parsed.path != TAIL_PATH:
+            await websocket.close(code=1008)
+            return
+        self.connection_count += 1
+        params = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+        start_ns = _to_ns(params['start']) if 'start' in params else time.time_ns()
+        backlog = [entry for entry in self.entries if entry[0] >= start_ns]
+        for start in range(0, len(backlog), self.batch_size):
+            await websocket.send(self._message(backlog[start:start + self.batch_size]))
+        self._clients.add(websocket)
+        try:
+            await websocket.wait_closed()
+        finally:
+            self._clients.discard(websocket)
+
+    def start(self) -> str:
+        """Start serving on a free local port in a background thread and return the endpoint."""
+        ready = threading.Event()
+
+        async def run():
+            self._server = await serve(self._handle, '127.0.0.1', 0)
+            self._port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            await self._server.wait_closed()
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_until_complete, args=(run(),), daemon=True)
+        self._thread.start()
+        ready.wait()
+        logger.info(f"Fake Loki tail serving at {self.endpoint}")
+        return self.endpoint
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+            self._thread.join(timeout=5)
+            self._server = None
+
+    def __enter__(self) -> 'FakeLokiTail':
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
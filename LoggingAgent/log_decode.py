@@ -0,0 +1,207 @@
+"""Bulk decoding of Loki responses and log lines, skipping malformed lines instead of failing the fetch."""
+import codecs
+import itertools
+import json
+import logging
+import re
+from typing import Callable, Iterable, Iterator, Optional, TypeVar
+
+from pydantic import TypeAdapter, ValidationError
+
+from LoggingAgent.schema import LogItem, LogRecord
+from consts import LOGS_DECODE_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+LOG_ITEMS_ADAPTER = TypeAdapter(list[LogItem])
+LOG_RECORDS_ADAPTER = TypeAdapter(list[LogRecord])
+LOG_RECORD_ADAPTER = TypeAdapter(LogRecord)
+
+T = TypeVar('T')
+
+VALUES_PATTERN = re.compile(r'"values"\s*:\s*\[')
+SEPARATOR_PATTERN = re.compile(r'[\s,]*')
+
+
+class QueryRangeDecoder:
+    """
+    Incremental decoder of a query_range response body.
+
+    Stream entries are decoded pair by pair as soon as their bytes arrive, so the body is
+    never held or turned into a document tree as a whole. The rest of the document, with
+    every values array emptied, is kept and decoded at the end for the status and errors.
+    """
+
+    def __init__(self):
+        self.entries: list[tuple[int, str]] = []
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._skeleton: list[str] = []
+        self._in_values = False
+
+    def feed(self, chunk: bytes) -> None:
+        self._buffer += self._text.decode(chunk)
+        self._consume()
+
+    def close(self) -> dict:
+        """
+        Finish decoding.
+
+        Returns:
+            dict: The response document without the values of its streams, see entries for those
+
+        Raises:
+            ValueError: If the body is not a complete query_range document
+        """
+        self._buffer += self._text.decode(b'', final=True)
+        self._consume()
+        if self._in_values:
+            raise ValueError("Loki response ended inside a stream's values")
+        return json.loads(''.join(self._skeleton) + self._buffer)
+
+    def _consume(self) -> None:
+        buffer, position = self._buffer, 0
+        decode, append = json.JSONDecoder().raw_decode, self.entries.append
+        while True:
+            if not self._in_values:
+                match = VALUES_PATTERN.search(buffer, position)
+                if match is None:
+                    # Keep a tail that may hold the start of the next marker
+                    keep_from = max(position, len(buffer) - 16)
+                    self._skeleton.append(buffer[position:keep_from])
+                    position = keep_from
+                    break
+                self._skeleton.append(buffer[position:match.end()])
+                position = match.end()
+                self._in_values = True
+
+            position = SEPARATOR_PATTERN.match(buffer, position).end()
+            if position == len(buffer):
+                break
+            if buffer[position] == ']':
+                self._in_values = False
+                continue
+            try:
+                value, end = decode(buffer, position)
+            except json.JSONDecodeError:
+                # The pair is cut off at the end of the chunk, wait for the next one
+                break
+            append((int(value[0]), value[-1]))
+            position = end
+        self._buffer = buffer[position:]
+
+
+def decode_query_range(chunks: Iterable[bytes]) -> tuple[dict, list[tuple[int, str]]]:
+    """
+    Decode a query_range response body from its chunks.
+
+    Returns:
+        tuple[dict, list[tuple[int, str]]]: Document without stream values, (timestamp in ns, raw line) entries
+    """
+    decoder = QueryRangeDecoder()
+    for chunk in chunks:
+        decoder.feed(chunk)
+    return decoder.close(), decoder.entries
+
+
+def decode_log_items(lines: list[str]) -> tuple[list[LogItem], int]:
+    """
+    Validate a batch of raw JSON log lines into LogItems with a single TypeAdapter call.
+
+    Lines failing validation are located from the errors and the rest of the batch is
+    validated again in bulk. Only when a line is not valid JSON, which leaves no position
+    to locate it by, is the batch validated line by line.
+
+    Args:
+        lines: JSON encoded log entries
+
+    Returns:
+        tuple[list[LogItem], int]: Valid entries in input order, number of malformed lines skipped
+    """
+    return _validate_json_lines(lines, LOG_ITEMS_ADAPTER, LogItem.model_validate_json)
+
+
+def decode_log_records(lines: list[str]) -> tuple[list[LogRecord], int]:
+    """Validate a batch of raw JSON log lines into LogRecord dicts, see decode_log_items."""
+    return _validate_json_lines(lines, LOG_RECORDS_ADAPTER, LOG_RECORD_ADAPTER.validate_json)
+
+
+def _validate_json_lines(lines: list[str], adapter: TypeAdapter, validate_line: Callable[[str], T]
+                         ) -> tuple[list[T], int]:
+    try:
+        items = adapter.validate_json('[' + ','.join(lines) + ']')
+        # A line holding more than one object would shift the batch, fall back to be sure
+        if len(items) == len(lines):
+            return items, 0
+    except ValidationError as e:
+        positions = {error['loc'][0] for error in e.errors() if error['loc'] and isinstance(error['loc'][0], int)}
+        if positions and all(error['type'] != 'json_invalid' for error in e.errors()):
+            valid = [line for position, line in enumerate(lines) if position not in positions]
+            items, malformed = _validate_json_lines(valid, adapter, validate_line)
+            return items, malformed + len(positions)
+
+    items, malformed = [], 0
+    for line in lines:
+        try:
+            items.append(validate_line(line))
+        except ValidationError as e:
+            malformed += 1
+            logger.debug(f"Skipping malformed log line {line[:200]!r}: {e.errors()[0]['msg']}")
+    return items, malformed
+
+
+def validate_log_records(records: list) -> tuple[list[LogRecord], int]:
+    """
+    Validate already decoded log entries into LogRecord dicts with a single TypeAdapter call.
+
+    Entries failing validation are located from the errors and the rest of the batch is
+    validated again in bulk, see decode_log_items.
+
+    Args:
+        records: Decoded log entries, None for a line that was not valid JSON
+
+    Returns:
+        tuple[list[LogRecord], int]: Valid entries in input order, number of malformed entries skipped
+    """
+    try:
+        return LOG_RECORDS_ADAPTER.validate_python(records), 0
+    except ValidationError as e:
+        positions = {error['loc'][0] for error in e.errors() if error['loc'] and isinstance(error['loc'][0], int)}
+        if not positions:
+            raise
+        for position in sorted(positions):
+            logger.debug(f"Skipping malformed log entry {str(records[position])[:200]}")
+        items, malformed = validate_log_records([record for position, record in enumerate(records)
+                                                 if position not in positions])
+        return items, malformed + len(positions)
+
+
+def iter_log_items(lines: Iterable[str], batch_size: int = LOGS_DECODE_BATCH_SIZE,
+                   stats: Optional[dict] = None) -> Iterator[LogItem]:
+    """
+    Stream LogItems from raw JSON log lines, validated batch_size lines at a time.
+
+    Args:
+        lines: JSON encoded log entries
+        batch_size: Number of lines validated per TypeAdapter call
+        stats: Lines decoded and skipped are counted into its 'lines' and 'malformed' keys when given
+
+    Yields:
+        LogItem: Valid entries in input order
+    """
+    stats = stats if stats is not None else {}
+    stats.setdefault("lines", 0)
+    stats.setdefault("malformed", 0)
+    malformed_before = stats["malformed"]
+    batch: list[str] = []
+    for line in itertools.chain(lines, [None]):
+        if line is not None:
+            batch.append(line)
+        if batch and (len(batch) >= batch_size or line is None):
+            items, malformed = decode_log_items(batch)
+            stats["lines"] += len(batch)
+            stats["malformed"] += malformed
+            batch = []
+            yield from items
+    if stats["malformed"] > malformed_before:
+        logger.warning(f"Skipped {stats['malformed'] - malformed_before} malformed log lines")
@@ -0,0 +1,256 @@
+"""Columnar in-memory container for fetched log lines."""
+import logging
+from array import array
+from calendar import timegm
+from itertools import accumulate, islice
+from time import strptime
+from typing import Callable, Iterable, Iterator, Optional, Union
+
+from LoggingAgent.log_decode import decode_log_records, validate_log_records
+from LoggingAgent.schema import LogItem, LogRecord
+from consts import LOGS_DECODE_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+ASCTIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class _Vocabulary:
+    """Interns repeated strings (logger names, levels, files, functions) as small integer codes."""
+
+    def __init__(self):
+        self.values: list[str] = []
+        self.codes: dict[str, int] = {}
+
+    def code(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class _Columns:
+    """Backing storage shared by a LogColumns and every slice or filter taken from it."""
+
+    def __init__(self):
+        self.asctimes = _Vocabulary()
+        self.names = _Vocabulary()
+        self.levels = _Vocabulary()
+        self.filenames = _Vocabulary()
+        self.func_names = _Vocabulary()
+        self.asctime_codes = array('I')
+        self.name_codes = array('I')
+        self.level_codes = array('B')
+        self.filename_codes = array('I')
+        self.func_codes = array('I')
+        self.timestamps = array('q')
+        self.linenos = array('i')
+        self.message_offsets = array('Q', [0])
+        self.messages = ''
+        self.malformed = 0
+        self.rows = 0
+        self._pending_messages: list[str] = []
+        self._epoch_by_minute: dict[str, int] = {}
+
+    def add(self, records: list[LogRecord]) -> None:
+        """
+        Append a batch of validated records column by column.
+
+        asctime is kept as logged, its leading YYYY-MM-DD HH:MM:SS, already checked by
+        LogRecord, is also stored as epoch seconds for filtering. Records whose time is not a
+        valid date are skipped and counted in malformed.
+        """
+        epoch_by_minute = self._epoch_by_minute
+        timestamps, invalid = [], set()
+        for position, record in enumerate(records):
+            asctime = record['asctime']
+            minute_epoch = epoch_by_minute.get(asctime[:16])
+            if minute_epoch is None:
+                try:
+                    minute_epoch = epoch_by_minute[asctime[:16]] = timegm(strptime(asctime[:16], '%Y-%m-%d %H:%M'))
+                except ValueError as e:
+                    invalid.add(position)
+                    logger.debug(f"Skipping malformed log entry {str(record)[:200]}: {e!r}")
+                    continue
+            timestamps.append(minute_epoch + int(asctime[17:19]))
+        if invalid:
+            self.malformed += len(invalid)
+            records = [record for position, record in enumerate(records) if position not in invalid]
+        self.timestamps.extend(timestamps)
+
+        for vocabulary, codes, field in ((self.asctimes, self.asctime_codes, 'asctime'),
+                                         (self.names, self.name_codes, 'name'),
+                                         (self.levels, self.level_codes, 'levelname'),
+                                         (self.filenames, self.filename_codes, 'filename'),
+                                         (self.func_names, self.func_codes, 'funcName')):
+            values = [record[field] for record in records]
+            for value in set(values).difference(vocabulary.codes):
+                vocabulary.code(value)
+            codes.extend(map(vocabulary.codes.__getitem__, values))
+        self.linenos.extend([record['lineno'] for record in records])
+        self._pending_messages.extend([record['message'] for record in records])
+
+    def finish(self) -> int:
+        """Join the added messages into the message buffer, returns the number of rows."""
+        messages = self._pending_messages
+        if self.malformed:
+            logger.warning(f"Skipped {self.malformed} malformed log entries out of {len(messages) + self.malformed}")
+        # Messages are stored newline separated so the whole table can be searched at once
+        self.message_offsets.extend(accumulate(len(message) + 1 for message in messages))
+        self.messages = '\n'.join(messages)
+        self.rows = len(messages)
+        self._pending_messages, self._epoch_by_minute = [], {}
+        return self.rows
+
+
+class LogColumns:
+    """
+    Compact, read-only table of log lines.
+
+    Repeated strings are interned per column, asctime is also kept as integer epoch seconds,
+    line numbers as int32 and every message in one string addressed by offsets. Slices and
+    filters are views holding row indices into the same storage, LogItems are only built
+    when a row is accessed.
+    """
+
+    def __init__(self, columns: _Columns, rows: Union[range, array]):
+        self._columns = columns
+        self._rows = rows
+
+    @classmethod
+    def from_lines(cls, lines: Iterable[str]) -> 'LogColumns':
+        """
+        Build a table in bulk from raw JSON log lines as returned by Loki.
+
+        Lines are validated LOGS_DECODE_BATCH_SIZE at a time into plain LogRecord dicts, see
+        decode_log_records, and each batch is appended to the columns before the next one is
+        decoded, so no LogItem is built. Malformed lines are skipped and
+        counted in malformed.
+
+        Args:
+            lines: JSON encoded log entries
+
+        Returns:
+            LogColumns: Table holding every valid line in input order
+        """
+        return cls._from_batches(lines, decode_log_records)
+
+    @classmethod
+    def from_records(cls, records: Iterable[Optional[dict]]) -> 'LogColumns':
+        """Build a table from already decoded log entries, see from_lines."""
+        return cls._from_batches(records, validate_log_records)
+
+    @classmethod
+    def from_log_items(cls, items: Iterable[LogItem]) -> 'LogColumns':
+        """Build a table from LogItems."""
+        return cls._from_batches((vars(item) for item in items), validate_log_records)
+
+    @classmethod
+    def _from_batches(cls, entries: Iterable, validate: Callable[[list], tuple[list[LogRecord], int]]
+                      ) -> 'LogColumns':
+        columns = _Columns()
+        entries = iter(entries)
+        while batch := list(islice(entries, LOGS_DECODE_BATCH_SIZE)):
+            records, malformed = validate(batch)
+            columns.malformed += malformed
+            columns.add(records)
+        return cls(columns, range(columns.finish()))
+
+    @property
+    def malformed(self) -> int:
+        """Number of malformed entries skipped when the table was built."""
+        return self._columns.malformed
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[LogItem, 'LogColumns']:
+        if isinstance(index, slice):
+            return LogColumns(self._columns, self._rows[index])
+        return self._materialize(self._rows[index])
+
+    def __iter__(self) -> Iterator[LogItem]:
+        for row in self._rows:
+            yield self._materialize(row)
+
+    def to_log_items(self) -> list[LogItem]:
+        """Materialize every row as a LogItem."""
+        return [self._materialize(row) for row in self._rows]
+
+    def message(self, index: int) -> str:
+        """Message text of a row without building a LogItem."""
+        return self._message(self._rows[index])
+
+    def joined_messages(self) -> tuple[str, array]:
+        """
+        Messages of every row joined by newlines, for running a regex over the whole table at once.
+
+        A table or slice of one is a single slice of the storage, a filtered view is joined anew.
+
+        Returns:
+            tuple[str, array]: Joined messages, offset at which each row's message starts
+        """
+        offsets, rows = self._columns.message_offsets, self._rows
+        if isinstance(rows, range) and rows.step == 1:
+            base = offsets[rows.start] if rows else 0
+            starts = offsets[rows.start:rows.stop]
+            if base:
+                starts = array('Q', (offset - base for offset in starts))
+            return self._columns.messages[base:max(base, offsets[rows.stop] - 1) if rows else 0], starts
+        messages = [self._message(row) for row in rows]
+        return '\n'.join(messages), array('Q', accumulate((len(message) + 1 for message in messages[:-1]),
+                                                          initial=0) if messages else [])
+
+    def epoch_seconds(self) -> list[int]:
+        """asctime of every row as Unix epoch seconds."""
+        timestamps = self._columns.timestamps
+        return [timestamps[row] for row in self._rows]
+
+    def filter(self, levels: Optional[Iterable[str]] = None, from_epoch: Optional[int] = None,
+               to_epoch: Optional[int] = None, func_names: Optional[Iterable[str]] = None) -> 'LogColumns':
+        """
+        Select rows by level, time and function without materializing them.
+
+        Args:
+            levels: Keep rows whose levelname is one of these
+            from_epoch: Keep rows logged at or after this Unix epoch second
+            to_epoch: Keep rows logged at or before this Unix epoch second
+            func_names: Keep rows logged from one of these functions
+
+        Returns:
+            LogColumns: View over the matching rows, in the same order
+        """
+        columns = self._columns
+        rows = self._rows
+        if levels is not None:
+            codes = {columns.levels.codes[level] for level in levels if level in columns.levels.codes}
+            level_codes = columns.level_codes
+            rows = [row for row in rows if level_codes[row] in codes]
+        if func_names is not None:
+            codes = {columns.func_names.codes[name] for name in func_names if name in columns.func_names.codes}
+            func_codes = columns.func_codes
+            rows = [row for row in rows if func_codes[row] in codes]
+        if from_epoch is not None or to_epoch is not None:
+            low = from_epoch if from_epoch is not None else -2 ** 63
+            high = to_epoch if to_epoch is not None else 2 ** 63 - 1
+            timestamps = columns.timestamps
+            rows = [row for row in rows if low <= timestamps[row] <= high]
+        return LogColumns(columns, rows if isinstance(rows, range) else array('I', rows))
+
+    def _message(self, row: int) -> str:
+        offsets = self._columns.message_offsets
+        return self._columns.messages[offsets[row]:offsets[row + 1] - 1]
+
+    def _materialize(self, row: int) -> LogItem:
+        columns = self._columns
+        # Fields were validated when the table was built
+        return LogItem.model_construct(
+            asctime=columns.asctimes.values[columns.asctime_codes[row]],
+            name=columns.names.values[columns.name_codes[row]],
+            levelname=columns.levels.values[columns.level_codes[row]],
+            filename=columns.filenames.values[columns.filename_codes[row]],
+            lineno=columns.linenos[row],
+            funcName=columns.func_names.values[columns.func_codes[row]],
+            message=self._message(row),
+        )
@@ -0,0 +1,187 @@
+"""Two-tier (in-memory LRU + SQLite) cache for natural language to LogQL translations."""
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from LoggingAgent.schema import LogQLOutput
+from consts import LOGQL_CACHE_DB_PATH, LOGQL_CACHE_MAX_MEMORY_ENTRIES, LOGQL_CACHE_MAX_DISK_ENTRIES, \
+    LOGQL_CACHE_TTL_SECONDS, LOGQL_CACHE_TIME_BUCKET_SECONDS
+from instrumentation import count
+
+logger = logging.getLogger(__name__)
+
+
+# Words that make a translation depend on when it is asked
+RELATIVE_TIME_PATTERN = re.compile(
+    r'\b(now|today|tonight|yesterday|ago|last|past|recent|recently|latest|current|currently|since|earlier|'
+    r'this (morning|afternoon|evening|hour|week|month))\b', re.IGNORECASE
+)
+DATE_PATTERN = re.compile(r'\b\d{4}-\d{2}-\d{2}\b')
+CLOCK_PATTERN = re.compile(r'\b\d{1,2}:\d{2}\b')
+
+
+def uses_relative_time(query: str) -> bool:
+    """Whether a query refers to the current time, including a clock time given without a date."""
+    return bool(RELATIVE_TIME_PATTERN.search(query)) or (bool(CLOCK_PATTERN.search(query))
+                                                         and not DATE_PATTERN.search(query))
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation so trivially different phrasings share a key."""
+    return re.sub(r'\s+', ' ', query).strip().rstrip('?.! ').lower()
+
+
+class LogQLCache:
+    """
+    Cache of LogQLOutput keyed by query, application, prompt hash and, for relative time queries, a bucketed "now".
+
+    The "now" bucket is only part of the key of queries using relative time ("today", "last
+    hour"), so that they are translated again once the bucket rolls over, other queries keep
+    their translation for ttl_seconds. A translation carrying a time range for a query that
+    did not look relative is not stored, see cacheable. Entries expire after ttl_seconds in both
+    tiers, the memory tier is an LRU of max_memory_entries and the disk tier keeps the
+    max_disk_entries most recently used rows.
+    """
+
+    def __init__(self, db_path: Optional[str] = LOGQL_CACHE_DB_PATH,
+                 max_memory_entries: int = LOGQL_CACHE_MAX_MEMORY_ENTRIES,
+                 max_disk_entries: int = LOGQL_CACHE_MAX_DISK_ENTRIES,
+                 ttl_seconds: int = LOGQL_CACHE_TTL_SECONDS,
+                 time_bucket_seconds: int = LOGQL_CACHE_TIME_BUCKET_SECONDS):
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+        self.time_bucket_seconds = time_bucket_seconds
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0}
+        self._memory: OrderedDict[str, tuple[float, LogQLOutput]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS logql_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def make_key(self, query: str, user_application: str, prompt_hash: str, now: Optional[float] = None) -> str:
+        """
+        Build the content address of a translation request.
+
+        Args:
+            query (str): Natural language query
+            user_application (str): Target application name
+            prompt_hash (str): Hash of the prompt files used for the translation
+            now (Optional[float]): Unix time used for the time bucket of a relative time query, defaults to the
+                current time
+
+        Returns:
+            str: Hex digest identifying the request
+        """
+        material = [normalize_query(query), user_application.strip().lower(), prompt_hash]
+        if uses_relative_time(query):
+            material.append(str(int((now if now is not None else time.time()) // self.time_bucket_seconds)))
+        return hashlib.sha256('\0'.join(material).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def cacheable(query: str, value: LogQLOutput) -> bool:
+        """
+        Whether a translation may be stored under the key of its query.
+
+        A time range the model filled in for a query that neither looked relative nor gave a date
+        was resolved against the current time, which the key of such a query does not hold.
+        """
+        if not (value.from_time or value.to_time) or uses_relative_time(query):
+            return True
+        return bool(DATE_PATTERN.search(query))
+
+    def get(self, key: str, bypass: bool = False, schema: type[LogQLOutput] = LogQLOutput) -> Optional[LogQLOutput]:
+        """
+        Return the cached translation for key, or None on a miss, an expired entry or when bypassing.
+
+        schema is the LogQLOutput subclass the translation was stored as, to restore it from the disk tier.
+        """
+        if bypass:
+            self.stats["bypassed"] += 1
+            return None
+
+        now = time.time()
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                created_at, value = cached
+                if now - created_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    count("cache_hits.logql")
+                    return value.model_copy()
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value, created_at FROM logql_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None and now - row[1] <= self.ttl_seconds:
+                    self._db.execute("UPDATE logql_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    value = schema.model_validate_json(row[0])
+                    self._remember(key, row[1], value)
+                    self.stats["disk_hits"] += 1
+                    count("cache_hits.logql")
+                    return value.model_copy()
+
+            self.stats["misses"] += 1
+            count("cache_misses.logql")
+            return None
+
+    def put(self, key: str, value: LogQLOutput) -> None:
+        """Store a translation in both tiers and evict expired or least recently used entries."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO logql_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value.model_dump_json(), now, now)
+            )
+            self._db.execute("DELETE FROM logql_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._db.execute(
+                "DELETE FROM logql_cache WHERE key NOT IN "
+                "(SELECT key FROM logql_cache ORDER BY accessed_at DESC LIMIT ?)",
+                (self.max_disk_entries,)
+            )
+            self._db.commit()
+
+    def clear(self) -> None:
+        """Drop every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM logql_cache")
+                self._db.commit()
+
+    def _remember(self, key: str, created_at: float, value: LogQLOutput) -> None:
+        self._memory[key] = (created_at, value.model_copy())
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+
+_cache: Optional[LogQLCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_logql_cache() -> LogQLCache:
+    """Return the process-wide translation cache, opening the SQLite store on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LogQLCache()
+        return _cache
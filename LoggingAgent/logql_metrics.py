@@ -0,0 +1,205 @@
+"""LogQL metric queries evaluated by Loki, fetched as NumPy matrices instead of raw log lines."""
+import asyncio
+import logging
+import math
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+
+from LoggingAgent.loki_async import get_async_client
+from LoggingAgent.loki_client import get_session, NANOS_PER_SECOND
+from LoggingAgent.schema import LogQLMetricResult, LogQLMetricSeries
+from consts import LOGS_FETCH_QUERY_ENDPOINT, LOGS_HTTP_TIMEOUT_SECONDS, LOGS_PAGE_DEADLINE_SECONDS, \
+    LOGQL_METRIC_MAX_POINTS, LOGQL_METRIC_MAX_SERIES, LOGQL_METRIC_STEPS_SECONDS
+from instrumentation import span
+
+logger = logging.getLogger(__name__)
+
+# Range placeholder of generated metric queries, as in Grafana, replaced by the step before execution
+INTERVAL_VARIABLE = '$__interval'
+
+
+def metric_step_seconds(start_ns: int, end_ns: int, step_seconds: Optional[int] = None,
+                        max_points: int = LOGQL_METRIC_MAX_POINTS) -> int:
+    """
+    Step of a metric query over a window, the requested one or a coarser one keeping the result small.
+
+    Args:
+        start_ns (int): Start of the window in Unix nanoseconds
+        end_ns (int): End of the window in Unix nanoseconds
+        step_seconds (Optional[int]): Requested resolution, None for the finest one allowed
+        max_points (int): Maximum number of evaluation times in the window
+
+    Returns:
+        int: Smallest of LOGQL_METRIC_STEPS_SECONDS at least as coarse as requested and needed for max_points
+    """
+    needed = max(step_seconds or 1, math.ceil((end_ns - start_ns) / NANOS_PER_SECOND / max_points))
+    return next((step for step in LOGQL_METRIC_STEPS_SECONDS if step >= needed), needed)
+
+
+def metric_window(start_ns: int, end_ns: int, step_seconds: int) -> tuple[int, int]:
+    """
+    First and last evaluation time of a metric query over a window, on multiples of the step.
+
+    Each sample of a [$__interval] range covers the step before its evaluation time, the first
+    one starts at or before start_ns and the last one ends at or after end_ns, so no line of the
+    window is left out.
+
+    Returns:
+        tuple[int, int]: (first, last) evaluation time in Unix nanoseconds
+    """
+    step_ns = step_seconds * NANOS_PER_SECOND
+    return (start_ns // step_ns + 1) * step_ns, -(-end_ns // step_ns) * step_ns
+
+
+def with_step(logql_query: str, step_seconds: int) -> str:
+    """Replace the [$__interval] range with the step, so consecutive ranges cover the window without overlap."""
+    return logql_query.replace(INTERVAL_VARIABLE, f"{step_seconds}s")
+
+
+def metric_query_params(logql_query: str, start_ns: int, end_ns: int, step_seconds: int) -> dict:
+    return {
+        "query": logql_query,
+        "start": start_ns,
+        "end": end_ns,
+        "step": step_seconds,
+    }
+
+
+class LogQLMatrix:
+    """
+    Series of a metric query on one shared time axis.
+
+    times holds the epoch seconds at which any series has a sample, ascending, and values is a
+    (series, times) array with NaN where a series has no sample, e.g. a count_over_time step
+    without matching lines.
+    """
+
+    def __init__(self, labels: list[dict[str, str]], times: np.ndarray, values: np.ndarray):
+        self.labels = labels
+        self.times = times
+        self.values = values
+
+    @classmethod
+    def from_result(cls, result: dict) -> 'LogQLMatrix':
+        """
+        Parse a query_range response of a metric query.
+
+        Raises:
+            Exception: If Loki reports an error in the response body
+            ValueError: If the query was a log query, which returns streams instead of a matrix
+        """
+        if 'error' in result:
+            logger.error(f"Grafana API error: {result['error']}")
+            raise Exception(f"Grafana API error: {result['error']}")
+        data = result.get('data', {})
+        if data.get('resultType') != 'matrix':
+            raise ValueError(f"Expected a metric query returning a matrix, got {data.get('resultType')}: "
+                             f"wrap the log query in a range aggregation such as count_over_time")
+
+        series = data.get('result', [])
+        labels = [entry.get('metric', {}) for entry in series]
+        samples = [np.array(entry['values'], dtype=object).reshape(-1, 2) for entry in series]
+        stamps = [sample[:, 0].astype(np.float64) for sample in samples]
+        times = np.unique(np.concatenate(stamps)) if stamps else np.empty(0)
+        values = np.full((len(series), len(times)), np.nan)
+        for row, (ts, sample) in enumerate(zip(stamps, samples)):
+            values[row, np.searchsorted(times, ts)] = sample[:, 1].astype(np.float64)
+        return cls(labels, times, values)
+
+    def to_result(self, logql_query: str, step_seconds: int,
+                  max_series: int = LOGQL_METRIC_MAX_SERIES) -> LogQLMetricResult:
+        """
+        Compact table of the matrix for the agent.
+
+        Args:
+            logql_query (str): Query that was executed
+            step_seconds (int): Step it was executed with
+            max_series (int): Maximum number of series kept, the ones with the highest peak
+
+        Returns:
+            LogQLMetricResult: Kept series on the times at which any of them has a sample, series
+            without any sample are left out
+        """
+        sampled = np.flatnonzero(~np.isnan(self.values).all(axis=1))
+        peaks = np.nanmax(self.values[sampled], axis=1, initial=-np.inf)
+        kept = sampled[np.argsort(-peaks, kind='stable')[:max_series]]
+        values = self.values[kept]
+        present = ~np.isnan(values)
+        columns = present.any(axis=0)
+        values, present = values[:, columns], present[:, columns]
+
+        series = []
+        for row, index in enumerate(kept):
+            samples = values[row][present[row]]
+            series.append(LogQLMetricSeries(
+                labels=self.labels[index],
+                values=[None if np.isnan(value) else value for value in np.round(values[row], 3).tolist()],
+                total=round(float(samples.sum()), 3),
+                min=round(float(samples.min()), 3),
+                max=round(float(samples.max()), 3),
+                mean=round(float(samples.mean()), 3),
+                last=round(float(samples[-1]), 3),
+            ))
+        times = [datetime.fromtimestamp(ts, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+                 for ts in self.times[columns].tolist()]
+        return LogQLMetricResult(logql_query=logql_query, step_seconds=step_seconds, times=times, series=series,
+                                 other_series=len(self.labels) - len(kept))
+
+
+def fetch_matrix(logql_query: str, start_ns: int, end_ns: int, step_seconds: int,
+                 endpoint: str = LOGS_FETCH_QUERY_ENDPOINT) -> LogQLMatrix:
+    """
+    Evaluate a metric query over a window in Loki, one sample per series and step.
+
+    Args:
+        logql_query (str): LogQL metric query, with its range already set, see with_step
+        start_ns (int): First evaluation time in Unix nanoseconds, see metric_window
+        end_ns (int): Last evaluation time in Unix nanoseconds
+        step_seconds (int): Distance between evaluation times
+        endpoint (str): query_range URL
+
+    Returns:
+        LogQLMatrix: Returned series
+
+    Raises:
+        Exception: If Loki reports an error in the response body
+        ValueError: If Loki rejects the query or it is not a metric query
+        requests.exceptions.RequestException: If the HTTP request fails
+    """
+    params = metric_query_params(logql_query, start_ns, end_ns, step_seconds)
+    logger.debug(f"Executing metric query with params: {params}")
+    with span("loki.query_range", "http") as request_span:
+        response = get_session().get(endpoint, params=params, timeout=LOGS_HTTP_TIMEOUT_SECONDS)
+        request_span.count("bytes_fetched", len(response.content))
+        if response.status_code == 400:
+            raise ValueError(f"Loki rejected the query: {response.text.strip()}")
+        response.raise_for_status()
+        matrix = LogQLMatrix.from_result(response.json())
+        request_span.count("series_fetched", len(matrix.labels))
+    return matrix
+
+
+async def afetch_matrix(logql_query: str, start_ns: int, end_ns: int, step_seconds: int,
+                        endpoint: str = LOGS_FETCH_QUERY_ENDPOINT,
+                        deadline_seconds: float = LOGS_PAGE_DEADLINE_SECONDS) -> LogQLMatrix:
+    """
+    Async fetch_matrix over the shared httpx pool, see it for the arguments.
+
+    Raises:
+        httpx.HTTPError: If the HTTP request fails
+        TimeoutError: If the request takes longer than deadline_seconds
+    """
+    params = metric_query_params(logql_query, start_ns, end_ns, step_seconds)
+    logger.debug(f"Executing async metric query with params: {params}")
+    with span("loki.query_range", "http") as request_span:
+        async with asyncio.timeout(deadline_seconds):
+            response = await get_async_client().get(endpoint, params=params)
+        request_span.count("bytes_fetched", len(response.content))
+        if response.status_code == 400:
+            raise ValueError(f"Loki rejected the query: {response.text.strip()}")
+        response.raise_for_status()
+        matrix = LogQLMatrix.from_result(response.json())
+        request_span.count("series_fetched", len(matrix.labels))
+    return matrix
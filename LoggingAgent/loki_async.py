@@ -0,0 +1,184 @@
+"""Non-blocking query_range fetches over a shared httpx connection pool, for async tools on the event loop."""
+import asyncio
+import logging
+import threading
+import weakref
+from typing import AsyncIterator, Optional
+
+import httpx
+
+from LoggingAgent.log_decode import QueryRangeDecoder
+from LoggingAgent.log_store import LogColumns
+from LoggingAgent.loki_client import Direction, PageCursor, grafana_credentials, page_entries, query_range_params, \
+    shard_window
+from LoggingAgent.loki_result_cache import LokiResultCache
+from consts import LOGS_FETCH_QUERY_ENDPOINT, LOGS_PAGE_SIZE, LOGS_MAX_LINES_PER_FETCH, LOGS_HTTP_POOL_SIZE, \
+    LOGS_HTTP_TIMEOUT_SECONDS, LOGS_FETCH_MAX_WORKERS, LOGS_DECODE_CHUNK_BYTES, LOGS_PAGE_DEADLINE_SECONDS
+from instrumentation import span
+
+logger = logging.getLogger(__name__)
+
+# An AsyncClient's connections belong to the loop that opened them, so there is one client per loop
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_client_override: Optional[httpx.AsyncClient] = None
+_clients_lock = threading.Lock()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Return the keep-alive client of the running event loop used for all async Loki requests.
+
+    The client is created lazily on first use with Grafana credentials from the environment
+    and a connection pool sized by LOGS_HTTP_POOL_SIZE.
+
+    Returns:
+        httpx.AsyncClient: Shared client
+
+    Raises:
+        ValueError: If GRAFANA_USERNAME or GRAFANA_PWD are not set
+    """
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        if _client_override is not None:
+            return _client_override
+        client = _clients.get(loop)
+        if client is None:
+            username, password = grafana_credentials()
+            limits = httpx.Limits(max_connections=LOGS_HTTP_POOL_SIZE, max_keepalive_connections=LOGS_HTTP_POOL_SIZE)
+            client = _clients[loop] = httpx.AsyncClient(auth=(username, password), limits=limits,
+                                                        timeout=LOGS_HTTP_TIMEOUT_SECONDS)
+            logger.info(f"Created pooled async Loki client for user {username}")
+        return client
+
+
+def set_async_client(client: Optional[httpx.AsyncClient]) -> Optional[httpx.AsyncClient]:
+    """
+    Make client the one used for all async Loki requests on every loop, e.g. with a replaying transport.
+
+    Returns:
+        Optional[httpx.AsyncClient]: The client it replaces, to restore it afterwards
+    """
+    global _client_override
+    with _clients_lock:
+        previous, _client_override = _client_override, client
+        return previous
+
+
+async def close_async_client() -> None:
+    """Close the running loop's client, the next fetch on the loop will open a new one."""
+    with _clients_lock:
+        client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def afetch_page(logql_query: str, start_ns: int, end_ns: int, limit: int, direction: Direction = 'backward',
+                      endpoint: str = LOGS_FETCH_QUERY_ENDPOINT,
+                      deadline_seconds: float = LOGS_PAGE_DEADLINE_SECONDS) -> list[tuple[int, str]]:
+    """
+    Async fetch_page, decoding the body as it streams in without blocking the event loop.
+
+    Cancelling the calling task closes the connection, see fetch_page for the other arguments.
+
+    Args:
+        deadline_seconds (float): Time allowed for the whole page, a stalled body counts too
+
+    Returns:
+        list[tuple[int, str]]: (timestamp in ns, raw log line) pairs across all returned streams
+
+    Raises:
+        Exception: If Loki reports an error in the response body
+        ValueError: If the response body is not a valid query_range document
+        httpx.HTTPError: If the HTTP request fails
+        TimeoutError: If the page takes longer than deadline_seconds
+    """
+    params = query_range_params(logql_query, start_ns, end_ns, limit, direction)
+    logger.debug(f"Executing async query with params: {params}")
+    decoder = QueryRangeDecoder()
+    with span("loki.query_range", "http") as request_span:
+        async with asyncio.timeout(deadline_seconds):
+            async with get_async_client().stream("GET", endpoint, params=params) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes(LOGS_DECODE_CHUNK_BYTES):
+                    request_span.count("bytes_fetched", len(chunk))
+                    decoder.feed(chunk)
+        result = decoder.close()
+        request_span.count("lines_fetched", len(decoder.entries))
+    return page_entries(result, decoder.entries, direction)
+
+
+async def aiter_log_entries(logql_query: str, start_ns: int, end_ns: int, direction: Direction = 'backward',
+                            page_size: int = LOGS_PAGE_SIZE, max_lines: int = LOGS_MAX_LINES_PER_FETCH,
+                            endpoint: str = LOGS_FETCH_QUERY_ENDPOINT) -> AsyncIterator[tuple[int, str]]:
+    """Async iter_log_entries, see it for the arguments."""
+    cursor = PageCursor(start_ns, end_ns, direction, page_size, max_lines)
+    while not cursor.done:
+        for entry in cursor.advance(await afetch_page(logql_query, cursor.start_ns, cursor.end_ns, page_size,
+                                                      direction, endpoint)):
+            yield entry
+
+
+async def afetch_entries_sharded(logql_query: str, start_ns: int, end_ns: int, shards: int,
+                                 direction: Direction = 'backward', page_size: int = LOGS_PAGE_SIZE,
+                                 max_lines: int = LOGS_MAX_LINES_PER_FETCH,
+                                 endpoint: str = LOGS_FETCH_QUERY_ENDPOINT) -> list[tuple[int, str]]:
+    """
+    Async iter_log_entries_sharded, the shards run as tasks on the running loop.
+
+    At most LOGS_FETCH_MAX_WORKERS shards fetch at a time. The shards are taken in the requested
+    direction until the line budget is met, then the others are cancelled, as is every shard
+    when one fails.
+    """
+    windows = shard_window(start_ns, end_ns, shards)
+    if max_lines <= page_size or len(windows) == 1:
+        return [entry async for entry in
+                aiter_log_entries(logql_query, start_ns, end_ns, direction, page_size, max_lines, endpoint)]
+    if direction == 'backward':
+        windows.reverse()
+    semaphore = asyncio.Semaphore(LOGS_FETCH_MAX_WORKERS)
+
+    async def fetch_shard(window: tuple[int, int]) -> list[tuple[int, str]]:
+        async with semaphore:
+            return [entry async for entry in
+                    aiter_log_entries(logql_query, window[0], window[1], direction, page_size, max_lines, endpoint)]
+
+    tasks = [asyncio.create_task(fetch_shard(window)) for window in windows]
+    entries = []
+    try:
+        for task in tasks:
+            entries.extend(await task)
+            if len(entries) >= max_lines:
+                break
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return entries[:max_lines]
+
+
+async def afetch_entries(logql_query: str, start_ns: int, end_ns: int, direction: Direction = 'backward',
+                         page_size: int = LOGS_PAGE_SIZE, max_lines: int = LOGS_MAX_LINES_PER_FETCH,
+                         endpoint: str = LOGS_FETCH_QUERY_ENDPOINT, shards: int = 1,
+                         cache: Optional[LokiResultCache] = None) -> list[tuple[int, str]]:
+    """Async iter_entries, see it for the arguments."""
+    async def fetch(fetch_start_ns: int, fetch_end_ns: int, fetch_direction: Direction,
+                    limit: int) -> list[tuple[int, str]]:
+        if shards > 1:
+            return await afetch_entries_sharded(logql_query, fetch_start_ns, fetch_end_ns, shards, fetch_direction,
+                                                page_size, limit, endpoint)
+        return [entry async for entry in aiter_log_entries(logql_query, fetch_start_ns, fetch_end_ns,
+                                                           fetch_direction, page_size, limit, endpoint)]
+
+    if cache is None:
+        return await fetch(start_ns, end_ns, direction, max_lines)
+    return [entry async for entry in cache.aentries(logql_query, start_ns, end_ns, direction, max_lines, fetch)]
+
+
+async def afetch_log_columns(logql_query: str, start_ns: int, end_ns: int, direction: Direction = 'backward',
+                             page_size: int = LOGS_PAGE_SIZE, max_lines: int = LOGS_MAX_LINES_PER_FETCH,
+                             endpoint: str = LOGS_FETCH_QUERY_ENDPOINT, shards: int = 1,
+                             cache: Optional[LokiResultCache] = None) -> LogColumns:
+    """Async fetch_log_columns, see it for the arguments. The lines are validated on a worker thread."""
+    entries = await afetch_entries(logql_query, start_ns, end_ns, direction, page_size, max_lines, endpoint, shards,
+                                   cache)
+    return await asyncio.to_thread(LogColumns.from_lines, [line for _, line in entries])
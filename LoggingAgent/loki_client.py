@@ -0,0 +1,389 @@
+"""Pooled, paginated fetch engine for Loki's query_range endpoint."""
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional, Literal
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from LoggingAgent.log_decode import decode_query_range, iter_log_items
+from LoggingAgent.log_store import LogColumns
+from LoggingAgent.loki_result_cache import LokiResultCache
+from LoggingAgent.schema import LogItem
+from consts import LOGS_FETCH_QUERY_ENDPOINT, LOGS_PAGE_SIZE, LOGS_MAX_LINES_PER_FETCH, LOGS_HTTP_POOL_SIZE, \
+    LOGS_HTTP_TIMEOUT_SECONDS, LOGS_FETCH_MAX_WORKERS, LOGS_DECODE_CHUNK_BYTES
+from instrumentation import span
+
+logger = logging.getLogger(__name__)
+
+NANOS_PER_SECOND = 1_000_000_000
+
+Direction = Literal['backward', 'forward']
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def grafana_credentials() -> tuple[str, str]:
+    """
+    Grafana username and password from the environment.
+
+    Raises:
+        ValueError: If GRAFANA_USERNAME or GRAFANA_PWD are not set
+    """
+    username = os.getenv('GRAFANA_USERNAME')
+    password = os.getenv('GRAFANA_PWD')
+    if not username or not password:
+        logger.error("Missing Grafana credentials in environment variables")
+        raise ValueError("GRAFANA_USERNAME and GRAFANA_PWD environment variables are required")
+    return username, password
+
+
+def get_session() -> requests.Session:
+    """
+    Return the process-wide keep-alive session used for all Loki requests.
+
+    The session is created lazily on first use with Grafana credentials from the
+    environment and a connection pool sized by LOGS_HTTP_POOL_SIZE.
+
+    Returns:
+        requests.Session: Shared session
+
+    Raises:
+        ValueError: If GRAFANA_USERNAME or GRAFANA_PWD are not set
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            username, password = grafana_credentials()
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=LOGS_HTTP_POOL_SIZE, pool_maxsize=LOGS_HTTP_POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.auth = (username, password)
+            _session = session
+            logger.info(f"Created pooled Loki session for user {username}")
+        return _session
+
+
+def set_session(session: Optional[requests.Session]) -> Optional[requests.Session]:
+    """
+    Make session the one used for all Loki requests, e.g. with a replaying transport mounted.
+
+    Returns:
+        Optional[requests.Session]: The session it replaces, to restore it afterwards
+    """
+    global _session
+    with _session_lock:
+        previous, _session = _session, session
+        return previous
+
+
+def close_session() -> None:
+    """Close the shared session, the next fetch will open a new one."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def fetch_page(logql_query: str, start_ns: int, end_ns: int, limit: int, direction: Direction = 'backward',
+               endpoint: str = LOGS_FETCH_QUERY_ENDPOINT) -> list[tuple[int, str]]:
+    """
+    Run a single query_range request and return its entries ordered in the requested direction.
+
+    Args:
+        logql_query (str): LogQL query to execute
+        start_ns (int): Inclusive start of the window in Unix nanoseconds
+        end_ns (int): End of the window in Unix nanoseconds
+        limit (int): Maximum number of entries Loki should return
+        direction (str): 'backward' for newest first, 'forward' for oldest first
+        endpoint (str): query_range URL
+
+    Returns:
+        list[tuple[int, str]]: (timestamp in ns, raw log line) pairs across all returned streams
+
+    Raises:
+        Exception: If Loki reports an error in the response body
+        ValueError: If the response body is not a valid query_range document
+        requests.exceptions.RequestException: If the HTTP request fails
+    """
+    params = query_range_params(logql_query, start_ns, end_ns, limit, direction)
+    logger.debug(f"Executing query with params: {params}")
+    with span("loki.query_range", "http") as request_span, \
+            get_session().get(endpoint, params=params, timeout=LOGS_HTTP_TIMEOUT_SECONDS, stream=True) as response:
+        response.raise_for_status()
+
+        def chunks() -> Iterator[bytes]:
+            for chunk in response.iter_content(chunk_size=LOGS_DECODE_CHUNK_BYTES):
+                request_span.count("bytes_fetched", len(chunk))
+                yield chunk
+
+        result, entries = decode_query_range(chunks())
+        request_span.count("lines_fetched", len(entries))
+    return page_entries(result, entries, direction)
+
+
+def query_range_params(logql_query: str, start_ns: int, end_ns: int, limit: int, direction: Direction) -> dict:
+    return {
+        "query": logql_query,
+        "start": start_ns,
+        "end": end_ns,
+        "limit": limit,
+        "direction": direction,
+    }
+
+
+def page_entries(result: dict, entries: list[tuple[int, str]], direction: Direction) -> list[tuple[int, str]]:
+    """
+    Entries of a decoded query_range page ordered in the requested direction.
+
+    Raises:
+        Exception: If Loki reports an error in the response body
+    """
+    if 'error' in result:
+        logger.error(f"Grafana API error: {result['error']}")
+        raise Exception(f"Grafana API error: {result['error']}")
+
+    # Streams are returned separately, the page limit applies across all of them
+    entries.sort(key=lambda entry: entry[0], reverse=direction == 'backward')
+    return entries
+
+
+def iter_log_entries(logql_query: str, start_ns: int, end_ns: int, direction: Direction = 'backward',
+                     page_size: int = LOGS_PAGE_SIZE, max_lines: int = LOGS_MAX_LINES_PER_FETCH,
+                     endpoint: str = LOGS_FETCH_QUERY_ENDPOINT) -> Iterator[tuple[int, str]]:
+    """
+    Page through a time window by moving the start/end cursor after every page, see PageCursor.
+
+    Args:
+        logql_query (str): LogQL query to execute
+        start_ns (int): Inclusive start of the window in Unix nanoseconds
+        end_ns (int): End of the window in Unix nanoseconds
+        direction (str): 'backward' for newest first, 'forward' for oldest first
+        page_size (int): Number of entries requested per page
+        max_lines (int): Total number of entries to yield before stopping
+        endpoint (str): query_range URL
+
+    Yields:
+        tuple[int, str]: (timestamp in ns, raw log line) in the requested direction
+    """
+    cursor = PageCursor(start_ns, end_ns, direction, page_size, max_lines)
+    while not cursor.done:
+        yield from cursor.advance(fetch_page(logql_query, cursor.start_ns, cursor.end_ns, page_size, direction,
+                                             endpoint))
+
+
+class PageCursor:
+    """
+    Start/end cursor of a paged window, moved past every page fetched, see iter_log_entries.
+
+    Entries sharing the timestamp of a page edge are requested again by the next page,
+    so lines already returned at that timestamp are dropped.
+    """
+
+    def __init__(self, start_ns: int, end_ns: int, direction: Direction, page_size: int, max_lines: int):
+        self.start_ns = start_ns
+        self.end_ns = end_ns
+        self.direction = direction
+        self.page_size = page_size
+        self.max_lines = max_lines
+        self.remaining = max_lines
+        self.pages = 0
+        self.finished = False
+        self._edge_ts = None
+        self._edge_lines: set[str] = set()
+
+    @property
+    def done(self) -> bool:
+        return self.finished or self.remaining <= 0 or self.start_ns >= self.end_ns
+
+    def advance(self, entries: list[tuple[int, str]]) -> list[tuple[int, str]]:
+        """
+        Take in the next page and move the cursor past it.
+
+        Returns:
+            list[tuple[int, str]]: Entries of the page not returned before, within the line budget
+        """
+        self.pages += 1
+        fresh = []
+        for ts, line in entries:
+            if ts == self._edge_ts and line in self._edge_lines:
+                continue
+            fresh.append((ts, line))
+            if len(fresh) == self.remaining:
+                logger.info(f"Reached budget of {self.max_lines} lines after {self.pages} pages")
+                break
+        self.remaining -= len(fresh)
+
+        if self.remaining <= 0 or len(entries) < self.page_size:
+            self.finished = True
+            logger.debug(f"Fetched {self.max_lines - self.remaining} lines in {self.pages} pages")
+            return fresh
+
+        last_ts = entries[-1][0]
+        if not fresh:
+            # A whole page of already seen lines at one timestamp, step past it to make progress
+            logger.warning(f"More than {self.page_size} lines share timestamp {last_ts}, skipping past it")
+            if self.direction == 'backward':
+                self.end_ns = last_ts
+            else:
+                self.start_ns = last_ts + 1
+            self._edge_ts, self._edge_lines = None, set()
+            return fresh
+
+        lines_at_edge = {line for ts, line in entries if ts == last_ts}
+        if last_ts == self._edge_ts:
+            self._edge_lines |= lines_at_edge
+        else:
+            self._edge_ts, self._edge_lines = last_ts, lines_at_edge
+
+        if self.direction == 'backward':
+            self.end_ns = last_ts + 1
+        else:
+            self.start_ns = last_ts
+        return fresh
+
+
+def shard_window(start_ns: int, end_ns: int, shards: int) -> list[tuple[int, int]]:
+    """
+    Split [start_ns, end_ns) into contiguous, non-overlapping shards of roughly equal length.
+
+    Args:
+        start_ns (int): Inclusive start of the window in Unix nanoseconds
+        end_ns (int): Exclusive end of the window in Unix nanoseconds
+        shards (int): Number of shards
+
+    Returns:
+        list[tuple[int, int]]: (start, end) pairs ordered oldest first
+    """
+    shards = max(1, min(shards, end_ns - start_ns))
+    step = (end_ns - start_ns) // shards
+    bounds = [start_ns + i * step for i in range(shards)] + [end_ns]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def iter_log_entries_sharded(logql_query: str, start_ns: int, end_ns: int, shards: int,
+                             direction: Direction = 'backward', page_size: int = LOGS_PAGE_SIZE,
+                             max_lines: int = LOGS_MAX_LINES_PER_FETCH,
+                             endpoint: str = LOGS_FETCH_QUERY_ENDPOINT) -> Iterator[tuple[int, str]]:
+    """
+    Fetch a window as concurrent time shards on a bounded thread pool, yielding exactly what iter_log_entries would.
+
+    Shards are consumed in the requested direction, newest first for 'backward', and each may
+    fetch the whole line budget, so a budget met by the first shards is filled from them alone.
+    Once it is met the shards not started are cancelled and the running ones stop after their
+    current page. A budget a single page can hold is fetched unsharded, as sharding would only
+    add requests.
+
+    Args:
+        logql_query (str): LogQL query to execute
+        start_ns (int): Inclusive start of the window in Unix nanoseconds
+        end_ns (int): End of the window in Unix nanoseconds
+        shards (int): Number of time shards to split the window into
+        direction (str): 'backward' for newest first, 'forward' for oldest first
+        page_size (int): Number of entries requested per page
+        max_lines (int): Total number of entries to yield before stopping
+        endpoint (str): query_range URL
+
+    Yields:
+        tuple[int, str]: (timestamp in ns, raw log line) in the requested direction
+    """
+    windows = shard_window(start_ns, end_ns, shards)
+    if max_lines <= page_size or len(windows) == 1:
+        yield from iter_log_entries(logql_query, start_ns, end_ns, direction, page_size, max_lines, endpoint)
+        return
+    if direction == 'backward':
+        windows.reverse()
+    workers = min(len(windows), LOGS_FETCH_MAX_WORKERS)
+    stop = threading.Event()
+    logger.info(f"Fetching {len(windows)} shards with {workers} workers")
+
+    def fetch_shard(window: tuple[int, int], queued_at: float) -> list[tuple[int, str]]:
+        entries = []
+        with span("loki.shard", "http", queued_at):
+            for entry in iter_log_entries(logql_query, window[0], window[1], direction, page_size, max_lines,
+                                          endpoint):
+                if stop.is_set():
+                    break
+                entries.append(entry)
+        return entries
+
+    # Worker threads do not inherit the caller's context, every shard runs in a copy so its spans nest under the caller
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='loki-shard') as pool:
+        futures = [pool.submit(contextvars.copy_context().run, fetch_shard, window, time.monotonic())
+                   for window in windows]
+        emitted = 0
+        try:
+            # Shards do not overlap, so their entries in window order are already in the requested order
+            for future in futures:
+                for entry in future.result():
+                    yield entry
+                    emitted += 1
+                    if emitted >= max_lines:
+                        return
+        finally:
+            stop.set()
+            for future in futures:
+                future.cancel()
+
+
+def iter_entries(logql_query: str, start_ns: int, end_ns: int, direction: Direction = 'backward',
+                 page_size: int = LOGS_PAGE_SIZE, max_lines: int = LOGS_MAX_LINES_PER_FETCH,
+                 endpoint: str = LOGS_FETCH_QUERY_ENDPOINT, shards: int = 1,
+                 cache: Optional[LokiResultCache] = None) -> Iterator[tuple[int, str]]:
+    """
+    Entries of a window, see iter_log_entries for the arguments.
+
+    With shards > 1 the window is fetched as parallel time shards, see iter_log_entries_sharded.
+    With a cache only the parts of the window it does not hold are fetched, see LokiResultCache.
+
+    Yields:
+        tuple[int, str]: (timestamp in ns, raw log line) in the requested direction
+    """
+    def fetch(fetch_start_ns: int, fetch_end_ns: int, fetch_direction: Direction, limit: int) \
+            -> Iterator[tuple[int, str]]:
+        if shards > 1:
+            return iter_log_entries_sharded(logql_query, fetch_start_ns, fetch_end_ns, shards, fetch_direction,
+                                            page_size, limit, endpoint)
+        return iter_log_entries(logql_query, fetch_start_ns, fetch_end_ns, fetch_direction, page_size, limit,
+                                endpoint)
+
+    if cache is None:
+        return fetch(start_ns, end_ns, direction, max_lines)
+    return cache.entries(logql_query, start_ns, end_ns, direction, max_lines, fetch)
+
+
+def iter_logs(logql_query: str, start_ns: int, end_ns: int, direction: Direction = 'backward',
+              page_size: int = LOGS_PAGE_SIZE, max_lines: int = LOGS_MAX_LINES_PER_FETCH,
+              endpoint: str = LOGS_FETCH_QUERY_ENDPOINT, shards: int = 1,
+              cache: Optional[LokiResultCache] = None) -> Iterator[LogItem]:
+    """
+    Stream LogItems for a LogQL query over a time window, see iter_entries for the arguments.
+
+    Lines are validated in batches and malformed lines are skipped, see iter_log_items.
+
+    Yields:
+        LogItem: Parsed log entries in the requested direction
+    """
+    entries = iter_entries(logql_query, start_ns, end_ns, direction, page_size, max_lines, endpoint, shards, cache)
+    yield from iter_log_items(line for _, line in entries)
+
+
+def fetch_log_columns(logql_query: str, start_ns: int, end_ns: int, direction: Direction = 'backward',
+                      page_size: int = LOGS_PAGE_SIZE, max_lines: int = LOGS_MAX_LINES_PER_FETCH,
+                      endpoint: str = LOGS_FETCH_QUERY_ENDPOINT, shards: int = 1,
+                      cache: Optional[LokiResultCache] = None) -> LogColumns:
+    """
+    Fetch a window into a columnar LogColumns table, see iter_entries for the arguments.
+
+    Returns:
+        LogColumns: Fetched entries in the requested direction
+    """
+    entries = iter_entries(logql_query, start_ns, end_ns, direction, page_size, max_lines, endpoint, shards, cache)
+    return LogColumns.from_lines(line for _, line in entries)
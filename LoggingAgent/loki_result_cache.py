@@ -0,0 +1,255 @@
+"""Cache of fetched Loki lines per normalized LogQL query and time range."""
+import bisect
+import itertools
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Iterator, Optional
+
+from consts import LOKI_RESULT_CACHE_MAX_BYTES, LOKI_RESULT_CACHE_OPEN_TTL_SECONDS, LOKI_RESULT_CACHE_SETTLE_SECONDS
+from instrumentation import count
+
+logger = logging.getLogger(__name__)
+
+NANOS_PER_SECOND = 1_000_000_000
+# Rough per-entry overhead of the tuple, the int and the str object on top of the line's characters
+ENTRY_OVERHEAD_BYTES = 120
+
+STRING_LITERAL_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*"|`[^`]*`')
+OPERATOR_SPACING_PATTERN = re.compile(r'\s*([{},|=~!()\[\]])\s*')
+
+# (start_ns, end_ns, direction, limit) -> entries ordered in that direction, exactly the first limit ones Loki
+# returns for the window, a truncated result is cached as complete from its edge to the far end of the window
+Fetch = Callable[[int, int, str, int], Iterable[tuple[int, str]]]
+AsyncFetch = Callable[[int, int, str, int], Awaitable[list[tuple[int, str]]]]
+
+
+def normalize_logql(logql_query: str) -> str:
+    """
+    Cache key of a LogQL query, equal for queries differing only in whitespace outside string literals.
+
+    Nothing else is normalized, label values and line filters are case sensitive.
+    """
+    parts, position = [], 0
+    for match in STRING_LITERAL_PATTERN.finditer(logql_query):
+        parts.append(_collapse_whitespace(logql_query[position:match.start()]))
+        parts.append(match.group())
+        position = match.end()
+    parts.append(_collapse_whitespace(logql_query[position:]))
+    return ''.join(parts).strip()
+
+
+def _collapse_whitespace(text: str) -> str:
+    return OPERATOR_SPACING_PATTERN.sub(r'\1', re.sub(r'\s+', ' ', text))
+
+
+_segment_ids = itertools.count()
+
+
+@dataclass
+class _Segment:
+    """Every line of a query in [start_ns, end_ns), oldest first."""
+    query: str
+    start_ns: int
+    end_ns: int
+    entries: list[tuple[int, str]]
+    closed: bool
+    fetched_at: float = field(default_factory=time.monotonic)
+    id: int = field(default_factory=lambda: next(_segment_ids))
+
+    def __post_init__(self):
+        self.timestamps = [ts for ts, _ in self.entries]
+        self.nbytes = sum(len(line) for _, line in self.entries) + ENTRY_OVERHEAD_BYTES * len(self.entries)
+
+    def slice(self, start_ns: int, end_ns: int) -> list[tuple[int, str]]:
+        return self.entries[bisect.bisect_left(self.timestamps, start_ns):bisect.bisect_left(self.timestamps, end_ns)]
+
+
+class LokiResultCache:
+    """
+    Lines fetched from Loki kept per normalized query as non-overlapping time segments.
+
+    A request is answered from the segments covering its window and only the uncovered
+    sub-intervals are fetched, newest first for backward requests so that a line budget
+    filled by cached lines costs no request at all. Segments ending before now minus
+    LOKI_RESULT_CACHE_SETTLE_SECONDS are closed, Loki will not receive more lines for them,
+    and are kept until evicted. Segments closer to now expire after open_ttl_seconds. The
+    least recently used segments are evicted once the cached lines exceed max_bytes.
+    """
+
+    def __init__(self, max_bytes: int = LOKI_RESULT_CACHE_MAX_BYTES,
+                 open_ttl_seconds: float = LOKI_RESULT_CACHE_OPEN_TTL_SECONDS,
+                 settle_seconds: float = LOKI_RESULT_CACHE_SETTLE_SECONDS):
+        self.max_bytes = max_bytes
+        self.open_ttl_seconds = open_ttl_seconds
+        self.settle_seconds = settle_seconds
+        self.nbytes = 0
+        self.stats = {"requests": 0, "cached_lines": 0, "fetched_lines": 0, "fetches": 0, "evictions": 0}
+        self._segments: dict[str, list[_Segment]] = {}
+        self._lru: OrderedDict[int, _Segment] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def entries(self, logql_query: str, start_ns: int, end_ns: int, direction: str, max_lines: int,
+                fetch: Fetch) -> Iterator[tuple[int, str]]:
+        """
+        Entries of a query in [start_ns, end_ns), served from cache where possible.
+
+        Args:
+            logql_query: LogQL query
+            start_ns: Inclusive start in Unix nanoseconds
+            end_ns: Exclusive end in Unix nanoseconds
+            direction: 'backward' for newest first, 'forward' for oldest first
+            max_lines: Maximum number of entries
+            fetch: Fetches an uncovered sub-interval from Loki in the given direction, up to a limit, returning
+                the same lines as one paginated query would, see Fetch
+
+        Yields:
+            tuple[int, str]: (timestamp in ns, raw log line), as Loki would have returned them
+        """
+        query, remaining = normalize_logql(logql_query), max_lines
+        for piece_start, piece_end, segment in self._pieces(query, start_ns, end_ns, direction):
+            if remaining <= 0:
+                return
+            if segment is not None:
+                chosen = self._cached(segment, piece_start, piece_end, direction, remaining)
+            else:
+                chosen = list(fetch(piece_start, piece_end, direction, remaining))
+                self._fetched(query, piece_start, piece_end, chosen, direction, remaining)
+            yield from chosen
+            remaining -= len(chosen)
+
+    async def aentries(self, logql_query: str, start_ns: int, end_ns: int, direction: str, max_lines: int,
+                       fetch: AsyncFetch) -> AsyncIterator[tuple[int, str]]:
+        """Async entries, fetching the uncovered sub-intervals with an async fetch."""
+        query, remaining = normalize_logql(logql_query), max_lines
+        for piece_start, piece_end, segment in self._pieces(query, start_ns, end_ns, direction):
+            if remaining <= 0:
+                return
+            if segment is not None:
+                chosen = self._cached(segment, piece_start, piece_end, direction, remaining)
+            else:
+                chosen = await fetch(piece_start, piece_end, direction, remaining)
+                self._fetched(query, piece_start, piece_end, chosen, direction, remaining)
+            for entry in chosen:
+                yield entry
+            remaining -= len(chosen)
+
+    def _pieces(self, query: str, start_ns: int, end_ns: int,
+                direction: str) -> list[tuple[int, int, Optional[_Segment]]]:
+        self.stats["requests"] += 1
+        pieces = self._plan(query, start_ns, end_ns)
+        return pieces[::-1] if direction == 'backward' else pieces
+
+    def _cached(self, segment: _Segment, start_ns: int, end_ns: int, direction: str,
+                limit: int) -> list[tuple[int, str]]:
+        cached = segment.slice(start_ns, end_ns)
+        chosen = cached[::-1][:limit] if direction == 'backward' else cached[:limit]
+        self.stats["cached_lines"] += len(chosen)
+        count("cache_hits.loki_lines", len(chosen))
+        return chosen
+
+    def _fetched(self, query: str, start_ns: int, end_ns: int, entries: list[tuple[int, str]], direction: str,
+                 limit: int) -> None:
+        self.stats["fetches"] += 1
+        self.stats["fetched_lines"] += len(entries)
+        count("cache_misses.loki_fetches")
+        self._store_fetched(query, start_ns, end_ns, entries, direction == 'backward', limit)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._segments.clear()
+            self._lru.clear()
+            self.nbytes = 0
+
+    def _plan(self, query: str, start_ns: int, end_ns: int) -> list[tuple[int, int, Optional[_Segment]]]:
+        """Split [start_ns, end_ns) into cached pieces and gaps, oldest first."""
+        now = time.monotonic()
+        pieces = []
+        with self._lock:
+            segments = self._segments.get(query, [])
+            for segment in list(segments):
+                if not segment.closed and now - segment.fetched_at > self.open_ttl_seconds:
+                    self._remove(segment)
+            cursor = start_ns
+            for segment in self._segments.get(query, []):
+                if segment.end_ns <= cursor or segment.start_ns >= end_ns:
+                    continue
+                if segment.start_ns > cursor:
+                    pieces.append((cursor, segment.start_ns, None))
+                pieces.append((max(cursor, segment.start_ns), min(end_ns, segment.end_ns), segment))
+                self._lru.move_to_end(segment.id)
+                cursor = min(end_ns, segment.end_ns)
+            if cursor < end_ns:
+                pieces.append((cursor, end_ns, None))
+        return pieces
+
+    def _store_fetched(self, query: str, start_ns: int, end_ns: int, entries: list[tuple[int, str]], backward: bool,
+                       limit: int) -> None:
+        ascending = entries[::-1] if backward else list(entries)
+        if len(entries) >= limit and entries:
+            # Truncated by the budget, only the part past the last returned timestamp is known to be complete
+            edge_ts = entries[-1][0]
+            if backward:
+                start_ns = edge_ts + 1
+                ascending = [entry for entry in ascending if entry[0] > edge_ts]
+            else:
+                end_ns = edge_ts
+                ascending = [entry for entry in ascending if entry[0] < edge_ts]
+        if start_ns >= end_ns:
+            return
+
+        settled_ns = time.time_ns() - int(self.settle_seconds * NANOS_PER_SECOND)
+        parts = [(start_ns, min(end_ns, settled_ns), True), (max(start_ns, settled_ns), end_ns, False)]
+        with self._lock:
+            for part_start, part_end, closed in parts:
+                if part_start < part_end:
+                    timestamps = [ts for ts, _ in ascending]
+                    part = ascending[bisect.bisect_left(timestamps, part_start):bisect.bisect_left(timestamps, part_end)]
+                    self._insert(_Segment(query, part_start, part_end, part, closed))
+            self._evict()
+
+    def _insert(self, segment: _Segment) -> None:
+        segments = self._segments.setdefault(segment.query, [])
+        # Another request may have cached part of the range meanwhile, the newer fetch replaces it
+        for other in [other for other in segments if other.start_ns < segment.end_ns and other.end_ns > segment.start_ns]:
+            self._remove(other)
+        if segment.closed:
+            for other in [other for other in segments if other.closed and
+                          (other.end_ns == segment.start_ns or other.start_ns == segment.end_ns)]:
+                self._remove(other)
+                first, second = (other, segment) if other.start_ns < segment.start_ns else (segment, other)
+                segment = _Segment(segment.query, first.start_ns, second.end_ns, first.entries + second.entries, True)
+        segments = self._segments.setdefault(segment.query, [])
+        segments.insert(bisect.bisect_left([other.start_ns for other in segments], segment.start_ns), segment)
+        self._lru[segment.id] = segment
+        self.nbytes += segment.nbytes
+
+    def _remove(self, segment: _Segment) -> None:
+        segments = self._segments.get(segment.query, [])
+        if segment in segments:
+            segments.remove(segment)
+            self._lru.pop(segment.id, None)
+            self.nbytes -= segment.nbytes
+        if not segments:
+            self._segments.pop(segment.query, None)
+
+    def _evict(self) -> None:
+        while self.nbytes > self.max_bytes and self._lru:
+            self._remove(next(iter(self._lru.values())))
+            self.stats["evictions"] += 1
+
+
+_cache: Optional[LokiResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_loki_result_cache() -> LokiResultCache:
+    """Return the process-wide Loki result cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LokiResultCache()
+        return _cache
@@ -0,0 +1,282 @@
+"""Live tail of a LogQL query over Loki's tail websocket, falling back to polling query_range."""
+import asyncio
+import base64
+import json
+import logging
+import time
+from calendar import timegm
+from collections import deque
+from time import strptime
+from typing import AsyncIterator, Optional
+from urllib.parse import urlencode
+
+from pydantic import ValidationError
+from websockets.asyncio.client import connect
+from websockets.exceptions import InvalidHandshake, WebSocketException
+
+from LoggingAgent.log_store import ASCTIME_FORMAT
+from LoggingAgent.loki_client import fetch_page, get_session, NANOS_PER_SECOND
+from LoggingAgent.schema import LogItem
+from consts import LOKI_TAIL_ENDPOINT, LOGS_FETCH_QUERY_ENDPOINT, LOKI_TAIL_BUFFER_SIZE, LOKI_TAIL_MAX_LINES_PER_SECOND, \
+    LOKI_TAIL_BURST_LINES, LOKI_TAIL_POLL_INTERVAL_SECONDS, LOKI_TAIL_RECONNECT_ATTEMPTS, LOKI_TAIL_IDLE_SECONDS, \
+    LOGS_PAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Admits up to rate events per second on average, with bursts of up to burst events."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+
+class TailBuffer:
+    """
+    Bounded ring buffer of the most recent tailed lines, with accounting of every line not kept.
+
+    Lines over the rate limit are dropped on arrival, lines pushed out by newer ones when the
+    buffer is full are counted as evicted, so the reader always knows how complete its window is.
+    """
+
+    def __init__(self, size: int = LOKI_TAIL_BUFFER_SIZE, max_lines_per_second: float = LOKI_TAIL_MAX_LINES_PER_SECOND,
+                 burst_lines: float = LOKI_TAIL_BURST_LINES):
+        self._items: deque[tuple[int, LogItem]] = deque(maxlen=size)
+        self._epoch_by_asctime: dict[str, int] = {}
+        self._limiter = TokenBucket(max_lines_per_second, burst_lines)
+        self.stats = {"received": 0, "kept": 0, "rate_limited": 0, "evicted": 0, "malformed": 0, "loki_dropped": 0}
+
+    def add(self, item: LogItem) -> bool:
+        """Add a line unless it is over the rate limit, returns whether it was kept."""
+        self.stats["received"] += 1
+        if not self._limiter.allow():
+            self.stats["rate_limited"] += 1
+            return False
+        if len(self._items) == self._items.maxlen:
+            self.stats["evicted"] += 1
+        epoch = self._epoch_by_asctime.get(item.asctime)
+        if epoch is None:
+            if len(self._epoch_by_asctime) > self._items.maxlen:
+                self._epoch_by_asctime.clear()
+            epoch = self._epoch_by_asctime[item.asctime] = timegm(strptime(item.asctime, ASCTIME_FORMAT))
+        self._items.append((epoch, item))
+        self.stats["kept"] += 1
+        return True
+
+    def window(self, last_seconds: Optional[float] = None) -> list[LogItem]:
+        """
+        Buffered lines, newest first.
+
+        Args:
+            last_seconds: Only lines from the last last_seconds, all buffered lines if None
+        """
+        cutoff = time.time() - last_seconds if last_seconds is not None else None
+        return [item for epoch, item in reversed(self._items) if cutoff is None or epoch >= cutoff]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+def tail_url(logql_query: str, start_ns: int, endpoint: str = LOKI_TAIL_ENDPOINT, limit: int = LOGS_PAGE_SIZE) -> str:
+    return f"{endpoint}?{urlencode({'query': logql_query, 'start': start_ns, 'limit': limit})}"
+
+
+def _auth_headers() -> dict[str, str]:
+    username, password = get_session().auth
+    token = base64.b64encode(f"{username}:{password}".encode('utf-8')).decode('ascii')
+    return {"Authorization": f"Basic {token}"}
+
+
+class LokiTail:
+    """
+    Follows a LogQL query from a starting point, yielding every new entry exactly once.
+
+    Entries come from Loki's tail websocket. When the connection drops it reconnects from the
+    last entry seen, and after LOKI_TAIL_RECONNECT_ATTEMPTS failures in a row it switches to
+    polling query_range forward from the same cursor every LOKI_TAIL_POLL_INTERVAL_SECONDS.
+    """
+
+    def __init__(self, logql_query: str, start_ns: Optional[int] = None, tail_endpoint: str = LOKI_TAIL_ENDPOINT,
+                 query_endpoint: str = LOGS_FETCH_QUERY_ENDPOINT,
+                 poll_interval_seconds: float = LOKI_TAIL_POLL_INTERVAL_SECONDS,
+                 reconnect_attempts: int = LOKI_TAIL_RECONNECT_ATTEMPTS):
+        self.logql_query = logql_query
+        self.tail_endpoint = tail_endpoint
+        self.query_endpoint = query_endpoint
+        self.poll_interval_seconds = poll_interval_seconds
+        self.reconnect_attempts = reconnect_attempts
+        self.mode = "websocket"
+        self.loki_dropped = 0
+        self._cursor = start_ns if start_ns is not None else time.time_ns()
+        # Lines already yielded at the cursor timestamp, tail and query_range both include the start
+        self._seen_at_cursor: set[str] = set()
+
+    async def entries(self) -> AsyncIterator[tuple[int, str]]:
+        """(timestamp in ns, raw line) of every new entry, oldest first, until the consumer stops."""
+        failures = 0
+        while failures < self.reconnect_attempts:
+            try:
+                async for entry in self._websocket_entries():
+                    failures = 0
+                    yield entry
+                failures += 1
+            except (OSError, InvalidHandshake, WebSocketException, asyncio.TimeoutError) as e:
+                failures += 1
+                logger.warning(f"Loki tail connection failed ({failures}/{self.reconnect_attempts}): {e}")
+            await asyncio.sleep(min(2 ** failures * 0.1, self.poll_interval_seconds))
+
+        logger.warning(f"Falling back to polling query_range every {self.poll_interval_seconds}s")
+        self.mode = "polling"
+        async for entry in self._polled_entries():
+            yield entry
+
+    def _advance(self, timestamp_ns: int, line: str) -> bool:
+        """Move the cursor to an entry, returns False if it was yielded before."""
+        if timestamp_ns < self._cursor or (timestamp_ns == self._cursor and line in self._seen_at_cursor):
+            return False
+        if timestamp_ns > self._cursor:
+            self._cursor = timestamp_ns
+            self._seen_at_cursor = set()
+        self._seen_at_cursor.add(line)
+        return True
+
+    async def _websocket_entries(self) -> AsyncIterator[tuple[int, str]]:
+        url = tail_url(self.logql_query, self._cursor, self.tail_endpoint)
+        async with connect(url, additional_headers=_auth_headers(), open_timeout=LOKI_TAIL_POLL_INTERVAL_SECONDS * 5) \
+                as websocket:
+            logger.info(f"Tailing {self.logql_query} from {self._cursor}")
+            async for message in websocket:
+                payload = json.loads(message)
+                self.loki_dropped += len(payload.get("dropped_entries") or [])
+                entries = [(int(value[0]), value[-1]) for stream in payload.get("streams", [])
+                           for value in stream.get("values", [])]
+                entries.sort(key=lambda entry: entry[0])
+                for timestamp_ns, line in entries:
+                    if self._advance(timestamp_ns, line):
+                        yield timestamp_ns, line
+
+    async def _polled_entries(self) -> AsyncIterator[tuple[int, str]]:
+        while True:
+            page = await asyncio.to_thread(fetch_page, self.logql_query, self._cursor, time.time_ns(), LOGS_PAGE_SIZE,
+                                           'forward', self.query_endpoint)
+            fresh = [(timestamp_ns, line) for timestamp_ns, line in page if self._advance(timestamp_ns, line)]
+            for entry in fresh:
+                yield entry
+            # A full page means there is more to catch up on right away
+            if len(page) < LOGS_PAGE_SIZE or not fresh:
+                await asyncio.sleep(self.poll_interval_seconds)
+
+
+async def tail_logs(tail: LokiTail, buffer: Optional[TailBuffer] = None) -> AsyncIterator[LogItem]:
+    """
+    Async generator of the LogItems of a live tail.
+
+    Args:
+        tail: Tail to follow
+        buffer: Malformed lines and entries Loki reports as dropped are accounted here when given
+
+    Yields:
+        LogItem: Every new valid line, oldest first
+    """
+    async for _, line in tail.entries():
+        if buffer is not None:
+            buffer.stats["loki_dropped"] = tail.loki_dropped
+        try:
+            yield LogItem.model_validate_json(line)
+        except ValidationError:
+            if buffer is not None:
+                buffer.stats["malformed"] += 1
+
+
+class LiveLogWindow:
+    """
+    Background tail of one query feeding a TailBuffer, so readers get a fresh sliding window
+    without re-downloading history. Stops by itself after LOKI_TAIL_IDLE_SECONDS without reads.
+    """
+
+    def __init__(self, logql_query: str, lookback_seconds: float = 0, buffer: Optional[TailBuffer] = None,
+                 **tail_options):
+        self.logql_query = logql_query
+        self.buffer = buffer if buffer is not None else TailBuffer()
+        self._start_ns = time.time_ns() - int(lookback_seconds * NANOS_PER_SECOND)
+        self._task: Optional[asyncio.Task] = None
+        self._first_line = asyncio.Event()
+        self._tail = LokiTail(logql_query, self._start_ns, **tail_options)
+        self._last_read = time.monotonic()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if not self.running:
+            self._task = asyncio.create_task(self._run(), name=f"loki-tail:{self.logql_query}")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def wait_for_lines(self, timeout_seconds: float) -> bool:
+        """Wait until the first line arrived, returns False if none did within timeout_seconds."""
+        try:
+            await asyncio.wait_for(self._first_line.wait(), timeout_seconds)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def window(self, last_seconds: Optional[float] = None) -> list[LogItem]:
+        """Current lines in the buffer, newest first, see TailBuffer.window."""
+        self._last_read = time.monotonic()
+        return self.buffer.window(last_seconds)
+
+    def status(self) -> dict:
+        return {"mode": self._tail.mode, "buffered": len(self.buffer), **self.buffer.stats}
+
+    async def _run(self) -> None:
+        consumer = asyncio.create_task(self._consume())
+        try:
+            while True:
+                idle_for = time.monotonic() - self._last_read
+                if idle_for >= LOKI_TAIL_IDLE_SECONDS:
+                    logger.info(f"Stopping idle tail of {self.logql_query}")
+                    return
+                done, _ = await asyncio.wait([consumer], timeout=LOKI_TAIL_IDLE_SECONDS - idle_for)
+                if done:
+                    if consumer.exception() is not None:
+                        logger.error(f"Tail of {self.logql_query} failed: {consumer.exception()}")
+                    return
+        finally:
+            consumer.cancel()
+            await asyncio.gather(consumer, return_exceptions=True)
+
+    async def _consume(self) -> None:
+        async for item in tail_logs(self._tail, self.buffer):
+            self.buffer.add(item)
+            self._first_line.set()
+
+
+_windows: dict[tuple[str, int], LiveLogWindow] = {}
+
+
+def get_live_window(logql_query: str, lookback_seconds: float = 0) -> LiveLogWindow:
+    """Return the running live window of a query on the current event loop, starting one if needed."""
+    key = (logql_query, id(asyncio.get_running_loop()))
+    window = _windows.get(key)
+    if window is None or not window.running:
+        window = _windows[key] = LiveLogWindow(logql_query, lookback_seconds)
+        window.start()
+    return window
@@ -0,0 +1,219 @@
+"""Vectorized extraction of numeric metrics from log messages and anomaly detection over them."""
+import logging
+import re
+from datetime import datetime, timezone
+
+import numpy as np
+
+from LoggingAgent.log_store import LogColumns, ASCTIME_FORMAT
+from LoggingAgent.schema import AnomalyReport, AnomalyWindow, MetricSeriesSummary
+from consts import ANOMALY_BUCKET_SECONDS, ANOMALY_ZSCORE_THRESHOLD, ANOMALY_CHANGE_POINT_WINDOW, ANOMALY_CHANGE_POINT_THRESHOLD, \
+    ANOMALY_MAX_WINDOWS
+
+logger = logging.getLogger(__name__)
+
+NUMBER = r'(\d+(?:\.\d+)?)'
+
+# Message shapes from system_prompts/sample_logs_wiki.md
+METRIC_PATTERNS = {
+    'rate_msg_per_sec': re.compile(rf'(?:Rate:|Processing rate) {NUMBER} msg/sec'),
+    'memory_mb': re.compile(rf'Memory(?: usage \w+)?: {NUMBER}MB'),
+    'queue_depth': re.compile(rf'Queue(?: backlog)?: {NUMBER}\b'),
+    'processing_ms': re.compile(rf'Processing(?: latency elevated| performance degraded)?: {NUMBER}ms'),
+    'staleness_ms': re.compile(rf'orderbook \d+ aged {NUMBER}ms'),
+}
+
+# Documented limits under "Key Thresholds & Metrics" in the sample logs wiki
+METRIC_THRESHOLDS = {
+    'memory_mb': 150.0,
+    'processing_ms': 50.0,
+    'queue_depth': 100.0,
+    'staleness_ms': 1000.0,
+}
+
+
+class MetricSeries:
+    """Aligned epoch-second timestamps and values of one metric, ordered by time."""
+
+    def __init__(self, metric: str, times: np.ndarray, values: np.ndarray):
+        order = np.argsort(times, kind='stable')
+        self.metric = metric
+        self.times = times[order]
+        self.values = values[order]
+
+    def resample(self, start: int, end: int, bucket_seconds: int, how: str = 'max') -> np.ndarray:
+        """
+        Aggregate the series into fixed buckets covering [start, end].
+
+        Args:
+            start: First epoch second of the first bucket
+            end: Last epoch second covered
+            bucket_seconds: Bucket width
+            how: 'max' or 'mean' per bucket
+
+        Returns:
+            np.ndarray: One value per bucket, NaN where the bucket holds no sample
+
+        Raises:
+            ValueError: If bucket_seconds is not positive
+        """
+        if bucket_seconds <= 0:
+            raise ValueError(f"bucket_seconds must be positive, got {bucket_seconds}")
+        buckets = (end - start) // bucket_seconds + 1
+        index = ((self.times - start) // bucket_seconds).astype(np.int64)
+        counts = np.bincount(index, minlength=buckets)
+        if how == 'mean':
+            sums = np.bincount(index, weights=self.values, minlength=buckets)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return sums / counts
+        result = np.full(buckets, -np.inf)
+        np.maximum.at(result, index, self.values)
+        result[counts == 0] = np.nan
+        return result
+
+
+def extract_series(logs: LogColumns) -> dict[str, MetricSeries]:
+    """
+    Parse every known metric out of the log messages.
+
+    Each pattern runs once over all messages joined by newlines, which none of them can
+    match across, and its matches are mapped back to rows by offset. Only the first match
+    of a row is kept, as a search per message would.
+
+    Args:
+        logs: Fetched log lines
+
+    Returns:
+        dict[str, MetricSeries]: Series per metric that occurs at least once
+    """
+    epochs = np.asarray(logs.epoch_seconds(), dtype=np.int64)
+    text, starts = logs.joined_messages()
+    starts = np.frombuffer(starts, dtype=np.uint64).astype(np.int64)
+    series = {}
+    for metric, pattern in METRIC_PATTERNS.items():
+        matches = list(pattern.finditer(text))
+        if not matches:
+            continue
+        positions = np.fromiter((match.start() for match in matches), dtype=np.int64, count=len(matches))
+        rows, first = np.unique(np.searchsorted(starts, positions, side='right') - 1, return_index=True)
+        values = np.fromiter((float(match.group(1)) for match in matches), dtype=np.float64, count=len(matches))
+        series[metric] = MetricSeries(metric, epochs[rows], values[first])
+    return series
+
+
+def _runs(flags: np.ndarray) -> list[tuple[int, int]]:
+    """(first, last) bucket indices of every run of consecutive True flags."""
+    padded = np.concatenate(([False], flags, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    return list(zip(edges[::2], edges[1::2] - 1))
+
+
+def _zscores(buckets: np.ndarray) -> np.ndarray:
+    """Robust z-scores against the median and MAD of the non-empty buckets."""
+    present = buckets[~np.isnan(buckets)]
+    median = np.median(present)
+    mad = np.median(np.abs(present - median)) * 1.4826
+    scale = mad if mad > 0 else (np.std(present) or 1.0)
+    return (buckets - median) / scale
+
+
+def _change_points(buckets: np.ndarray, window: int) -> np.ndarray:
+    """
+    Mean-shift statistic per bucket: difference of the means of the window after and before
+    it, in units of the pooled standard deviation. Computed with cumulative sums.
+    """
+    filled = np.where(np.isnan(buckets), np.nanmedian(buckets), buckets)
+    n = len(filled)
+    scores = np.zeros(n)
+    if n < 2 * window:
+        return scores
+    csum = np.concatenate(([0.0], np.cumsum(filled)))
+    csq = np.concatenate(([0.0], np.cumsum(filled ** 2)))
+    idx = np.arange(window, n - window + 1)
+    before_mean = (csum[idx] - csum[idx - window]) / window
+    after_mean = (csum[idx + window] - csum[idx]) / window
+    before_var = (csq[idx] - csq[idx - window]) / window - before_mean ** 2
+    after_var = (csq[idx + window] - csq[idx]) / window - after_mean ** 2
+    pooled = np.sqrt(np.maximum((before_var + after_var) / 2, 0)) + 1e-9
+    scores[idx] = (after_mean - before_mean) / pooled
+    return scores
+
+
+def detect_anomalies(logs: LogColumns, bucket_seconds: int = ANOMALY_BUCKET_SECONDS,
+                     max_windows: int = ANOMALY_MAX_WINDOWS) -> AnomalyReport:
+    """
+    Resample every metric to fixed buckets and flag threshold breaches, z-score outliers and mean shifts.
+
+    Args:
+        logs: Fetched log lines
+        bucket_seconds: Bucket width used for resampling
+        max_windows: Maximum number of windows reported, the most extreme ones are kept
+
+    Returns:
+        AnomalyReport: Per-metric statistics and the anomalous windows, oldest first
+    """
+    series = extract_series(logs)
+    epochs = logs.epoch_seconds()
+    windows: list[tuple[float, AnomalyWindow]] = []
+    summaries = []
+
+    if series:
+        start, end = min(epochs), max(epochs)
+
+        def to_time(bucket: int) -> str:
+            return datetime.fromtimestamp(start + bucket * bucket_seconds, tz=timezone.utc).strftime(ASCTIME_FORMAT)
+
+        def add_windows(metric: str, kind: str, flags: np.ndarray, buckets: np.ndarray, baseline: float,
+                        severity: np.ndarray) -> None:
+            for first, last in _runs(flags):
+                peak_index = first + int(np.nanargmax(np.abs(severity[first:last + 1])))
+                windows.append((float(np.abs(severity[peak_index])), AnomalyWindow(
+                    metric=metric,
+                    kind=kind,
+                    from_time=to_time(first),
+                    to_time=to_time(last + 1),
+                    peak=float(buckets[peak_index]),
+                    baseline=baseline,
+                )))
+
+        for metric, metric_series in series.items():
+            values = metric_series.values
+            summaries.append(MetricSeriesSummary(
+                metric=metric, samples=len(values), min=float(values.min()), max=float(values.max()),
+                mean=float(values.mean())
+            ))
+            buckets = metric_series.resample(start, end, bucket_seconds, how='max')
+            present = ~np.isnan(buckets)
+            if not present.any():
+                continue
+
+            threshold = METRIC_THRESHOLDS.get(metric)
+            if threshold is not None:
+                flags = present & (np.nan_to_num(buckets, nan=-np.inf) > threshold)
+                add_windows(metric, 'threshold', flags, buckets, threshold, np.where(present, buckets / threshold, 0))
+
+            zscores = np.nan_to_num(_zscores(buckets))
+            add_windows(metric, 'zscore', np.abs(zscores) > ANOMALY_ZSCORE_THRESHOLD, buckets,
+                        float(np.nanmedian(buckets)), zscores)
+
+            means = metric_series.resample(start, end, bucket_seconds, how='mean')
+            shifts = _change_points(means, ANOMALY_CHANGE_POINT_WINDOW)
+            # Only the strongest bucket of each run of high scores is the change point itself
+            for first, last in _runs(np.abs(shifts) > ANOMALY_CHANGE_POINT_THRESHOLD):
+                point = first + int(np.argmax(np.abs(shifts[first:last + 1])))
+                flags = np.zeros(len(shifts), dtype=bool)
+                flags[point] = True
+                before = means[max(0, point - ANOMALY_CHANGE_POINT_WINDOW):point]
+                # Buckets before the shift may all be empty, their gaps were filled with the median
+                baseline = np.nanmean(before) if (~np.isnan(before)).any() else np.nanmedian(means)
+                add_windows(metric, 'change_point', flags, means, float(baseline), shifts)
+
+    kept = sorted(windows, key=lambda scored: -scored[0])[:max_windows]
+    report = AnomalyReport(
+        bucket_seconds=bucket_seconds,
+        total_lines=len(logs),
+        metrics=summaries,
+        windows=sorted((window for _, window in kept), key=lambda window: window.from_time),
+    )
+    logger.info(f"Found {len(windows)} anomalous windows in {len(series)} metrics over {len(logs)} lines")
+    return report
@@ -1,6 +1,7 @@
-from typing import Optional, Literal
-from pydantic import BaseModel, Field
+from typing import Annotated, Optional, Literal
+from pydantic import BaseModel, Field, StringConstraints
 from datetime import datetime
+from typing_extensions import TypedDict
 
 class LogQLOutput(BaseModel):
     """Output of a natural language to LogQL query request"""
@@ -24,6 +25,18 @@ class LogQLOutput(BaseModel):
         return v
 
 
+class LogQLMetricOutput(LogQLOutput):
+    """Output of a natural language to LogQL metric query request"""
+    logql_query: str = Field(
+        description="LogQL metric query, a range aggregation such as count_over_time, rate or quantile_over_time "
+                    "over an unwrapped field, with [$__interval] as its range"
+    )
+    step_seconds: Optional[int] = Field(
+        default=None,
+        description="Resolution in seconds if the query asks for one, e.g. 300 for 'per 5 minutes', else null"
+    )
+
+
 class LogItem(BaseModel):
     asctime: str = Field(description="Time in UTC in format: YYY-MM-DD HH:MM:SS UTC")
     name: str = Field(description="Logging file name without extension")
@@ -37,5 +50,118 @@ class LogItem(BaseModel):
         return f"[{self.funcName} - {self.lineno}] - [{self.levelname}] - {self.message}"
 
 
+class LogRecord(TypedDict):
+    """
+    Fields of a LogItem as a plain dict, validated without building a model per line.
+
+    Stricter than LogItem where the columnar store needs it: asctime must start with
+    YYYY-MM-DD HH:MM:SS and lineno must fit a 32-bit int.
+    """
+    asctime: Annotated[str, StringConstraints(pattern=r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}')]
+    name: str
+    levelname: Literal['INFO', 'WARNING', 'ERROR']
+    filename: str
+    lineno: Annotated[int, Field(ge=-2 ** 31, lt=2 ** 31)]
+    funcName: str
+    message: str
+
+
+class NumericFieldSummary(BaseModel):
+    """Distribution of one number extracted from a log message template"""
+    field: str = Field(description="Word preceding the number in the template, e.g. 'Memory' or 'aged'")
+    min: float
+    max: float
+    p50: float
+    p90: float
+    p99: float
+
+
+class LogTemplateSummary(BaseModel):
+    """All log lines sharing one message template once numbers and ids are masked"""
+    template: str = Field(description="Message with numbers replaced by <num> and ids by <id>")
+    levelname: str
+    name: str = Field(description="Logger name of the lines")
+    count: int = Field(description="Number of lines matching the template")
+    first_seen: str = Field(description="asctime of the oldest matching line")
+    last_seen: str = Field(description="asctime of the newest matching line")
+    numbers: list[NumericFieldSummary] = Field(default_factory=list, description="Per-number statistics")
+    exemplars: list[LogItem] = Field(default_factory=list, description="A few raw lines matching the template")
+
+
+class LogSummary(BaseModel):
+    """Bounded-size condensation of a log fetch"""
+    total_lines: int = Field(description="Number of lines condensed")
+    template_count: int = Field(description="Number of distinct templates seen")
+    templates: list[LogTemplateSummary] = Field(description="Most frequent templates, errors and warnings first")
+    other_lines: int = Field(default=0, description="Lines belonging to templates left out of the summary")
+
+
+class MetricSeriesSummary(BaseModel):
+    """Overall statistics of one metric parsed out of log messages"""
+    metric: str
+    samples: int = Field(description="Number of log lines carrying the metric")
+    min: float
+    max: float
+    mean: float
+
+
+class AnomalyWindow(BaseModel):
+    """A time window in which a metric behaved abnormally"""
+    metric: str
+    kind: Literal['threshold', 'zscore', 'change_point']
+    from_time: str = Field(description="Window start in format YYYY-MM-DD HH:MM:SS")
+    to_time: str = Field(description="Window end in format YYYY-MM-DD HH:MM:SS")
+    peak: float = Field(description="Most extreme bucket value inside the window")
+    baseline: float = Field(description="Threshold, median or pre-change mean the window is compared against")
+
+
+class AnomalyReport(BaseModel):
+    """Anomalous windows found in metrics extracted from logs"""
+    bucket_seconds: int
+    total_lines: int
+    metrics: list[MetricSeriesSummary]
+    windows: list[AnomalyWindow]
+
+
+class LogQLMetricSeries(BaseModel):
+    """One series of a LogQL metric query, its values aligned with the result's times"""
+    labels: dict[str, str] = Field(description="Labels identifying the series, empty when fully aggregated")
+    values: list[Optional[float]] = Field(description="Value at each of the result's times, null without a sample")
+    total: float = Field(description="Sum of the values, the total count for count_over_time")
+    min: float
+    max: float
+    mean: float
+    last: float = Field(description="Latest non-null value")
+
+
+class LogQLMetricResult(BaseModel):
+    """Compact matrix returned by a LogQL metric query"""
+    logql_query: str = Field(description="Query as executed, with $__interval replaced by the step")
+    step_seconds: int = Field(description="Distance between consecutive evaluation times")
+    times: list[str] = Field(
+        description="End of each step in format YYYY-MM-DD HH:MM:SS, only the steps in which any series has a sample"
+    )
+    series: list[LogQLMetricSeries] = Field(description="Series with the highest peak first")
+    other_series: int = Field(default=0, description="Series left out of the result")
+
+class TailStatus(BaseModel):
+    """Health of a live tail and accounting of the lines it did not keep"""
+    mode: Literal['websocket', 'polling'] = Field(description="How new lines are received")
+    buffered: int = Field(description="Lines currently in the ring buffer")
+    received: int = Field(description="Valid lines received since the tail started")
+    kept: int = Field(description="Lines admitted into the buffer")
+    rate_limited: int = Field(description="Lines dropped for exceeding the rate limit")
+    evicted: int = Field(description="Lines pushed out of the full buffer by newer ones")
+    malformed: int = Field(description="Lines that were not valid log entries")
+    loki_dropped: int = Field(description="Entries Loki reported as dropped from the tail")
+
+
+class LiveLogs(BaseModel):
+    """Sliding window of a live tail"""
+    logs: list[LogItem] = Field(description="Lines of the window, newest first")
+    status: TailStatus
+
+
 class LogAgentOutput(BaseModel):
-    logs: list[LogItem] = Field(description="List of log entries")
\ No newline at end of file
+    logs: list[LogItem] = Field(description="List of log entries")
+    summary: Optional[LogSummary] = Field(default=None, description="Condensed summary of the logs, if one was fetched")
\ No newline at end of file
@@ -0,0 +1,9 @@
+from LoggingAgent.condense import mask_message
+
+
+def test_repeated_labels_are_numbered_in_order():
+    template, labels, values = mask_message("Queue 3, Queue 7, Queue 12 above limit 10")
+
+    assert template == "Queue <num>, Queue <num>, Queue <num> above limit <num>"
+    assert labels == ["Queue", "Queue_2", "Queue_3", "limit"]
+    assert values == [3.0, 7.0, 12.0, 10.0]
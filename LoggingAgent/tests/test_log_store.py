@@ -0,0 +1,60 @@
+import json
+
+from LoggingAgent.log_store import LogColumns
+
+
+def log_line(asctime: str = '2025-06-15 14:30:00', lineno=42, **fields) -> str:
+    entry = {"asctime": asctime, "name": "publisher", "levelname": "ERROR", "filename": "publisher.py",
+             "lineno": lineno, "funcName": "check_staleness", "message": "Orderbook stale"}
+    return json.dumps(entry | fields)
+
+
+def test_asctime_is_kept_as_logged():
+    table = LogColumns.from_lines([log_line('2025-06-15 14:30:00,123'), log_line('2025-06-15 14:30:01 UTC')])
+
+    assert [item.asctime for item in table] == ['2025-06-15 14:30:00,123', '2025-06-15 14:30:01 UTC']
+    assert table.epoch_seconds() == [1749997800, 1749997801]
+    assert table.malformed == 0
+
+
+def test_lineno_follows_log_item_rules():
+    table = LogColumns.from_lines([log_line(lineno="7"), log_line(lineno=7.5), log_line(lineno=None)])
+
+    assert [item.lineno for item in table] == [7]
+    assert table.malformed == 2
+
+
+def test_out_of_range_lineno_skips_only_that_line():
+    table = LogColumns.from_lines([log_line(lineno=2 ** 40), log_line(message="kept")])
+
+    assert [item.message for item in table] == ["kept"]
+    assert table.malformed == 1
+
+
+def test_records_and_lines_build_the_same_table():
+    lines = [log_line(), log_line('not a time'), '{"truncated', log_line(levelname='DEBUG'), log_line(message="b")]
+    records = [json.loads(line) if line.startswith('{"a') else None for line in lines]
+
+    from_lines, from_records = LogColumns.from_lines(lines), LogColumns.from_records(records)
+
+    assert from_lines.to_log_items() == from_records.to_log_items()
+    assert len(from_lines) == 2
+    assert from_lines.malformed == from_records.malformed == 3
+
+
+def test_impossible_date_skips_only_that_line():
+    table = LogColumns.from_lines([log_line('2025-13-45 14:30:00'), log_line(message="kept")])
+
+    assert [item.message for item in table] == ["kept"]
+    assert table.malformed == 1
+
+
+def test_lines_spanning_several_decode_batches_keep_their_order(monkeypatch):
+    monkeypatch.setattr('LoggingAgent.log_store.LOGS_DECODE_BATCH_SIZE', 3)
+    lines = [log_line(f'2025-06-15 14:30:0{second}', lineno=second) for second in range(8)]
+
+    table = LogColumns.from_lines(lines[:5] + ['{"truncated'] + lines[5:])
+
+    assert [item.lineno for item in table] == list(range(8))
+    assert table.epoch_seconds() == [1749997800 + second for second in range(8)]
+    assert table.malformed == 1
@@ -0,0 +1,25 @@
+from LoggingAgent.logql_cache import LogQLCache
+from LoggingAgent.schema import LogQLOutput
+
+
+def test_only_relative_time_queries_roll_over_with_the_time_bucket():
+    cache = LogQLCache(db_path=None, time_bucket_seconds=300)
+
+    def keys(query: str) -> set[str]:
+        return {cache.make_key(query, "publisher", "prompt", now=now) for now in (0, 299, 300, 3600)}
+
+    assert len(keys("Show staleness errors")) == 1
+    assert len(keys("Show staleness errors on 2025-06-15 between 14:00 and 15:00")) == 1
+    assert len(keys("Show staleness errors in the last hour")) == 3
+    assert len(keys("Show staleness errors after 14:00")) == 3
+
+
+def test_time_range_resolved_against_now_is_not_cacheable():
+    ranged = LogQLOutput(logql_query='{application="publisher"}', from_time="2025-06-15 14:00:00",
+                         to_time="2025-06-15 15:00:00")
+    unranged = LogQLOutput(logql_query='{application="publisher"}')
+
+    assert LogQLCache.cacheable("Show staleness errors", unranged)
+    assert not LogQLCache.cacheable("Show staleness errors", ranged)
+    assert LogQLCache.cacheable("Show staleness errors on 2025-06-15 between 14:00 and 15:00", ranged)
+    assert LogQLCache.cacheable("Show staleness errors today", ranged)
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from LoggingAgent.fake_loki import synthetic_entries
+from LoggingAgent.loki_async import afetch_entries_sharded
+from LoggingAgent.loki_client import PageCursor, iter_log_entries, iter_log_entries_sharded
+
+QUERY = '{application="marketdata-publisher"}'
+BASE_NS = 1_750_000_000_000_000_000
+
+
+def entries_with_shared_timestamps(count: int, per_timestamp: int) -> list[tuple[int, str]]:
+    """count lines, per_timestamp of them logged at the same nanosecond, oldest first."""
+    return [(BASE_NS + (i // per_timestamp) * 1_000, f"line {i}") for i in range(count)]
+
+
+def test_backward_paging_returns_every_line_once_newest_first(fake_loki):
+    entries = entries_with_shared_timestamps(47, per_timestamp=3)
+    loki = fake_loki(entries)
+
+    fetched = list(iter_log_entries(QUERY, entries[0][0], entries[-1][0] + 1, page_size=5, max_lines=1000,
+                                    endpoint=loki.endpoint))
+
+    assert sorted(fetched) == sorted(entries)
+    assert [ts for ts, _ in fetched] == sorted((ts for ts, _ in fetched), reverse=True)
+    assert loki.request_count > 47 // 5
+
+
+def test_forward_paging_returns_every_line_once_oldest_first(fake_loki):
+    entries = entries_with_shared_timestamps(47, per_timestamp=4)
+    loki = fake_loki(entries)
+
+    fetched = list(iter_log_entries(QUERY, entries[0][0], entries[-1][0] + 1, direction='forward', page_size=5,
+                                    max_lines=1000, endpoint=loki.endpoint))
+
+    assert sorted(fetched) == sorted(entries)
+    assert [ts for ts, _ in fetched] == sorted(ts for ts, _ in fetched)
+
+
+def test_paging_stops_at_the_line_budget(fake_loki):
+    entries = synthetic_entries(100, end_ns=BASE_NS, step_ns=1_000_000)
+    loki = fake_loki(entries)
+
+    fetched = list(iter_log_entries(QUERY, entries[0][0], entries[-1][0] + 1, page_size=10, max_lines=25,
+                                    endpoint=loki.endpoint))
+
+    assert fetched == entries[::-1][:25]
+    assert loki.request_count == 3
+
+
+def test_more_lines_at_one_timestamp_than_a_page_still_terminates(fake_loki):
+    entries = entries_with_shared_timestamps(12, per_timestamp=12) + [(BASE_NS + 10**9, "newest")]
+    loki = fake_loki(entries)
+
+    fetched = list(iter_log_entries(QUERY, entries[0][0], entries[-1][0] + 1, page_size=5, max_lines=1000,
+                                    endpoint=loki.endpoint))
+
+    assert fetched[0] == (BASE_NS + 10**9, "newest")
+    assert len(fetched) == len(set(fetched))
+    assert loki.request_count < 10
+
+
+def test_cursor_drops_lines_already_returned_at_the_page_edge():
+    cursor = PageCursor(0, 100, 'backward', page_size=3, max_lines=10)
+
+    assert cursor.advance([(90, "a"), (80, "b"), (70, "c")]) == [(90, "a"), (80, "b"), (70, "c")]
+    assert cursor.end_ns == 71
+    assert cursor.advance([(70, "c"), (70, "d"), (60, "e")]) == [(70, "d"), (60, "e")]
+    assert cursor.advance([(50, "f")]) == [(50, "f")]
+    assert cursor.done
+
+
+@pytest.mark.parametrize("direction", ['backward', 'forward'])
+@pytest.mark.parametrize("max_lines", [120, 1000])
+def test_sharded_fetch_returns_what_the_unsharded_one_does(fake_loki, direction, max_lines):
+    entries = synthetic_entries(400, end_ns=BASE_NS, step_ns=1_000_000)
+    loki = fake_loki(entries)
+    window = (QUERY, entries[0][0], entries[-1][0] + 1)
+
+    unsharded = list(iter_log_entries(*window, direction, page_size=50, max_lines=max_lines, endpoint=loki.endpoint))
+    sharded = list(iter_log_entries_sharded(*window, shards=4, direction=direction, page_size=50,
+                                            max_lines=max_lines, endpoint=loki.endpoint))
+    async_sharded = asyncio.run(afetch_entries_sharded(*window, shards=4, direction=direction, page_size=50,
+                                                       max_lines=max_lines, endpoint=loki.endpoint))
+
+    assert sharded == unsharded
+    assert async_sharded == unsharded
+
+
+def test_sharded_fetch_stops_once_the_newest_shards_fill_the_budget(fake_loki):
+    entries = synthetic_entries(400, end_ns=BASE_NS, step_ns=1_000_000)
+    loki = fake_loki(entries, latency_seconds=0.02)
+
+    fetched = list(iter_log_entries_sharded(QUERY, entries[0][0], entries[-1][0] + 1, shards=4, page_size=20,
+                                            max_lines=40, endpoint=loki.endpoint))
+
+    assert fetched == entries[::-1][:40]
+    assert loki.request_count < 400 // 20
+
+
+def test_budget_of_one_page_is_fetched_unsharded(fake_loki):
+    entries = synthetic_entries(400, end_ns=BASE_NS, step_ns=1_000_000)
+    loki = fake_loki(entries)
+
+    fetched = list(iter_log_entries_sharded(QUERY, entries[0][0], entries[-1][0] + 1, shards=4, page_size=50,
+                                            max_lines=50, endpoint=loki.endpoint))
+
+    assert fetched == entries[::-1][:50]
+    assert loki.request_count == 1
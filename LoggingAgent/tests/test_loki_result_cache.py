@@ -0,0 +1,103 @@
+from LoggingAgent.fake_loki import synthetic_entries
+from LoggingAgent.loki_client import iter_entries
+from LoggingAgent.loki_result_cache import LokiResultCache, normalize_logql
+
+QUERY = '{application="marketdata-publisher"} |~ "(?i)stale"'
+BASE_NS = 1_750_000_000_000_000_000
+
+
+class FakeFetch:
+    """Answers fetches from a fixed list of entries the way Loki would, recording every call."""
+
+    def __init__(self, entries: list[tuple[int, str]]):
+        self.entries = sorted(entries)
+        self.calls: list[tuple[int, int, str, int]] = []
+
+    def __call__(self, start_ns: int, end_ns: int, direction: str, limit: int) -> list[tuple[int, str]]:
+        self.calls.append((start_ns, end_ns, direction, limit))
+        return self.expected(start_ns, end_ns, direction, limit)
+
+    def expected(self, start_ns: int, end_ns: int, direction: str, limit: int) -> list[tuple[int, str]]:
+        window = [entry for entry in self.entries if start_ns <= entry[0] < end_ns]
+        return (window[::-1] if direction == 'backward' else window)[:limit]
+
+
+def entries_with_shared_timestamps(count: int, per_timestamp: int) -> list[tuple[int, str]]:
+    return [(BASE_NS + (i // per_timestamp) * 1_000, f"line {i}") for i in range(count)]
+
+
+def test_truncated_backward_fetch_caches_only_past_the_edge_timestamp():
+    fetch = FakeFetch(entries_with_shared_timestamps(100, per_timestamp=4))
+    start_ns, end_ns = BASE_NS, BASE_NS + 100_000
+    cache = LokiResultCache()
+
+    first = list(cache.entries(QUERY, start_ns, end_ns, 'backward', 10, fetch))
+    second = list(cache.entries(QUERY, start_ns, end_ns, 'backward', 30, fetch))
+
+    edge_ts = first[-1][0]
+    assert first == fetch.expected(start_ns, end_ns, 'backward', 10)
+    assert second == fetch.expected(start_ns, end_ns, 'backward', 30)
+    # The lines of the edge timestamp were cut by the budget, they are fetched again with the rest
+    assert fetch.calls == [(start_ns, end_ns, 'backward', 10), (start_ns, edge_ts + 1, 'backward', 22)]
+
+
+def test_truncated_forward_fetch_caches_only_before_the_edge_timestamp():
+    fetch = FakeFetch(entries_with_shared_timestamps(100, per_timestamp=3))
+    start_ns, end_ns = BASE_NS, BASE_NS + 100_000
+    cache = LokiResultCache()
+
+    first = list(cache.entries(QUERY, start_ns, end_ns, 'forward', 10, fetch))
+    second = list(cache.entries(QUERY, start_ns, end_ns, 'forward', 25, fetch))
+
+    edge_ts = first[-1][0]
+    assert second == fetch.expected(start_ns, end_ns, 'forward', 25)
+    assert fetch.calls[1] == (edge_ts, end_ns, 'forward', 16)
+
+
+def test_complete_fetch_is_served_from_cache_afterwards():
+    fetch = FakeFetch(entries_with_shared_timestamps(20, per_timestamp=1))
+    start_ns, end_ns = BASE_NS, BASE_NS + 100_000
+    cache = LokiResultCache()
+
+    list(cache.entries(QUERY, start_ns, end_ns, 'backward', 50, fetch))
+    narrower = list(cache.entries(' ' + QUERY.replace('} |~', '}|~'), start_ns + 5_000, end_ns, 'forward', 50, fetch))
+
+    assert narrower == fetch.expected(start_ns + 5_000, end_ns, 'forward', 50)
+    assert len(fetch.calls) == 1
+    assert cache.stats["cached_lines"] == 15
+
+
+def test_only_the_uncovered_gap_is_fetched():
+    fetch = FakeFetch(entries_with_shared_timestamps(40, per_timestamp=1))
+    cache = LokiResultCache()
+
+    list(cache.entries(QUERY, BASE_NS + 10_000, BASE_NS + 20_000, 'backward', 100, fetch))
+    result = list(cache.entries(QUERY, BASE_NS, BASE_NS + 40_000, 'backward', 100, fetch))
+
+    assert result == fetch.expected(BASE_NS, BASE_NS + 40_000, 'backward', 100)
+    assert fetch.calls[1:] == [(BASE_NS + 20_000, BASE_NS + 40_000, 'backward', 100),
+                               (BASE_NS, BASE_NS + 10_000, 'backward', 70)]
+
+
+def test_truncated_sharded_fetch_leaves_the_older_lines_uncached(fake_loki):
+    entries = synthetic_entries(400, end_ns=BASE_NS, step_ns=1_000_000_000)
+    loki = fake_loki(entries)
+    start_ns, end_ns = entries[0][0], entries[-1][0] + 1
+    cache = LokiResultCache()
+
+    first = list(iter_entries(QUERY, start_ns, end_ns, page_size=20, max_lines=50, endpoint=loki.endpoint,
+                              shards=4, cache=cache))
+    edge_ts = first[-1][0]
+    requests_before = loki.request_count
+    older = list(iter_entries(QUERY, start_ns, edge_ts, page_size=20, max_lines=1000, endpoint=loki.endpoint,
+                              shards=4, cache=cache))
+
+    assert first == entries[::-1][:50]
+    assert older == [entry for entry in entries[::-1] if entry[0] < edge_ts]
+    assert loki.request_count > requests_before
+    assert cache.stats["cached_lines"] == 0
+
+
+def test_whitespace_outside_literals_does_not_change_the_key():
+    assert normalize_logql('{app = "a b"}  |~  "x  y"') == normalize_logql('{app="a b"}|~"x  y"')
+    assert normalize_logql('{app="a b"}') != normalize_logql('{app="a  b"}')
@@ -0,0 +1,60 @@
+import json
+import math
+import warnings
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from LoggingAgent.log_store import LogColumns
+from LoggingAgent.metrics import MetricSeries, detect_anomalies, extract_series
+
+START = 1_750_000_000
+
+
+def table(messages: list[tuple[int, str]]) -> LogColumns:
+    return LogColumns.from_lines(json.dumps({
+        "asctime": datetime.fromtimestamp(epoch, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+        "name": "publisher", "levelname": "INFO", "filename": "publisher.py", "lineno": 1,
+        "funcName": "report_status", "message": message,
+    }) for epoch, message in messages)
+
+
+def test_extraction_keeps_the_first_match_of_each_row_only():
+    logs = table([(START, "Memory: 120MB, Memory: 999MB"), (START + 1, "Queue"), (START + 2, ": 5 Memory: 80.5MB")])
+
+    series = extract_series(logs)
+
+    assert series['memory_mb'].times.tolist() == [START, START + 2]
+    assert series['memory_mb'].values.tolist() == [120.0, 80.5]
+    assert 'queue_depth' not in series
+
+
+def test_extraction_over_a_filtered_view_maps_matches_to_its_rows():
+    logs = table([(START + i, f"Queue: {i}") for i in range(6)])
+
+    series = extract_series(logs.filter(from_epoch=START + 2)[1:])
+
+    assert series['queue_depth'].values.tolist() == [3.0, 4.0, 5.0]
+    assert series['queue_depth'].times.tolist() == [START + 3, START + 4, START + 5]
+
+
+def test_resample_rejects_empty_buckets():
+    series = MetricSeries('queue_depth', np.array([START]), np.array([1.0]))
+
+    with pytest.raises(ValueError):
+        series.resample(START, START + 60, 0)
+
+
+def test_change_point_after_a_gap_has_a_finite_baseline():
+    steady = [(START + 60 * i, "Queue: 10") for i in range(10)]
+    burst = [(START + 60 * i, "Queue: 1000") for i in range(15, 20)]
+    after = [(START + 60 * i, "Queue: 10") for i in range(20, 30)]
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', RuntimeWarning)
+        report = detect_anomalies(table(steady + burst + after), bucket_seconds=60)
+
+    change_points = [window for window in report.windows if window.kind == 'change_point']
+    assert change_points
+    assert all(math.isfinite(window.baseline) for window in change_points)
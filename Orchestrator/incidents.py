@@ -0,0 +1,126 @@
+"""Checkpointed incident investigations that resume from the state saved for an incident id."""
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from langgraph.graph.state import CompiledStateGraph
+
+from consts import INCIDENTS_DB_PATH
+from instrumentation import instrumented_run
+from ledger import FetchLedger, fetch_ledger, log_key
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def incident_checkpointer(path: str = INCIDENTS_DB_PATH) -> AsyncIterator[AsyncSqliteSaver]:
+    """
+    SQLite checkpointer persisting every incident's graph state on local disk.
+
+    Args:
+        path: SQLite database file
+
+    Yields:
+        AsyncSqliteSaver: Checkpointer to compile the supervisor graph with
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    async with AsyncSqliteSaver.from_conn_string(path) as checkpointer:
+        yield checkpointer
+
+
+def incident_config(incident_id: str, callbacks: Optional[list] = None) -> dict[str, Any]:
+    """Run config addressing the checkpointed thread of an incident."""
+    config: dict[str, Any] = {"configurable": {"thread_id": incident_id}}
+    if callbacks:
+        config["callbacks"] = callbacks
+    return config
+
+
+async def investigate(graph: CompiledStateGraph, incident_id: str, query: str,
+                      callbacks: Optional[list] = None, queued_at: Optional[float] = None
+                      ) -> AsyncIterator[dict[str, Any]]:
+    """
+    Run one question of an incident investigation, resuming from the incident's saved state.
+
+    The conversation, logs and source code saved for the incident are restored by the checkpointer,
+    tools see the stored logs through the fetch ledger so incremental fetches only ask Loki for newer
+    lines, and everything fetched during the run is appended to the saved state once it finishes.
+    Graph nodes, LLM and tool calls, Loki and MCP requests of the run are recorded as spans, see
+    instrumentation.instrumented_run.
+
+    Args:
+        graph: Supervisor graph, without a checkpointer every run starts from scratch and nothing is saved
+        incident_id: Id of the incident, one checkpointed thread per incident
+        query: Question about the incident
+        callbacks: Callback handlers for the run
+        queued_at: time.monotonic() when the question was queued, recorded as the run's queue wait
+
+    Yields:
+        dict: astream 'updates' chunks
+    """
+    with instrumented_run(incident_id, queued_at) as run:
+        if run is not None:
+            callbacks = [*(callbacks or []), run.callback]
+        async for chunk in _investigate(graph, incident_id, query, callbacks):
+            yield chunk
+
+
+async def _investigate(graph: CompiledStateGraph, incident_id: str, query: str,
+                       callbacks: Optional[list]) -> AsyncIterator[dict[str, Any]]:
+    config = incident_config(incident_id, callbacks)
+    if graph.checkpointer is None:
+        with fetch_ledger():
+            async for chunk in graph.astream({"messages": [HumanMessage(query)]}, config, stream_mode="updates"):
+                yield chunk
+        return
+
+    saved = await graph.aget_state(config)
+    known_logs = saved.values.get("logs", [])
+    known_codebase = saved.values.get("codebase", [])
+    if saved.values:
+        logger.info(f"Resuming incident {incident_id} with {len(saved.values.get('messages', []))} messages, "
+                    f"{len(known_logs)} logs and {len(known_codebase)} code snippets")
+
+    with fetch_ledger(known_logs, known_codebase) as ledger:
+        try:
+            async for chunk in graph.astream({"messages": [HumanMessage(query)]}, config, stream_mode="updates"):
+                yield chunk
+        finally:
+            # Also when the run is cancelled at its deadline, so what was fetched is kept and the thread can resume
+            await _save_run(graph, config, ledger, incident_id)
+
+
+async def _save_run(graph: CompiledStateGraph, config: dict[str, Any], ledger: FetchLedger, incident_id: str) -> None:
+    """Append what the run fetched to the incident's state and answer tool calls it left without a result."""
+    current = (await graph.aget_state(config)).values
+    # Parallel dispatch already merges what its sub-agents return into the state
+    stored_logs = {log_key(item) for item in current.get("logs", [])}
+    stored_codebase = set(current.get("codebase", []))
+    update: dict[str, list] = {
+        "logs": [item for item in ledger.logs if log_key(item) not in stored_logs],
+        "codebase": [source for source in ledger.codebase if source not in stored_codebase],
+        "messages": dangling_tool_results(current.get("messages", [])),
+    }
+    if any(update.values()):
+        await graph.aupdate_state(config, update)
+    logger.info(f"Saved {len(update['logs'])} new logs and {len(update['codebase'])} new code snippets for incident "
+                f"{incident_id}, closed {len(update['messages'])} unanswered tool calls")
+
+
+def dangling_tool_results(messages: list[BaseMessage]) -> list[ToolMessage]:
+    """
+    Results for the tool calls of AIMessages that have no ToolMessage, e.g. because the run was cancelled.
+
+    The model API rejects a history where a tool call is not followed by its result, so the thread
+    could not be resumed without them.
+    """
+    answered = {message.tool_call_id for message in messages if isinstance(message, ToolMessage)}
+    return [
+        ToolMessage(content="Cancelled: the investigation was stopped before this tool call finished",
+                    tool_call_id=call["id"], name=call["name"], status="error")
+        for message in messages if isinstance(message, AIMessage)
+        for call in message.tool_calls if call["id"] not in answered
+    ]
@@ -1,60 +1,115 @@
 import asyncio
+from typing import Optional
 
 from anthropic import Anthropic
 from dotenv import load_dotenv
 from langchain.chat_models import init_chat_model
 from langchain_anthropic import ChatAnthropic
+from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import SystemMessage, HumanMessage
-from langgraph_supervisor import create_supervisor
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.tools import tool
+from langgraph.checkpoint.base import BaseCheckpointSaver
 
+from CodebaseAgent.code_index import join_log_sources
 from CodebaseAgent.codebaseagent import codebase_agent
+from CodebaseAgent.mcp_session import MCPSessionManager
+from CodebaseAgent.schema import LogSite, LogSourceJoin
 from LoggingAgent.LogsAgent import logging_agent
+from Orchestrator.incidents import incident_checkpointer, investigate
+from Orchestrator.parallel_dispatch import make_parallel_dispatch_tool
 from consts import CLAUDE_SONNET_4_LATEST
+from context_budget import ContextBudget, recall_context
 import os
-from schema import RootAgentState
+from schema import create_root_supervisor
+from ledger import current_ledger
+from models import chat_model, cached_system_message, TokenUsageCallback
+from prompts import PromptRegistry
 from utils import read_file
 from langsmith.wrappers import wrap_anthropic
 
 
-async def orchestrator():
+ORCHESTRATOR_PROMPTS = PromptRegistry(os.path.join(os.path.dirname(os.path.abspath(__file__)), "system_prompts"))
+ORCHESTRATOR_PROMPTS.register("system_overview", "system_overview.md")
+ORCHESTRATOR_PROMPTS.register("system_architecture", "system_architecture.mermaid")
+ORCHESTRATOR_PROMPTS.register("data_flow", "data_flow.mermaid")
+ORCHESTRATOR_PROMPTS.register("class_diagram", "class_diagram.mermaid")
+ORCHESTRATOR_PROMPTS.register(
+    "sp_orchestrator", "sp_orchestrator.md",
+    ("system_overview", "system_architecture", "data_flow", "component_interaction_diagram")
+)
 
-    # Get the directory of this file to build absolute paths
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    
-    system_prompt = read_file(os.path.join(current_dir, "system_prompts/sp_orchestrator.md"))
-    component_interaction_diagram = read_file(os.path.join(current_dir, "system_prompts/class_diagram.mermaid"))
-    data_flow_diagram = read_file(os.path.join(current_dir, "system_prompts/data_flow.mermaid"))
-    system_architecture_diagram = read_file(os.path.join(current_dir, "system_prompts/system_architecture.mermaid"))
-    system_overview = read_file(os.path.join(current_dir, "system_prompts/system_overview.md"))
 
-    sp = system_prompt.format(
-        system_overview=system_overview,
-        system_architecture = system_architecture_diagram,
-        data_flow = data_flow_diagram,
-        component_interaction_diagram=component_interaction_diagram
+@tool
+def get_log_source_code(repo: str, log_sites: list[LogSite]) -> LogSourceJoin:
+    """
+    Source code of the functions that emitted log lines, resolved in one call without the codebase agent.
+
+    Pass the filename, funcName and lineno of every log line of interest, e.g. all ERROR and WARNING
+    lines returned by the logs agent.
+
+    Args:
+        repo (str): Github repo as owner/name
+        log_sites (list[LogSite]): filename, funcName and lineno of the log lines
+
+    Returns:
+        LogSourceJoin: Source of each distinct emitting function and the function every log site maps to
+    """
+    joined = join_log_sources(repo, log_sites)
+    ledger = current_ledger()
+    if ledger is not None:
+        ledger.record_code(snippet.source_code for snippet in joined.snippets)
+    return joined
+
+
+async def orchestrator(checkpointer: Optional[BaseCheckpointSaver] = None, model: Optional[BaseChatModel] = None,
+                       mcp_manager: Optional[MCPSessionManager] = None):
+    """
+    Build the supervisor graph over the logs and codebase agents.
+
+    Args:
+        checkpointer: Saves every incident's state when given, see Orchestrator.incidents
+        model: Chat model of the supervisor and both agents, the shared chat_model() by default
+        mcp_manager: Session serving the deepwiki tools, the process-wide one by default
+    """
+
+    sp = ORCHESTRATOR_PROMPTS.render(
+        "sp_orchestrator",
+        system_overview="system_overview",
+        system_architecture="system_architecture",
+        data_flow="data_flow",
+        component_interaction_diagram="class_diagram"
     )
-    code_agent = await codebase_agent()
-    log_agent = logging_agent()
-    supervisor = create_supervisor(
-        model=init_chat_model(f"anthropic:{CLAUDE_SONNET_4_LATEST}"),
+    model = model or chat_model()
+    code_agent = await codebase_agent(model, mcp_manager)
+    log_agent = logging_agent(model)
+    prompt = cached_system_message(sp)
+    supervisor = create_root_supervisor(
+        model=model,
         # model=init_chat_model("openai:gpt-4.1"),
         agents=[log_agent, code_agent],
-        prompt=SystemMessage(content=sp),
+        tools=[get_log_source_code, recall_context,
+               make_parallel_dispatch_tool({agent.name: agent for agent in (log_agent, code_agent)})],
+        prompt=prompt,
+        # Handoffs, tool results and agent answers pile up in messages, only a budgeted view is sent each turn
+        pre_model_hook=ContextBudget(reserved_tokens=count_tokens_approximately([prompt])),
         add_handoff_messages=True
     )
-    supervisor_executor = supervisor.compile()
+    supervisor_executor = supervisor.compile(checkpointer=checkpointer)
     return supervisor_executor
 
 
 async def main():
     load_dotenv()
-    graph = await orchestrator()
-    user_query = [
-        HumanMessage("Market data was reported stale at 15:35:47 in the application: marketdata-publisher for repo: abhimanyu891998/cluestackmvpserver")
-    ]
-    async for chunk in graph.astream({"messages": user_query}, stream_mode="updates"):
-        print(chunk)
-        print()
+    async with incident_checkpointer() as checkpointer:
+        graph = await orchestrator(checkpointer)
+        user_query = "Market data was reported stale at 15:35:47 in the application: marketdata-publisher for repo: abhimanyu891998/cluestackmvpserver"
+        usage = TokenUsageCallback()
+        # Asking again with the same incident id resumes from the saved conversation, logs and code
+        async for chunk in investigate(graph, "marketdata-stale-15-35-47", user_query, [usage]):
+            print(chunk)
+            print()
+        print(f"Token usage: {usage.report()}")
 
 if __name__ == '__main__':
     asyncio.run(main())
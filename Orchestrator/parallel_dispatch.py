@@ -0,0 +1,155 @@
+"""Concurrent dispatch of independent sub-agent tasks from the supervisor."""
+import asyncio
+import json
+import logging
+import time
+from typing import Annotated, Any, Optional
+
+from langchain_core.messages import HumanMessage, ToolMessage
+from langchain_core.runnables import Runnable
+from langchain_core.tools import InjectedToolCallId, StructuredTool
+from langgraph.types import Command
+from pydantic import BaseModel, Field
+
+from consts import DISPATCH_MAX_CONCURRENCY, DISPATCH_TASK_TIMEOUT_SECONDS
+from instrumentation import span
+from schema import SubTask, SubTaskResult
+
+logger = logging.getLogger(__name__)
+
+
+class ParallelDispatchInput(BaseModel):
+    tasks: list[SubTask] = Field(description="Independent tasks, they run at the same time and cannot see each other's results")
+    tool_call_id: Annotated[str, InjectedToolCallId]
+
+
+def _final_output(state: dict[str, Any]) -> str:
+    structured = state.get("structured_response")
+    if isinstance(structured, BaseModel):
+        return structured.model_dump_json()
+    if structured is not None:
+        return json.dumps(structured, default=str)
+    messages = state.get("messages") or []
+    return str(messages[-1].content) if messages else ""
+
+
+async def run_subtask(agent: Runnable, index: int, subtask: SubTask, semaphore: asyncio.Semaphore,
+                      timeout_seconds: float) -> tuple[SubTaskResult, Optional[dict[str, Any]]]:
+    """
+    Run one sub-task once a concurrency slot is free, cancelling the agent when it exceeds its deadline.
+
+    The deadline only starts counting once the task holds a slot, the wait for it is recorded as the
+    queue wait of the task's span.
+
+    Returns:
+        tuple: (result, final agent state or None if the task did not complete)
+    """
+    queued_at = time.monotonic()
+    async with semaphore:
+        started = time.perf_counter()
+        state, status = None, "ok"
+        try:
+            with span(f"subtask.{subtask.agent}", "node", queued_at):
+                state = await asyncio.wait_for(
+                    agent.ainvoke({"messages": [HumanMessage(content=subtask.task)]}), timeout_seconds
+                )
+            output = _final_output(state)
+        except asyncio.TimeoutError:
+            status, output = "timeout", f"Timed out after {timeout_seconds:g}s"
+        except Exception as e:
+            logger.warning(f"Sub-task {index} for {subtask.agent} failed: {e}")
+            status, output = "error", f"{type(e).__name__}: {e}"
+        elapsed = time.perf_counter() - started
+    logger.info(f"Sub-task {index} for {subtask.agent} finished with {status} in {elapsed:.2f}s")
+    return SubTaskResult(index=index, agent=subtask.agent, task=subtask.task, status=status, output=output,
+                         elapsed_seconds=round(elapsed, 3)), state
+
+
+async def dispatch_parallel(agents: dict[str, Runnable], tasks: list[SubTask],
+                            max_concurrency: int = DISPATCH_MAX_CONCURRENCY,
+                            timeout_seconds: float = DISPATCH_TASK_TIMEOUT_SECONDS
+                            ) -> list[tuple[SubTaskResult, Optional[dict[str, Any]]]]:
+    """
+    Run sub-tasks concurrently on the current event loop.
+
+    Args:
+        agents: Compiled agent graphs by name
+        tasks: Tasks to run, unknown agent names are reported as errors without running
+        max_concurrency: Maximum number of tasks running at the same time
+        timeout_seconds: Deadline of every task
+
+    Returns:
+        list: (result, final agent state) per task, in the order of tasks regardless of completion order
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(index: int, subtask: SubTask) -> tuple[SubTaskResult, Optional[dict[str, Any]]]:
+        agent = agents.get(subtask.agent)
+        if agent is None:
+            return SubTaskResult(index=index, agent=subtask.agent, task=subtask.task, status="error",
+                                 output=f"Unknown agent, expected one of {sorted(agents)}", elapsed_seconds=0.0), None
+        return await run_subtask(agent, index, subtask, semaphore, timeout_seconds)
+
+    return list(await asyncio.gather(*(run(index, subtask) for index, subtask in enumerate(tasks))))
+
+
+def merge_outcomes(outcomes: list[tuple[SubTaskResult, Optional[dict[str, Any]]]]) -> dict[str, list]:
+    """
+    RootAgentState update carrying the logs and source code the sub-agents returned, in task order.
+
+    Args:
+        outcomes: Output of dispatch_parallel
+
+    Returns:
+        dict: 'logs' and 'codebase' lists, appended to the state by their reducers
+    """
+    logs, codebase = [], []
+    for _, state in outcomes:
+        structured = (state or {}).get("structured_response")
+        if structured is None:
+            continue
+        logs.extend(getattr(structured, "logs", None) or [])
+        source_code = getattr(structured, "source_code", None)
+        if source_code:
+            codebase.append(source_code)
+    return {"logs": logs, "codebase": codebase}
+
+
+def make_parallel_dispatch_tool(agents: dict[str, Runnable], max_concurrency: int = DISPATCH_MAX_CONCURRENCY,
+                                timeout_seconds: float = DISPATCH_TASK_TIMEOUT_SECONDS) -> StructuredTool:
+    """
+    Supervisor tool that runs a batch of independent sub-agent tasks concurrently.
+
+    The tool answers with one result per task in the order given and appends the logs and source code
+    the agents returned to RootAgentState, so the graph needs to be built with create_root_supervisor.
+
+    Args:
+        agents: Compiled agent graphs by name
+        max_concurrency: Maximum number of tasks running at the same time
+        timeout_seconds: Deadline of every task
+
+    Returns:
+        StructuredTool: The dispatch_parallel tool
+    """
+    async def dispatch(tasks: list[SubTask], tool_call_id: str) -> Command:
+        started = time.perf_counter()
+        outcomes = await dispatch_parallel(agents, tasks, max_concurrency, timeout_seconds)
+        logger.info(f"Dispatched {len(tasks)} sub-tasks in {time.perf_counter() - started:.2f}s")
+        results = [result.model_dump() for result, _ in outcomes]
+        return Command(update={
+            "messages": [ToolMessage(content=json.dumps(results), name="dispatch_parallel", tool_call_id=tool_call_id)],
+            **merge_outcomes(outcomes),
+        })
+
+    return StructuredTool.from_function(
+        coroutine=dispatch,
+        name="dispatch_parallel",
+        description=(
+            f"Run several independent tasks on the agents {sorted(agents)} at the same time and get all results "
+            f"in one step. Use it instead of sequential hand-offs when the tasks do not depend on each other, e.g. "
+            f"logs from different time windows or filters together with unrelated code lookups. Each task must be "
+            f"self-contained. At most {max_concurrency} tasks run at once and each is cancelled after "
+            f"{timeout_seconds:.0f}s."
+        ),
+        args_schema=ParallelDispatchInput,
+    )
@@ -0,0 +1,239 @@
+"""
+Long-running investigation service over one warm supervisor graph.
+
+Reads investigation requests as JSON lines on stdin and writes JSON line events on stdout:
+    {"request_id": "q-1", "incident_id": "inc-1", "query": "...", "deadline_seconds": 300}
+
+Requests with the same incident_id continue the investigation saved for that incident, one at a time.
+Requests without one start a new incident.
+
+Run from the repository root:
+    python -m Orchestrator.service --workers 4 --queue-size 32 < incidents.jsonl
+
+With --metrics-port the latency, token and byte histograms of the runs are served for Prometheus
+on http://127.0.0.1:<port>/metrics, the spans of every run are appended to INSTRUMENTATION_JSONL_PATH,
+which is rotated once it reaches INSTRUMENTATION_JSONL_MAX_BYTES.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+import uuid
+import weakref
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from dotenv import load_dotenv
+from langchain_core.messages import BaseMessage
+from langgraph.graph.state import CompiledStateGraph
+
+from consts import SERVICE_MAX_CONCURRENCY, SERVICE_QUEUE_SIZE, SERVICE_REQUEST_DEADLINE_SECONDS
+from instrumentation import serve_metrics
+from models import TokenUsageCallback
+from Orchestrator.incidents import incident_checkpointer, investigate
+from Orchestrator.orchestrator import orchestrator
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class InvestigationRequest:
+    request_id: str
+    incident_id: str
+    query: str
+    deadline: float
+    admitted_at: float = field(default_factory=time.monotonic)
+
+
+def _serialize_update(update: Any) -> Any:
+    """JSON-friendly form of one astream 'updates' chunk."""
+    if isinstance(update, BaseMessage):
+        return {"type": update.type, "name": update.name, "content": update.content}
+    if isinstance(update, dict):
+        return {key: _serialize_update(value) for key, value in update.items()}
+    if isinstance(update, (list, tuple)):
+        return [_serialize_update(value) for value in update]
+    if hasattr(update, "model_dump"):
+        return update.model_dump()
+    return update
+
+
+class InvestigationService:
+    """
+    Runs investigations on a shared compiled graph with bounded concurrency and queueing.
+
+    Requests are admitted into a bounded queue and rejected right away when it is full, so a
+    burst of incidents cannot pile up unbounded work. A fixed pool of workers takes requests
+    off the queue, streams the graph updates of each one as events and cancels it once its
+    deadline, counted from admission, has passed. Requests of the same incident run one after
+    another, as they continue the same saved conversation.
+    """
+
+    def __init__(self, graph: CompiledStateGraph, emit: Callable[[dict], None],
+                 workers: int = SERVICE_MAX_CONCURRENCY, queue_size: int = SERVICE_QUEUE_SIZE,
+                 deadline_seconds: float = SERVICE_REQUEST_DEADLINE_SECONDS):
+        self.graph = graph
+        self.emit = emit
+        self.workers = workers
+        self.deadline_seconds = deadline_seconds
+        self.stats = {"accepted": 0, "rejected": 0, "completed": 0, "timed_out": 0, "failed": 0}
+        self.latencies: list[float] = []
+        self._queue: asyncio.Queue[Optional[InvestigationRequest]] = asyncio.Queue(queue_size)
+        self._tasks: list[asyncio.Task] = []
+        # Held while an incident's investigation runs, dropped once no request of the incident needs it
+        self._incident_locks: weakref.WeakValueDictionary[str, asyncio.Lock] = weakref.WeakValueDictionary()
+
+    def start(self) -> None:
+        """Start the worker pool."""
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(), name=f"investigation-worker-{index}")
+                           for index in range(self.workers)]
+
+    def submit(self, request_id: str, query: str, deadline_seconds: Optional[float] = None,
+               incident_id: Optional[str] = None) -> bool:
+        """
+        Admit a request if there is room in the queue.
+
+        Args:
+            request_id: Id echoed on every event of the request
+            query: Incident description passed to the supervisor
+            deadline_seconds: Time from admission after which the request is cancelled
+            incident_id: Incident whose saved investigation the request continues, a new incident when None
+
+        Returns:
+            bool: True if the request was queued, False if it was rejected
+        """
+        request = InvestigationRequest(request_id, incident_id or str(uuid.uuid4()), query,
+                                       deadline_seconds or self.deadline_seconds)
+        try:
+            self._queue.put_nowait(request)
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            self.emit({"request_id": request_id, "event": "rejected", "reason": "queue full"})
+            return False
+        self.stats["accepted"] += 1
+        self.emit({"request_id": request_id, "event": "accepted", "queued": self._queue.qsize()})
+        return True
+
+    async def drain(self) -> None:
+        """Wait for every admitted request to finish, then stop the workers."""
+        for _ in self._tasks:
+            await self._queue.put(None)
+        await asyncio.gather(*self._tasks)
+        self._tasks = []
+
+    async def _worker(self) -> None:
+        while True:
+            request = await self._queue.get()
+            if request is None:
+                return
+            await self._investigate(request)
+
+    @staticmethod
+    def _new_messages(node_update: Any, seen_messages: set[str]) -> Any:
+        if not isinstance(node_update, dict) or "messages" not in node_update:
+            return node_update
+        messages = [message for message in node_update["messages"] if message.id not in seen_messages]
+        seen_messages.update(message.id for message in messages)
+        return dict(node_update, messages=messages)
+
+    async def _investigate(self, request: InvestigationRequest) -> None:
+        remaining = request.deadline - (time.monotonic() - request.admitted_at)
+        usage = TokenUsageCallback()
+        updates = 0
+        seen_messages: set[str] = set()
+
+        async def stream() -> None:
+            nonlocal updates
+            async for chunk in investigate(self.graph, request.incident_id, request.query, [usage],
+                                           request.admitted_at):
+                updates += 1
+                # The supervisor node returns the whole history on every turn, only new messages are sent
+                chunk = {node: self._new_messages(node_update, seen_messages) for node, node_update in chunk.items()}
+                self.emit({"request_id": request.request_id, "event": "update", "update": _serialize_update(chunk)})
+
+        async def run() -> None:
+            lock = self._incident_locks.get(request.incident_id)
+            if lock is None:
+                lock = self._incident_locks[request.incident_id] = asyncio.Lock()
+            async with lock:
+                self.emit({"request_id": request.request_id, "event": "started", "incident_id": request.incident_id,
+                           "queued_seconds": round(time.monotonic() - request.admitted_at, 3)})
+                await stream()
+
+        try:
+            if remaining <= 0:
+                raise asyncio.TimeoutError
+            await asyncio.wait_for(run(), remaining)
+        except asyncio.TimeoutError:
+            self.stats["timed_out"] += 1
+            self.emit({"request_id": request.request_id, "event": "timeout", "deadline_seconds": request.deadline})
+            return
+        except Exception as e:
+            logger.exception(f"Investigation {request.request_id} failed")
+            self.stats["failed"] += 1
+            self.emit({"request_id": request.request_id, "event": "error", "error": f"{type(e).__name__}: {e}"})
+            return
+        latency = time.monotonic() - request.admitted_at
+        self.latencies.append(latency)
+        self.stats["completed"] += 1
+        self.emit({"request_id": request.request_id, "event": "done", "updates": updates,
+                   "latency_seconds": round(latency, 3), "usage": dict(usage.usage)})
+
+
+def write_event(event: dict) -> None:
+    sys.stdout.write(json.dumps(event, default=str) + "\n")
+    sys.stdout.flush()
+
+
+async def serve(graph: CompiledStateGraph, workers: int, queue_size: int, deadline_seconds: float) -> dict:
+    """
+    Serve requests read from stdin until it closes, then wait for the admitted ones.
+
+    Returns:
+        dict: Request counters of the service
+    """
+    service = InvestigationService(graph, write_event, workers, queue_size, deadline_seconds)
+    service.start()
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    line_number = 0
+    async for line in reader:
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            service.submit(str(request.get("request_id", line_number)), request["query"],
+                           request.get("deadline_seconds"), request.get("incident_id"))
+        except (ValueError, KeyError) as e:
+            write_event({"request_id": None, "event": "rejected", "reason": f"invalid request on line {line_number}: {e}"})
+    await service.drain()
+    return service.stats
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Serve incident investigations from JSON lines on stdin")
+    parser.add_argument("--workers", type=int, default=SERVICE_MAX_CONCURRENCY)
+    parser.add_argument("--queue-size", type=int, default=SERVICE_QUEUE_SIZE)
+    parser.add_argument("--deadline", type=float, default=SERVICE_REQUEST_DEADLINE_SECONDS)
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics of the runs on this port")
+    args = parser.parse_args()
+
+    load_dotenv()
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+    started = time.perf_counter()
+    async with incident_checkpointer() as checkpointer:
+        graph = await orchestrator(checkpointer)
+        logger.info(f"Supervisor graph ready in {time.perf_counter() - started:.2f}s")
+        stats = await serve(graph, args.workers, args.queue_size, args.deadline)
+    logger.info(f"Service stopped: {stats}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    asyncio.run(main())
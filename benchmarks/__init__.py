@@ -0,0 +1 @@
+"""Offline benchmarks for the agents and their tools"""
\ No newline at end of file
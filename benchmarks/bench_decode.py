@@ -0,0 +1,76 @@
+"""
+Decode and validation time of a query_range body, whole-body json plus per-line validation
+against the streamed decoder with batched TypeAdapter validation.
+
+Run from the repository root:
+    python -m benchmarks.bench_decode
+"""
+import json
+import time
+
+from LoggingAgent.fake_loki import synthetic_entries
+from LoggingAgent.log_decode import decode_query_range, iter_log_items
+from LoggingAgent.log_store import LogColumns
+from LoggingAgent.schema import LogItem
+from consts import LOGS_DECODE_CHUNK_BYTES
+
+LINE_COUNTS = [10_000, 100_000]
+# One line in MALFORMED_EVERY carries a levelname outside the LogItem Literal
+MALFORMED_EVERY = 100
+
+
+def query_range_body(entries: list[tuple[int, str]]) -> bytes:
+    values = [[str(ts), line] for ts, line in entries]
+    document = {"status": "success",
+                "data": {"resultType": "streams",
+                         "result": [{"stream": {"application": "marketdata-publisher"}, "values": values}]}}
+    return json.dumps(document).encode('utf-8')
+
+
+def chunks(body: bytes) -> list[bytes]:
+    return [body[i:i + LOGS_DECODE_CHUNK_BYTES] for i in range(0, len(body), LOGS_DECODE_CHUNK_BYTES)]
+
+
+def per_line(body: list[bytes]) -> int:
+    result = json.loads(b''.join(body))
+    items = [LogItem.model_validate_json(value[-1])
+             for stream in result['data']['result'] for value in stream['values']]
+    return len(items)
+
+
+def streamed_batched(body: list[bytes]) -> int:
+    _, entries = decode_query_range(body)
+    return sum(1 for _ in iter_log_items(line for _, line in entries))
+
+
+def streamed_columns(body: list[bytes]) -> int:
+    _, entries = decode_query_range(body)
+    return len(LogColumns.from_lines(line for _, line in entries))
+
+
+def timed(decode, body) -> tuple[int, float]:
+    started = time.perf_counter()
+    count = decode(body)
+    return count, time.perf_counter() - started
+
+
+def main():
+    print(f"{'lines':>8} {'payload':>9} {'decoder':>18} {'seconds':>8} {'valid':>7}")
+    for count in LINE_COUNTS:
+        entries = synthetic_entries(count)
+        malformed = [(ts, line.replace('"INFO"', '"TRACE"') if i % MALFORMED_EVERY == 0 else line)
+                     for i, (ts, line) in enumerate(entries)]
+        for payload, payload_entries in (('clean', entries), ('malformed', malformed)):
+            body = chunks(query_range_body(payload_entries))
+            decoders = {'per-line': per_line, 'streamed+batched': streamed_batched,
+                        'streamed+columns': streamed_columns}
+            for label, decode in decoders.items():
+                try:
+                    valid, elapsed = timed(decode, body)
+                    print(f"{count:>8} {payload:>9} {label:>18} {elapsed:>8.3f} {valid:>7}")
+                except ValueError as e:
+                    print(f"{count:>8} {payload:>9} {label:>18} {'failed':>8} {type(e).__name__}")
+
+
+if __name__ == '__main__':
+    main()
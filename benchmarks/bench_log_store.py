@@ -0,0 +1,56 @@
+"""
+Memory and build time of LogColumns against a list of validated LogItems.
+
+Run from the repository root:
+    python -m benchmarks.bench_log_store
+"""
+import gc
+import time
+import tracemalloc
+
+from LoggingAgent.fake_loki import synthetic_entries
+from LoggingAgent.log_store import LogColumns
+from LoggingAgent.schema import LogItem
+
+LINE_COUNTS = [10_000, 100_000]
+
+
+def measure(build, lines):
+    # Timed without tracemalloc, which slows allocation-heavy builds unevenly
+    gc.collect()
+    started = time.perf_counter()
+    result = build(lines)
+    elapsed = time.perf_counter() - started
+    del result
+
+    gc.collect()
+    tracemalloc.start()
+    result = build(lines)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, retained, peak
+
+
+def main():
+    print(f"{'lines':>8} {'container':>14} {'build s':>8} {'retained MB':>12} {'peak MB':>8}")
+    for count in LINE_COUNTS:
+        lines = [line for _, line in synthetic_entries(count)]
+        builders = {
+            'list[LogItem]': lambda batch: [LogItem.model_validate_json(line) for line in batch],
+            'LogColumns': LogColumns.from_lines,
+        }
+        for label, build in builders.items():
+            result, elapsed, retained, peak = measure(build, lines)
+            assert len(result) == count
+            print(f"{count:>8} {label:>14} {elapsed:>8.3f} {retained / 2 ** 20:>12.1f} {peak / 2 ** 20:>8.1f}")
+            del result
+
+        table = LogColumns.from_lines(lines)
+        started = time.perf_counter()
+        errors = table.filter(levels=['ERROR'], func_names=['check_staleness'])
+        elapsed = time.perf_counter() - started
+        print(f"{count:>8} filter ERROR/check_staleness -> {len(errors)} rows in {elapsed * 1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
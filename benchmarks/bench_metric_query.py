@@ -0,0 +1,68 @@
+"""
+Counting log lines client-side from raw fetches vs server-side with a LogQL metric query, against a local fake Loki.
+
+Both answer how many lines were logged per 15 minutes over a day. Bytes are the response
+bodies read from Loki, tokens the approximate size of what the agent is given.
+
+Run from the repository root:
+    python -m benchmarks.bench_metric_query
+"""
+import os
+import time
+
+from langchain_core.messages import ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+from LoggingAgent.fake_loki import FakeLoki, synthetic_entries
+from LoggingAgent.logql_metrics import fetch_matrix, metric_step_seconds, metric_window, with_step
+from LoggingAgent.loki_client import iter_log_entries, NANOS_PER_SECOND
+from instrumentation import instrumented_run
+
+LINES = 20_000
+LATENCY_SECONDS = 0.05
+STEP_SECONDS = 900
+LOG_QUERY = '{application="marketdata-publisher"}'
+METRIC_QUERY = f'sum(count_over_time({LOG_QUERY} [$__interval]))'
+
+
+def tokens(text: str) -> int:
+    return count_tokens_approximately([ToolMessage(content=text, tool_call_id="bench")])
+
+
+def main():
+    os.environ.setdefault('GRAFANA_USERNAME', 'bench')
+    os.environ.setdefault('GRAFANA_PWD', 'bench')
+
+    step_ns = 24 * 3600 * NANOS_PER_SECOND // LINES
+    entries = synthetic_entries(LINES, step_ns=step_ns)
+    start_ns, end_ns = entries[0][0], entries[-1][0] + 1
+
+    with FakeLoki(entries, latency_seconds=LATENCY_SECONDS) as loki:
+        print(f"{LINES} lines over a day, {LATENCY_SECONDS * 1000:.0f}ms per request")
+        print(f"{'method':<12} {'requests':>9} {'bytes':>11} {'tokens':>9} {'seconds':>8}")
+
+        loki.request_count = 0
+        with instrumented_run("bench.raw_lines", jsonl_path=None) as run:
+            started = time.perf_counter()
+            lines = [line for _, line in iter_log_entries(LOG_QUERY, start_ns, end_ns, max_lines=LINES,
+                                                          endpoint=loki.endpoint)]
+            elapsed = time.perf_counter() - started
+        assert len(lines) == LINES, f"expected {LINES} lines, got {len(lines)}"
+        print(f"{'raw lines':<12} {loki.request_count:>9} {run.totals().get('bytes_fetched', 0):>11.0f} "
+              f"{tokens(chr(10).join(lines)):>9} {elapsed:>8.2f}")
+
+        loki.request_count = 0
+        with instrumented_run("bench.metric_query", jsonl_path=None) as run:
+            started = time.perf_counter()
+            step = metric_step_seconds(start_ns, end_ns, STEP_SECONDS)
+            query = with_step(METRIC_QUERY, step)
+            first, last = metric_window(start_ns, end_ns, step)
+            result = fetch_matrix(query, first, last, step, endpoint=loki.endpoint).to_result(query, step)
+            elapsed = time.perf_counter() - started
+        assert result.series[0].total == LINES, f"expected {LINES} lines counted, got {result.series[0].total}"
+        print(f"{'metric':<12} {loki.request_count:>9} {run.totals().get('bytes_fetched', 0):>11.0f} "
+              f"{tokens(result.model_dump_json()):>9} {elapsed:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Sequential hand-offs vs parallel dispatch through the supervisor graph, with fake models that sleep.
+
+Every sub-agent is a ReAct agent whose model sleeps before answering, the supervisor model is
+scripted to either hand off to the agents one after another or issue one dispatch_parallel call.
+
+Run from the repository root:
+    python -m benchmarks.bench_parallel_dispatch
+"""
+import asyncio
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.prebuilt import create_react_agent
+
+from Orchestrator.parallel_dispatch import make_parallel_dispatch_tool
+from schema import create_root_supervisor
+from tests.fake_models import ScriptedModel, SleepyModel, tool_call
+
+TASK_SECONDS = [0.4, 0.25, 0.3, 0.5, 0.2, 0.35]
+MAX_CONCURRENCY = 4
+
+
+def build_agents() -> list:
+    return [
+        create_react_agent(model=SleepyModel(delay_seconds=seconds, answer=f"result of task {index}"), tools=[],
+                           name=f"agent_{index}")
+        for index, seconds in enumerate(TASK_SECONDS)
+    ]
+
+
+async def run_sequential() -> float:
+    agents = build_agents()
+    script = [tool_call(f"transfer_to_{agent.name}", {}, f"call_{index}") for index, agent in enumerate(agents)]
+    script.append(AIMessage(content="done"))
+    graph = create_root_supervisor(agents=agents, model=ScriptedModel(script=script)).compile()
+    started = time.perf_counter()
+    await graph.ainvoke({"messages": [HumanMessage("investigate")]})
+    return time.perf_counter() - started
+
+
+async def run_parallel() -> tuple[float, str]:
+    agents = build_agents()
+    tasks = [{"agent": agent.name, "task": f"task {index}"} for index, agent in enumerate(agents)]
+    dispatch = make_parallel_dispatch_tool({agent.name: agent for agent in agents}, max_concurrency=MAX_CONCURRENCY)
+    script = [tool_call("dispatch_parallel", {"tasks": tasks}, "call_dispatch"), AIMessage(content="done")]
+    graph = create_root_supervisor(agents=agents, model=ScriptedModel(script=script), tools=[dispatch]).compile()
+    started = time.perf_counter()
+    state = await graph.ainvoke({"messages": [HumanMessage("investigate")]})
+    elapsed = time.perf_counter() - started
+    tool_message = next(message for message in state["messages"] if message.type == "tool")
+    return elapsed, tool_message.content
+
+
+async def main():
+    print(f"{len(TASK_SECONDS)} sub-tasks sleeping {TASK_SECONDS}s, sum {sum(TASK_SECONDS):.2f}s, "
+          f"slowest {max(TASK_SECONDS):.2f}s, concurrency cap {MAX_CONCURRENCY}")
+    sequential = await run_sequential()
+    parallel, results = await run_parallel()
+    print(f"sequential hand-offs: {sequential:.2f}s")
+    print(f"dispatch_parallel:    {parallel:.2f}s ({sequential / parallel:.1f}x)")
+    print(f"results: {results[:200]}...")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
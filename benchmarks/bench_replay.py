@@ -0,0 +1,98 @@
+"""
+End-to-end investigations of a corpus of incident queries, replayed offline from recorded fixtures.
+
+For every incident the full supervisor graph runs against the recorded LLM responses, Loki lines
+and MCP results, with the recorded or injected latencies, and wall time, LLM turns, tokens and
+bytes fetched are reported, so changes to the agent loop show up in the numbers.
+
+The committed fixtures are recorded offline by benchmarks.record_fixtures, against fake Loki,
+the stub MCP server, a scripted model and a stub checkout. Record them against the live LLM,
+Grafana, deepwiki and GitHub instead, credentials from .env:
+    python -m benchmarks.bench_replay --record
+
+Then replay them offline as often as needed, e.g. without any latency:
+    python -m benchmarks.bench_replay --latency-scale 0
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+
+from Orchestrator.incidents import investigate
+from Orchestrator.orchestrator import orchestrator
+from consts import REPLAY_FIXTURES_DIR
+from models import TokenUsageCallback
+from replay import InjectedLatency, ReplayMissError, record_session, replay_session
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'incidents.jsonl')
+
+
+def load_corpus(path: str) -> list[dict]:
+    with open(path, 'r', encoding='utf-8') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+async def run_incident(incident: dict, fixture: str, record: bool, latency: InjectedLatency) -> dict:
+    session = record_session(fixture) if record else replay_session(fixture, latency)
+    usage = TokenUsageCallback()
+    async with session as replay:
+        graph = await orchestrator(model=replay.model, mcp_manager=replay.mcp_manager)
+        started = time.perf_counter()
+        async for _ in investigate(graph, incident["incident_id"], incident["query"], [usage]):
+            pass
+        elapsed = time.perf_counter() - started
+    stats = replay.cassette.stats
+    return {
+        "incident_id": incident["incident_id"], "seconds": round(elapsed, 3), "llm_turns": stats["llm_calls"],
+        "input_tokens": usage.usage["input_tokens"], "output_tokens": usage.usage["output_tokens"],
+        "loki_requests": stats["loki_requests"], "loki_bytes": stats["loki_bytes"],
+        "mcp_calls": stats["mcp_calls"], "mcp_bytes": stats["mcp_bytes"],
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--record', action='store_true', help="Record the fixtures against the live services")
+    parser.add_argument('--corpus', default=CORPUS_PATH, help="JSONL of incident_id and query")
+    parser.add_argument('--fixtures', default=REPLAY_FIXTURES_DIR, help="Directory of the recorded fixtures")
+    parser.add_argument('--latency-scale', type=float, default=1.0, help="Multiplier of every replayed latency")
+    parser.add_argument('--llm-latency', type=float, help="Fixed seconds per LLM call instead of the recorded ones")
+    parser.add_argument('--loki-latency', type=float, help="Fixed seconds per Loki request")
+    parser.add_argument('--mcp-latency', type=float, help="Fixed seconds per MCP call")
+    parser.add_argument('--output', help="Also append the results as JSONL to this file")
+    args = parser.parse_args()
+    if args.record:
+        load_dotenv()
+    latency = InjectedLatency(args.llm_latency, args.loki_latency, args.mcp_latency, args.latency_scale)
+
+    columns = ["seconds", "llm_turns", "input_tokens", "output_tokens", "loki_requests", "loki_bytes", "mcp_calls",
+               "mcp_bytes"]
+    print(f"{'incident':<32} " + " ".join(f"{column:>13}" for column in columns))
+    results = []
+    for incident in load_corpus(args.corpus):
+        fixture = os.path.join(args.fixtures, f"{incident['incident_id']}.json")
+        if not args.record and not os.path.exists(fixture):
+            print(f"{incident['incident_id']:<32} no fixture, record it with --record")
+            continue
+        try:
+            result = await run_incident(incident, fixture, args.record, latency)
+        except ReplayMissError as e:
+            print(f"{incident['incident_id']:<32} diverged from the recording: {e}")
+            continue
+        results.append(result)
+        print(f"{result['incident_id']:<32} " + " ".join(f"{result[column]:>13}" for column in columns))
+
+    if results:
+        totals = {column: round(sum(result[column] for result in results), 3) for column in columns}
+        print(f"{'total':<32} " + " ".join(f"{totals[column]:>13}" for column in columns))
+    if args.output and results:
+        with open(args.output, 'a', encoding='utf-8') as file:
+            for result in results:
+                file.write(json.dumps({"recorded" if args.record else "replayed": True, **result}) + "\n")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+"""
+Throughput and latency of the investigation service on a stub supervisor graph.
+
+The supervisor model sleeps and hands off to a sub-agent whose model sleeps and answers, so every
+investigation costs three model calls of fixed latency. A burst of requests is submitted at once
+for several worker counts, then with a small queue and a short deadline to show admission control.
+
+Run from the repository root:
+    python -m benchmarks.bench_service
+"""
+import asyncio
+import time
+from typing import Any, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langgraph.prebuilt import create_react_agent
+from langgraph_supervisor import create_supervisor
+
+from Orchestrator.service import InvestigationService
+from tests.fake_models import SleepyModel
+
+MODEL_SECONDS = 0.1
+REQUESTS = 32
+WORKER_COUNTS = [1, 4, 8, 16]
+
+
+class HandoffModel(BaseChatModel):
+    """Hands off to the sub-agent on the first turn and answers once it has reported back."""
+    delay_seconds: float
+    agent_name: str
+
+    @property
+    def _llm_type(self) -> str:
+        return "handoff"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> 'HandoffModel':
+        return self
+
+    def _generate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager: Any = None,
+                  **kwargs: Any) -> ChatResult:
+        raise NotImplementedError
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager: Any = None,
+                         **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.delay_seconds)
+        if any(message.type == "ai" and message.name == self.agent_name for message in messages):
+            message = AIMessage(content="root cause found")
+        else:
+            message = AIMessage(content="", tool_calls=[{"name": f"transfer_to_{self.agent_name}", "args": {},
+                                                         "id": f"call_{time.monotonic_ns()}", "type": "tool_call"}])
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def build_graph():
+    agent = create_react_agent(model=SleepyModel(delay_seconds=MODEL_SECONDS, answer="logs"), tools=[],
+                               name="logs_agent")
+    return create_supervisor(agents=[agent], model=HandoffModel(delay_seconds=MODEL_SECONDS, agent_name="logs_agent"),
+                             add_handoff_messages=True).compile()
+
+
+def percentile(values: list[float], p: int) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] if ordered else float('nan')
+
+
+async def run(graph, workers: int, queue_size: int, deadline_seconds: float) -> tuple[InvestigationService, float]:
+    service = InvestigationService(graph, lambda event: None, workers, queue_size, deadline_seconds)
+    service.start()
+    started = time.perf_counter()
+    for index in range(REQUESTS):
+        service.submit(f"inc-{index}", "Market data was reported stale")
+    await service.drain()
+    return service, time.perf_counter() - started
+
+
+async def main():
+    started = time.perf_counter()
+    graph = build_graph()
+    print(f"graph build: {(time.perf_counter() - started) * 1000:.0f}ms, paid once per service instead of per request")
+    print(f"{REQUESTS} requests in one burst, 3 model calls of {MODEL_SECONDS * 1000:.0f}ms each")
+    print(f"{'workers':>7} {'seconds':>8} {'req/s':>7} {'p50 s':>7} {'p95 s':>7}")
+    for workers in WORKER_COUNTS:
+        service, elapsed = await run(graph, workers, REQUESTS, 60)
+        print(f"{workers:>7} {elapsed:>8.2f} {service.stats['completed'] / elapsed:>7.1f} "
+              f"{percentile(service.latencies, 50):>7.2f} {percentile(service.latencies, 95):>7.2f}")
+
+    service, _ = await run(graph, 4, 8, 60)
+    print(f"queue of 8, 4 workers: {service.stats}")
+    service, _ = await run(graph, 4, REQUESTS, 1.0)
+    print(f"1s deadline, 4 workers: {service.stats}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,49 @@
+"""
+Sequential vs time-sharded Loki fetches against a local fake Loki with artificial latency.
+
+Run from the repository root:
+    python -m benchmarks.bench_sharded_fetch
+"""
+import os
+import time
+
+from LoggingAgent.fake_loki import FakeLoki, synthetic_entries
+from LoggingAgent.loki_client import iter_log_entries, iter_log_entries_sharded, NANOS_PER_SECOND
+
+LINES = 20_000
+PAGE_SIZE = 500
+LATENCY_SECONDS = 0.05
+SHARD_COUNTS = [1, 2, 4, 8]
+
+
+def main():
+    os.environ.setdefault('GRAFANA_USERNAME', 'bench')
+    os.environ.setdefault('GRAFANA_PWD', 'bench')
+
+    # One day of lines, as with the default LOGS_LOOKBACK_DAYS fallback
+    step_ns = 24 * 3600 * NANOS_PER_SECOND // LINES
+    entries = synthetic_entries(LINES, step_ns=step_ns)
+    start_ns, end_ns = entries[0][0], entries[-1][0] + 1
+
+    with FakeLoki(entries, latency_seconds=LATENCY_SECONDS) as loki:
+        print(f"{LINES} lines, page size {PAGE_SIZE}, {LATENCY_SECONDS * 1000:.0f}ms per request")
+        print(f"{'shards':>6} {'requests':>9} {'seconds':>8} {'speedup':>8}")
+        baseline = None
+        for shards in SHARD_COUNTS:
+            loki.request_count = 0
+            started = time.perf_counter()
+            if shards == 1:
+                fetched = list(iter_log_entries('{application="marketdata-publisher"}', start_ns, end_ns,
+                                                page_size=PAGE_SIZE, max_lines=LINES, endpoint=loki.endpoint))
+            else:
+                fetched = list(iter_log_entries_sharded('{application="marketdata-publisher"}', start_ns, end_ns,
+                                                        shards, page_size=PAGE_SIZE, max_lines=LINES,
+                                                        endpoint=loki.endpoint))
+            elapsed = time.perf_counter() - started
+            assert len(fetched) == LINES, f"expected {LINES} lines, got {len(fetched)}"
+            baseline = baseline or elapsed
+            print(f"{shards:>6} {loki.request_count:>9} {elapsed:>8.2f} {baseline / elapsed:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
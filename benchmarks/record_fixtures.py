@@ -0,0 +1,189 @@
+"""
+Record the bench_replay fixtures offline, against a local fake Loki, the stub MCP server and a scripted model.
+
+The scripted model walks every incident through the same path a real investigation takes:
+the supervisor hands off to the logs agent, which summarizes and fetches the lines, then to the
+codebase agent, which reads the emitting function from the code index and asks deepwiki, and
+finally joins the log site with its source itself. The repository is a stub checkout whose
+functions log the lines fake Loki serves, so every tool call is answered without the network.
+
+Run from the repository root, then commit benchmarks/fixtures:
+    python -m benchmarks.record_fixtures
+"""
+import argparse
+import asyncio
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from LoggingAgent.fake_loki import FakeLoki, SAMPLE_LOG_SHAPES, synthetic_entries
+from Orchestrator.incidents import investigate
+from Orchestrator.orchestrator import orchestrator
+from benchmarks.bench_replay import CORPUS_PATH, load_corpus
+from consts import REPLAY_FIXTURES_DIR
+from replay import record_session
+
+LINES = 300
+APPLICATION_QUERY = '{application="marketdata-publisher"}'
+# Log line each incident is about, by a word of its query: (filename, funcName, lineno, line filter)
+INCIDENT_SITES = {
+    "stale": ("main.py", "check_staleness", 184, "staleness"),
+    "memory": ("queue_processor.py", "check_memory", 140, "memory usage"),
+    "latency": ("queue_processor.py", "process_message", 171, "latency"),
+    "broadcast": ("main.py", "broadcast", 251, "broadcasting"),
+}
+
+
+def write_stub_repository(directory: str) -> None:
+    """Write Python files whose functions log SAMPLE_LOG_SHAPES at their filename, funcName and lineno."""
+    calls: dict[str, dict[str, list[tuple[int, str, str]]]] = {}
+    for _, level, filename, func, lineno, template in SAMPLE_LOG_SHAPES:
+        calls.setdefault(filename, {}).setdefault(func, []).append((lineno, level, template))
+    for filename, functions in calls.items():
+        lines = ["import logging", "", "logger = logging.getLogger(__name__)"]
+        for func, sites in sorted(functions.items(), key=lambda item: min(site[0] for site in item[1])):
+            sites.sort()
+            lines += [""] * (sites[0][0] - 2 - len(lines))
+            lines.append(f"def {func}(metrics: dict) -> None:")
+            for lineno, level, template in sites:
+                lines += [""] * (lineno - 1 - len(lines))
+                lines.append(f"    logger.{level.lower()}({template!r}.format(**metrics))")
+            lines.append("")
+        with open(os.path.join(directory, filename), 'w', encoding='utf-8') as file:
+            file.write("\n".join(lines) + "\n")
+
+
+class ScriptedIncidentModel(BaseChatModel):
+    """Answers every agent of the supervisor graph with the next step of a fixed investigation of one log site."""
+    repo: str
+    filename: str
+    func_name: str
+    lineno: int
+    line_filter: str
+    tool_names: list[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> 'ScriptedIncidentModel':
+        return self.model_copy(update={"tool_names": [convert_to_openai_tool(tool)["function"]["name"]
+                                                      for tool in tools]})
+
+    def _generate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager: Any = None,
+                  **kwargs: Any) -> ChatResult:
+        step = self._step(messages)
+        usage = {"input_tokens": count_tokens_approximately(messages), "output_tokens": 40}
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        if isinstance(step, str):
+            message = AIMessage(content=step, usage_metadata=usage)
+        else:
+            name, args = step
+            message = AIMessage(content="", usage_metadata=usage, tool_calls=[
+                {"name": name, "args": args, "id": f"call_{name}_{len(messages)}", "type": "tool_call"}])
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _step(self, messages: list[BaseMessage]) -> str | tuple[str, dict]:
+        tools = set(self.tool_names)
+        answered = {message.name for message in messages if message.type in ("tool", "ai")}
+        site = {"filename": self.filename, "funcName": self.func_name, "lineno": self.lineno}
+        if "transfer_to_logs_agent" in tools:
+            if "logs_agent" not in answered:
+                return "transfer_to_logs_agent", {}
+            if "codebase_agent" not in answered:
+                return "transfer_to_codebase_agent", {}
+            if "get_log_source_code" not in answered:
+                return "get_log_source_code", {"repo": self.repo, "log_sites": [site]}
+            return f"Root cause: {self.func_name} in {self.filename} logs the incident at line {self.lineno}."
+        if "get_logs" in tools:
+            query = f'{APPLICATION_QUERY} |~ "(?i){self.line_filter}"'
+            if "get_logs_summary" not in answered:
+                return "get_logs_summary", {"logql_query": query}
+            if "get_logs" not in answered:
+                return "get_logs", {"logql_query": query}
+            return f"Found the {self.line_filter} lines, logged by {self.func_name}."
+        if tools == {"LogAgentOutput"}:
+            return "LogAgentOutput", {"logs": []}
+        if "get_log_site_source" in tools:
+            if "get_log_site_source" not in answered:
+                return "get_log_site_source", {"repo": self.repo, "filename": self.filename,
+                                               "func_name": self.func_name, "lineno": self.lineno}
+            if "ask_question" not in answered:
+                return "ask_question", {"repoName": self.repo, "question": f"What calls {self.func_name}?"}
+            return f"{self.func_name} in {self.filename} emits the line."
+        if tools == {"Output"}:
+            return "Output", {"source_code": f"def {self.func_name}(metrics: dict) -> None: ...",
+                              "start_line_number": self.lineno, "end_line_numebr": self.lineno,
+                              "function_name": self.func_name}
+        raise ValueError(f"No scripted step for tools {sorted(tools)}")
+
+
+def incident_model(incident: dict) -> ScriptedIncidentModel:
+    repo = re.search(r'repo: (\S+)', incident["query"]).group(1)
+    word = next(word for word in INCIDENT_SITES if word in incident["query"].lower())
+    filename, func_name, lineno, line_filter = INCIDENT_SITES[word]
+    return ScriptedIncidentModel(repo=repo, filename=filename, func_name=func_name, lineno=lineno,
+                                 line_filter=line_filter)
+
+
+def start_stub_mcp_server() -> tuple[subprocess.Popen, int]:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen([sys.executable, '-m', 'CodebaseAgent.stub_mcp_server', '--port', str(port)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process, port
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Stub MCP server did not start")
+
+
+async def record_incident(incident: dict, fixture: str, checkout: str, mcp_url: str) -> None:
+    model = incident_model(incident)
+    entries = synthetic_entries(LINES, end_ns=time.time_ns() - 5 * 10**9, step_ns=10**9)
+    with FakeLoki(entries, latency_seconds=0.02) as loki:
+        async with record_session(fixture, model=model, mcp_url=mcp_url, checkouts={model.repo: checkout},
+                                  loki_url=loki.endpoint) as recording:
+            graph = await orchestrator(model=recording.model, mcp_manager=recording.mcp_manager)
+            async for _ in investigate(graph, incident["incident_id"], incident["query"]):
+                pass
+    print(f"{incident['incident_id']:<32} {recording.cassette.stats}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default=CORPUS_PATH, help="JSONL of incident_id and query")
+    parser.add_argument('--fixtures', default=REPLAY_FIXTURES_DIR, help="Directory to write the fixtures to")
+    args = parser.parse_args()
+    os.environ.setdefault('GRAFANA_USERNAME', 'bench')
+    os.environ.setdefault('GRAFANA_PWD', 'bench')
+
+    process, port = start_stub_mcp_server()
+    try:
+        with tempfile.TemporaryDirectory(prefix='stub-repo-') as checkout:
+            write_stub_repository(checkout)
+            for incident in load_corpus(args.corpus):
+                await record_incident(incident, os.path.join(args.fixtures, f"{incident['incident_id']}.json"),
+                                      checkout, f"http://127.0.0.1:{port}/sse")
+    finally:
+        process.kill()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
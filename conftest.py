@@ -0,0 +1,29 @@
+"""Shared pytest fixtures, the suite runs fully offline against the local fakes."""
+import pytest
+
+from LoggingAgent.fake_loki import FakeLoki
+from LoggingAgent.loki_client import close_session
+
+
+@pytest.fixture(autouse=True)
+def grafana_credentials(monkeypatch):
+    monkeypatch.setenv('GRAFANA_USERNAME', 'test')
+    monkeypatch.setenv('GRAFANA_PWD', 'test')
+    yield
+    close_session()
+
+
+@pytest.fixture
+def fake_loki():
+    """Start a FakeLoki over the given entries, stopped at the end of the test."""
+    started = []
+
+    def start(entries: list[tuple[int, str]], **kwargs) -> FakeLoki:
+        loki = FakeLoki(entries, **kwargs)
+        loki.start()
+        started.append(loki)
+        return loki
+
+    yield start
+    for loki in started:
+        loki.stop()
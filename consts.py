@@ -1,8 +1,95 @@
+import os
+
 CLAUDE_SONNET_4_LATEST='claude-sonnet-4-20250514'
 CLAUDE_SONNET_3_5_LATEST='claude-3-5-sonnet-latest'
 
 LOGS_LOOKBACK_DAYS=1
-LOGS_LIMIT_ON_EACH_FETCH=10
+LOGS_PAGE_SIZE=500
+LOGS_MAX_LINES_PER_FETCH=5000
+LOGS_MAX_LINES_PER_TOOL_CALL=50
+LOGS_MAX_LINES_PER_TOOL_CALL_LIMIT=500
 LOGS_FETCH_QUERY_ENDPOINT='https://logs-prod-028.grafana.net/loki/api/v1/query_range'
+LOKI_TAIL_ENDPOINT='wss://logs-prod-028.grafana.net/loki/api/v1/tail'
+LOGS_HTTP_POOL_SIZE=16
+LOGS_HTTP_TIMEOUT_SECONDS=30
+LOGS_PAGE_DEADLINE_SECONDS=60
+LOGS_FETCH_DEADLINE_SECONDS=180
+LOGS_FETCH_SHARDS=4
+LOGS_FETCH_MAX_WORKERS=8
+LOGS_DECODE_BATCH_SIZE=1000
+LOGS_DECODE_CHUNK_BYTES=64 * 1024
+LOGS_MAX_LINES_PER_SUMMARY=50000
+LOGS_SUMMARY_MAX_TEMPLATES=25
+LOGS_SUMMARY_EXEMPLARS=3
+LOGS_SUMMARY_RESERVOIR_SIZE=256
+LOGQL_METRIC_MAX_POINTS=120
+LOGQL_METRIC_MAX_SERIES=10
+LOGQL_METRIC_STEPS_SECONDS=(1, 5, 10, 15, 30, 60, 120, 300, 600, 900, 1800, 3600, 7200, 10800, 21600, 43200, 86400)
+
+ANOMALY_BUCKET_SECONDS=60
+ANOMALY_ZSCORE_THRESHOLD=3.5
+ANOMALY_CHANGE_POINT_WINDOW=5
+ANOMALY_CHANGE_POINT_THRESHOLD=3.0
+ANOMALY_MAX_WINDOWS=20
+
+CACHE_DIR=os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+
+LOGQL_CACHE_ENABLED=True
+LOGQL_CACHE_DB_PATH=os.path.join(CACHE_DIR, 'logql_cache.sqlite3')
+LOGQL_CACHE_MAX_MEMORY_ENTRIES=256
+LOGQL_CACHE_MAX_DISK_ENTRIES=5000
+LOGQL_CACHE_TTL_SECONDS=6 * 3600
+LOGQL_CACHE_TIME_BUCKET_SECONDS=300
+LOGQL_LLM_DEADLINE_SECONDS=60
+
+DEEPWIKI_MCP_ENDPOINT = 'https://mcp.deepwiki.com/mcp'
+DEEPWIKI_MCP_SSE_ENDPOINT = 'https://mcp.deepwiki.com/sse'
+MCP_RESULT_TTL_SECONDS=1800
+MCP_RESULT_MAX_ENTRIES=256
+MCP_CONNECT_TIMEOUT_SECONDS=30
+MCP_RECONNECT_MAX_BACKOFF_SECONDS=30
+
+REPLAY_FIXTURES_DIR=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'fixtures')
+
+CODE_INDEX_DIR=os.path.join(CACHE_DIR, 'code_index')
+CODE_INDEX_REFRESH_SECONDS=300
+CODE_INDEX_SEARCH_LIMIT=10
+# Directories whose local checkouts may be indexed, any other repo must be a GitHub owner/name slug
+CODE_INDEX_LOCAL_ROOTS=()
+
+DISPATCH_MAX_CONCURRENCY=4
+DISPATCH_TASK_TIMEOUT_SECONDS=180
+
+SERVICE_MAX_CONCURRENCY=4
+SERVICE_QUEUE_SIZE=32
+SERVICE_REQUEST_DEADLINE_SECONDS=600
+
+INCIDENTS_DB_PATH=os.path.join(CACHE_DIR, 'incidents.sqlite3')
+
+LOKI_TAIL_BUFFER_SIZE=5000
+LOKI_TAIL_MAX_LINES_PER_SECOND=200
+LOKI_TAIL_BURST_LINES=1000
+LOKI_TAIL_POLL_INTERVAL_SECONDS=2
+LOKI_TAIL_RECONNECT_ATTEMPTS=3
+LOKI_TAIL_IDLE_SECONDS=900
+LOKI_TAIL_WINDOW_SECONDS=300
+LOKI_TAIL_FIRST_LINES_TIMEOUT_SECONDS=5
+
+LOKI_RESULT_CACHE_ENABLED=True
+LOKI_RESULT_CACHE_MAX_BYTES=64 * 1024 * 1024
+LOKI_RESULT_CACHE_OPEN_TTL_SECONDS=30
+LOKI_RESULT_CACHE_SETTLE_SECONDS=120
+
+INSTRUMENTATION_ENABLED=True
+INSTRUMENTATION_JSONL_PATH=os.path.join(CACHE_DIR, 'spans.jsonl')
+# Size at which the spans file is moved to spans.jsonl.1, replacing the previous one
+INSTRUMENTATION_JSONL_MAX_BYTES=16 * 1024 * 1024
+INSTRUMENTATION_HISTOGRAM_BUCKETS=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+INSTRUMENTATION_CRITICAL_PATH_STEPS=8
 
-DEEPWIKI_MCP_ENDPOINT = 'https://mcp.deepwiki.com/mcp'
\ No newline at end of file
+CONTEXT_MAX_TOKENS=50_000
+CONTEXT_PINNED_TURNS=1
+CONTEXT_COMPACT_MIN_TOKENS=200
+CONTEXT_PREVIEW_CHARS=600
+CONTEXT_RECALL_MAX_CHARS=20_000
+CONTEXT_TOKEN_CACHE_SIZE=10_000
@@ -0,0 +1,148 @@
+"""Keeps the messages sent to the model under a token budget by compacting old tool outputs into references."""
+import logging
+import threading
+from typing import Annotated, Any, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.tools import tool
+from langgraph.prebuilt import InjectedState
+
+from consts import CONTEXT_MAX_TOKENS, CONTEXT_PINNED_TURNS, CONTEXT_COMPACT_MIN_TOKENS, \
+    CONTEXT_PREVIEW_CHARS, CONTEXT_RECALL_MAX_CHARS, CONTEXT_TOKEN_CACHE_SIZE
+from instrumentation import count
+
+logger = logging.getLogger(__name__)
+
+
+class ContextBudget:
+    """
+    pre_model_hook fitting an agent's message history into max_tokens for each model call.
+
+    The state keeps every message, only the model input is reduced. The first human message,
+    the incident question, and the latest pinned_turns AI messages with the results answering
+    them are sent unchanged. Older tool
+    results and agent answers are replaced, oldest first, by a preview and a reference until the
+    history fits, then by the reference alone. The full text stays in the graph state, which is
+    the store recall_context reads it back from. Tool call and result pairs are never split.
+    Token counts are approximate and memoized per message id.
+    """
+
+    def __init__(self, max_tokens: int = CONTEXT_MAX_TOKENS, reserved_tokens: int = 0,
+                 pinned_turns: int = CONTEXT_PINNED_TURNS, min_tokens: int = CONTEXT_COMPACT_MIN_TOKENS,
+                 preview_chars: int = CONTEXT_PREVIEW_CHARS):
+        """
+        Args:
+            max_tokens: Budget of every model call
+            reserved_tokens: Part of the budget taken by what the agent adds after the hook, e.g. its system prompt
+            pinned_turns: Number of latest model turns, with the tool results answering them, never compacted
+            min_tokens: Messages smaller than this are never compacted
+            preview_chars: Characters of a compacted message kept as its preview
+        """
+        self.max_tokens = max_tokens
+        self.reserved_tokens = reserved_tokens
+        self.pinned_turns = pinned_turns
+        self.min_tokens = min_tokens
+        self.preview_chars = preview_chars
+        self.stats = {"calls": 0, "compacted_calls": 0, "messages_compacted": 0, "tokens_elided": 0}
+        self._tokens: dict[tuple[str, int], int] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, state: dict[str, Any]) -> dict[str, list[BaseMessage]]:
+        return {"llm_input_messages": self.fit(state["messages"])}
+
+    def message_tokens(self, message: BaseMessage) -> int:
+        """Approximate tokens of a message, counted once per message id."""
+        if message.id is None:
+            return count_tokens_approximately([message])
+        key = (message.id, len(message.text()))
+        tokens = self._tokens.get(key)
+        if tokens is None:
+            tokens = count_tokens_approximately([message])
+            with self._lock:
+                if len(self._tokens) >= CONTEXT_TOKEN_CACHE_SIZE:
+                    self._tokens.clear()
+                self._tokens[key] = tokens
+        return tokens
+
+    def fit(self, messages: list[BaseMessage]) -> list[BaseMessage]:
+        """
+        Messages to send to the model in place of messages.
+
+        Returns:
+            list[BaseMessage]: Same length and order as messages, some with compacted content
+        """
+        self.stats["calls"] += 1
+        budget = self.max_tokens - self.reserved_tokens
+        tokens = [self.message_tokens(message) for message in messages]
+        total = sum(tokens)
+        if total <= budget:
+            return list(messages)
+
+        first_human = next((index for index, message in enumerate(messages) if isinstance(message, HumanMessage)), None)
+        turns = [index for index, message in enumerate(messages) if isinstance(message, AIMessage)]
+        pinned_from = turns[-min(self.pinned_turns, len(turns))] if self.pinned_turns and turns else len(messages)
+        candidates = [index for index, message in enumerate(messages[:pinned_from])
+                      if index != first_human and message.id is not None and tokens[index] >= self.min_tokens
+                      and isinstance(message, (ToolMessage, AIMessage))]
+        fitted, fitted_tokens = list(messages), list(tokens)
+        compacted = set()
+        before = total
+        for preview_chars in (self.preview_chars, 0):
+            for index in candidates:
+                if total <= budget:
+                    break
+                stub = compact_message(messages[index], tokens[index], preview_chars)
+                stub_tokens = count_tokens_approximately([stub])
+                if stub_tokens < fitted_tokens[index]:
+                    total -= fitted_tokens[index] - stub_tokens
+                    fitted[index], fitted_tokens[index] = stub, stub_tokens
+                    compacted.add(index)
+
+        self.stats["compacted_calls"] += 1
+        self.stats["messages_compacted"] += len(compacted)
+        self.stats["tokens_elided"] += before - total
+        count("context_tokens_elided", before - total)
+        logger.info(f"Compacted {len(compacted)} of {len(messages)} messages, {before} -> {total} tokens "
+                    f"(budget {budget})")
+        if total > budget:
+            logger.warning(f"History is {total} tokens after compaction, over the budget of {budget}: "
+                           f"the pinned messages alone exceed it")
+        return fitted
+
+
+def compact_message(message: BaseMessage, tokens: int, preview_chars: int) -> BaseMessage:
+    """
+    Copy of message whose content is a preview of its text and a reference for recall_context.
+
+    Tool calls of AI messages are kept, so the calls still pair with their results.
+    """
+    text = message.text()
+    what = f"result of {message.name}" if isinstance(message, ToolMessage) and message.name else \
+        f"answer of {message.name}" if message.name else "message"
+    preview = f" Preview: {text[:preview_chars]}..." if preview_chars and text else ""
+    content = (f"[Compacted {what}, {tokens} tokens.{preview} "
+               f"Call recall_context with ref=\"{message.id}\" for the full text.]")
+    return message.model_copy(update={"content": content})
+
+
+@tool
+def recall_context(ref: str, state: Annotated[dict, InjectedState], offset: int = 0) -> str:
+    """
+    Full text of an earlier message that was compacted to save context, by the ref in its placeholder.
+
+    Args:
+        ref (str): ref given in the compacted message
+        offset (int): Character to continue from when an earlier call said the text was cut
+
+    Returns:
+        str: Up to CONTEXT_RECALL_MAX_CHARS characters of the message text
+    """
+    message: Optional[BaseMessage] = next((message for message in state["messages"] if message.id == ref), None)
+    if message is None:
+        return f"No message with ref {ref} in this conversation"
+    text = message.text()
+    end = offset + CONTEXT_RECALL_MAX_CHARS
+    if end < len(text):
+        return text[offset:end] + f"\n[Cut at {end} of {len(text)} characters, call again with offset={end}]"
+    return text[offset:]
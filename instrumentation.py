@@ -0,0 +1,492 @@
+"""In-process spans, counters and histograms of investigation runs, exported as JSONL and Prometheus text."""
+import bisect
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables.config import var_child_runnable_config
+
+from consts import INSTRUMENTATION_ENABLED, INSTRUMENTATION_JSONL_PATH, INSTRUMENTATION_HISTOGRAM_BUCKETS, \
+    INSTRUMENTATION_CRITICAL_PATH_STEPS, INSTRUMENTATION_JSONL_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+METRIC_NAME_PATTERN = re.compile(r'[^a-zA-Z0-9_]')
+
+
+@dataclass
+class Span:
+    """One timed piece of a run: a graph node, LLM call, tool call, HTTP request, MCP call or prompt build."""
+    id: str
+    parent_id: Optional[str]
+    name: str
+    kind: str
+    start: float
+    end: Optional[float] = None
+    queue_wait: float = 0.0
+    error: Optional[str] = None
+    counters: dict[str, float] = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.monotonic()) - self.start
+
+    def count(self, name: str, value: float = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self, origin: float) -> dict[str, Any]:
+        return {"id": self.id, "parent_id": self.parent_id, "name": self.name, "kind": self.kind,
+                "start_seconds": round(self.start - origin, 6), "duration_seconds": round(self.duration, 6),
+                "queue_wait_seconds": round(self.queue_wait, 6), "error": self.error, **self.counters}
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+
+    def __init__(self, buckets: tuple[float, ...] = INSTRUMENTATION_HISTOGRAM_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Process-wide histograms and counters, labelled by span kind and name, rendered as Prometheus text."""
+
+    def __init__(self):
+        self.histograms: dict[tuple[str, tuple], Histogram] = {}
+        self.counters: dict[tuple[str, tuple], float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, metric: str, value: float, **labels: str) -> None:
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def increment(self, metric: str, value: float = 1, **labels: str) -> None:
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def record(self, spans: list[Span]) -> None:
+        """Add the spans of a finished run."""
+        for span in spans:
+            self.observe("cluestack_span_seconds", span.duration, kind=span.kind, name=span.name)
+            if span.queue_wait:
+                self.observe("cluestack_queue_wait_seconds", span.queue_wait, kind=span.kind, name=span.name)
+            for counter, value in span.counters.items():
+                self.increment(f"cluestack_{METRIC_NAME_PATTERN.sub('_', counter)}_total", value, kind=span.kind,
+                               name=span.name)
+            if span.error:
+                self.increment("cluestack_span_errors_total", kind=span.kind, name=span.name)
+
+    def render(self) -> str:
+        """Prometheus text exposition of every metric."""
+        lines = []
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        for metric in sorted({metric for (metric, _), _ in histograms}):
+            lines.append(f"# TYPE {metric} histogram")
+            for (name, labels), histogram in histograms:
+                if name != metric:
+                    continue
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                    lines.append(f"{metric}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{metric}_sum{_labels(labels)} {histogram.sum:.6f}")
+                lines.append(f"{metric}_count{_labels(labels)} {histogram.count}")
+        for metric in sorted({metric for (metric, _), _ in counters}):
+            lines.append(f"# TYPE {metric} counter")
+            lines.extend(f"{metric}{_labels(labels)} {_number(value)}" for (name, labels), value in counters if name == metric)
+        return "\n".join(lines) + "\n"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else f"{value:.6f}"
+
+
+def _labels(labels: tuple) -> str:
+    escaped = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for key, value in labels)
+    return "{" + ",".join(escaped) + "}" if labels else ""
+
+
+_registry = MetricsRegistry()
+
+
+def metrics_registry() -> MetricsRegistry:
+    """Return the process-wide metrics registry every finished run is recorded into."""
+    return _registry
+
+
+class RunInstrumentation:
+    """
+    Spans of one investigation run, from the graph's callbacks and from explicit span() blocks.
+
+    Graph nodes, LLM calls and tool calls are timed by the callback handler passed in the run's
+    callbacks. Work LangChain does not see, Loki HTTP requests, MCP calls or prompt building, is
+    timed with span() and nested under the tool or node it runs in.
+    """
+
+    def __init__(self, name: str, queued_at: Optional[float] = None):
+        self.name = name
+        self.spans: list[Span] = []
+        self._by_id: dict[str, Span] = {}
+        self.root = self._add(name, "run", None, queued_at)
+        self.callback = _SpanCallback(self)
+        self._lock = threading.Lock()
+
+    def start_span(self, name: str, kind: str, parent_id: Optional[str] = None, queued_at: Optional[float] = None,
+                   span_id: Optional[str] = None) -> Span:
+        with self._lock:
+            return self._add(name, kind, parent_id or self.root.id, queued_at, span_id)
+
+    def span(self, span_id: str) -> Span:
+        return self._by_id[span_id]
+
+    def finish(self) -> None:
+        self.root.end = time.monotonic()
+        for span in self.spans:
+            if span.end is None:
+                span.end = self.root.end
+                span.error = span.error or "unfinished"
+
+    def totals(self) -> dict[str, float]:
+        """Counters summed over every span, plus LLM and tool call counts."""
+        totals: dict[str, float] = {"llm_calls": 0, "tool_calls": 0}
+        for span in self.spans:
+            if span.kind in ("llm", "tool"):
+                totals[f"{span.kind}_calls"] += 1
+            for counter, value in span.counters.items():
+                totals[counter] = totals.get(counter, 0) + value
+        return totals
+
+    def critical_path(self) -> list[Span]:
+        """
+        Spans the run's wall time depended on, outermost first.
+
+        Walking back from a span's end, the child that finished last is on the path, then the child
+        that finished last before that one started, and so on, recursively into each of them.
+        """
+        children: dict[str, list[Span]] = {}
+        for span in self.spans:
+            if span.parent_id is not None:
+                children.setdefault(span.parent_id, []).append(span)
+
+        def walk(span: Span) -> list[Span]:
+            steps, cursor = [], span.end
+            for child in sorted(children.get(span.id, []), key=lambda child: child.end, reverse=True):
+                if child.end <= cursor + 1e-6:
+                    steps.append(child)
+                    cursor = child.start
+            path = [span]
+            for child in reversed(steps):
+                path.extend(walk(child))
+            return path
+
+        return walk(self.root)
+
+    def summary(self, steps: int = INSTRUMENTATION_CRITICAL_PATH_STEPS) -> str:
+        """Wall time split by kind along the critical path, and its longest steps by self time."""
+        path = self.critical_path()
+        on_path = {span.id for span in path}
+        self_times = {}
+        for span in path:
+            nested = sum(child.duration for child in path if child.parent_id == span.id and child.id in on_path)
+            self_times[span.id] = max(0.0, span.duration - nested)
+        by_kind: dict[str, float] = {}
+        for span in path:
+            by_kind[span.kind] = by_kind.get(span.kind, 0.0) + self_times[span.id]
+
+        wall = self.root.duration
+        lines = [f"Run {self.name}: {wall:.2f}s wall, {self.root.queue_wait:.2f}s queued, "
+                 f"{', '.join(f'{key} {_number(value)}' for key, value in sorted(self.totals().items()))}",
+                 "Critical path by kind: " + ", ".join(
+                     f"{kind} {seconds:.2f}s ({seconds / wall:.0%})" for kind, seconds in
+                     sorted(by_kind.items(), key=lambda item: -item[1]) if wall)]
+        for span in sorted(path, key=lambda span: -self_times[span.id])[:steps]:
+            lines.append(f"  {self_times[span.id]:8.3f}s self {span.duration:8.3f}s total  {span.kind:<6} {span.name}")
+        return "\n".join(lines)
+
+    def to_jsonl(self) -> str:
+        origin = self.root.start
+        records = [{"run": self.name, **span.to_dict(origin)} for span in self.spans]
+        records.append({"run": self.name, "summary": self.totals(), "wall_seconds": round(self.root.duration, 6),
+                        "critical_path": [span.id for span in self.critical_path()]})
+        return "".join(json.dumps(record, default=str) + "\n" for record in records)
+
+    def _add(self, name: str, kind: str, parent_id: Optional[str], queued_at: Optional[float],
+             span_id: Optional[str] = None) -> Span:
+        now = time.monotonic()
+        span = Span(span_id or uuid.uuid4().hex, parent_id, name, kind, now,
+                    queue_wait=max(0.0, now - queued_at) if queued_at is not None else 0.0)
+        self.spans.append(span)
+        self._by_id[span.id] = span
+        return span
+
+
+class _SpanCallback(BaseCallbackHandler):
+    """Turns the graph's node, LLM and tool runs into spans, nested by their parent runs."""
+    run_inline = True
+
+    def __init__(self, run: RunInstrumentation):
+        self.run = run
+        self._spans: dict[UUID, Span] = {}
+        # Chains that are not graph nodes get no span, their children nest under the closest span above
+        self._parents: dict[UUID, Optional[UUID]] = {}
+
+    def span_id(self, run_id: Optional[UUID]) -> Optional[str]:
+        while run_id is not None:
+            span = self._spans.get(run_id)
+            if span is not None:
+                return span.id
+            run_id = self._parents.get(run_id)
+        return None
+
+    def _start(self, run_id: UUID, parent_run_id: Optional[UUID], name: str, kind: str) -> None:
+        parent_id = self.span_id(parent_run_id)
+        # A span() block opened inside the parent run, e.g. around a sub-agent invocation, is the closer parent
+        explicit = _current_span.get()
+        if explicit is not None and (parent_id is None or explicit.start >= self.run.span(parent_id).start):
+            parent_id = explicit.id
+        self._spans[run_id] = self.run.start_span(name, kind, parent_id, span_id=run_id.hex)
+
+    def _end(self, run_id: UUID, error: Optional[BaseException] = None) -> Optional[Span]:
+        span = self._spans.get(run_id)
+        if span is not None:
+            span.end = time.monotonic()
+            if error is not None:
+                span.error = f"{type(error).__name__}: {error}"
+        return span
+
+    def on_chain_start(self, serialized: Optional[dict], inputs: Any, *, run_id: UUID,
+                       parent_run_id: Optional[UUID] = None, metadata: Optional[dict] = None, **kwargs: Any) -> None:
+        self._parents[run_id] = parent_run_id
+        node = (metadata or {}).get("langgraph_node")
+        parent = self._spans.get(parent_run_id)
+        # An agent subgraph runs as a chain of the same name inside its own node, one span covers both
+        if node is not None and kwargs.get("name") == node and not (parent and parent.name == node):
+            self._start(run_id, parent_run_id, node, "node")
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error)
+
+    def on_chat_model_start(self, serialized: Optional[dict], messages: Any, *, run_id: UUID,
+                            parent_run_id: Optional[UUID] = None, metadata: Optional[dict] = None,
+                            **kwargs: Any) -> None:
+        name = (metadata or {}).get("ls_model_name") or kwargs.get("name") or "chat_model"
+        self._start(run_id, parent_run_id, name, "llm")
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        span = self._end(run_id)
+        if span is None:
+            return
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                details = usage.get("input_token_details") or {}
+                span.count("input_tokens", usage.get("input_tokens", 0))
+                span.count("output_tokens", usage.get("output_tokens", 0))
+                if details.get("cache_read"):
+                    span.count("cache_hits.prompt", details["cache_read"])
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error)
+
+    def on_tool_start(self, serialized: Optional[dict], input_str: str, *, run_id: UUID,
+                      parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self._start(run_id, parent_run_id, kwargs.get("name") or (serialized or {}).get("name") or "tool", "tool")
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error)
+
+
+_current_run: ContextVar[Optional[RunInstrumentation]] = ContextVar("instrumentation_run", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("instrumentation_span", default=None)
+
+
+def current_run() -> Optional[RunInstrumentation]:
+    """Instrumentation of the run in this context, None outside of one or when disabled."""
+    return _current_run.get()
+
+
+_jsonl_lock = threading.Lock()
+
+
+def append_spans(path: str, text: str, max_bytes: int = INSTRUMENTATION_JSONL_MAX_BYTES) -> None:
+    """
+    Append the JSONL of a run to path, first moving the file to path.1 if it would grow beyond max_bytes.
+
+    At most the current file and one rotated file are kept, the older spans are dropped.
+
+    Raises:
+        OSError: If the file cannot be written
+    """
+    data = text.encode('utf-8')
+    with _jsonl_lock:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            size = 0
+        if size and size + len(data) > max_bytes:
+            os.replace(path, f"{path}.1")
+        with open(path, 'ab') as file:
+            file.write(data)
+
+
+@contextmanager
+def instrumented_run(name: str, queued_at: Optional[float] = None,
+                     jsonl_path: Optional[str] = INSTRUMENTATION_JSONL_PATH) -> Iterator[Optional[RunInstrumentation]]:
+    """
+    Instrument a run: pass run.callback in its callbacks, span() blocks inside it are recorded.
+
+    When the block ends the spans go to the process-wide metrics registry and are appended to
+    jsonl_path, rotated by size, see append_spans, and the critical-path summary is logged.
+
+    Args:
+        name: Name of the run, e.g. the incident id
+        queued_at: time.monotonic() when the run was queued, to record how long it waited
+        jsonl_path: File the spans are appended to, None to not write any
+
+    Yields:
+        Optional[RunInstrumentation]: The run, None when INSTRUMENTATION_ENABLED is off
+    """
+    if not INSTRUMENTATION_ENABLED:
+        yield None
+        return
+    run = RunInstrumentation(name, queued_at)
+    run_token, span_token = _current_run.set(run), _current_span.set(None)
+    try:
+        yield run
+    except BaseException as e:
+        run.root.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_run.reset(run_token)
+        _current_span.reset(span_token)
+        run.finish()
+        metrics_registry().record(run.spans)
+        if jsonl_path:
+            try:
+                append_spans(jsonl_path, run.to_jsonl())
+            except OSError as e:
+                logger.warning(f"Could not write spans to {jsonl_path}: {e}")
+        logger.info(run.summary())
+
+
+class _NoSpan:
+    """Stands in for a span outside of an instrumented run, counting nothing."""
+
+    def count(self, name: str, value: float = 1) -> None:
+        pass
+
+
+@contextmanager
+def span(name: str, kind: str, queued_at: Optional[float] = None) -> Iterator[Any]:
+    """
+    Time a block as a span of the current run, nested under the enclosing span, tool or graph node.
+
+    Args:
+        name: Span name, e.g. 'loki.query_range'
+        kind: Span kind, e.g. 'http', 'mcp', 'prompt'
+        queued_at: time.monotonic() when the work was queued, to record how long it waited
+
+    Yields:
+        Span: Call count(name, value) on it to record bytes, cache hits and the like
+    """
+    run = _current_run.get()
+    if run is None:
+        yield _NoSpan()
+        return
+    current = run.start_span(name, kind, _parent_span_id(run), queued_at)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end = time.monotonic()
+        _current_span.reset(token)
+
+
+def count(name: str, value: float = 1) -> None:
+    """Add to a counter of the innermost span, e.g. count('cache_hits.logql'), a no-op outside a run."""
+    run = _current_run.get()
+    if run is None:
+        return
+    current = _current_span.get()
+    if current is None:
+        parent_id = _parent_span_id(run)
+        current = run.span(parent_id) if parent_id is not None else run.root
+    current.count(name, value)
+
+
+def _parent_span_id(run: RunInstrumentation) -> Optional[str]:
+    current = _current_span.get()
+    if current is not None:
+        return current.id
+    # Inside a tool or node the running LangChain config knows which run it belongs to
+    config = var_child_runnable_config.get() or {}
+    parent_run_id = getattr(config.get("callbacks"), "parent_run_id", None)
+    return run.callback.span_id(parent_run_id) if parent_run_id is not None else None
+
+
+def serve_metrics(port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """
+    Serve the registry's Prometheus text on http://host:port/metrics from a background thread.
+
+    Returns:
+        ThreadingHTTPServer: Running server, call shutdown() to stop it
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics_registry().render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name='metrics-server').start()
+    logger.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
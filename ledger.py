@@ -0,0 +1,79 @@
+"""Per-investigation record of the logs and source code fetched by the agents' tools."""
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterable, Iterator, Optional
+
+from LoggingAgent.schema import LogItem
+
+logger = logging.getLogger(__name__)
+
+
+def log_key(item: LogItem) -> tuple:
+    return item.asctime, item.name, item.filename, item.lineno, item.message
+
+
+class FetchLedger:
+    """
+    Logs and source code fetched during one run of an incident investigation.
+
+    Tools record what they fetch here instead of relying on the agents to pass it along, the
+    investigation runner then stores the new items in the incident's checkpointed state. The
+    logs already stored for the incident tell incremental fetches where to resume.
+    """
+
+    def __init__(self, known_logs: Iterable[LogItem] = (), known_codebase: Iterable[str] = ()):
+        self._known_log_keys = {log_key(item) for item in known_logs}
+        self._known_codebase = set(known_codebase)
+        self._last_log_time = max((key[0] for key in self._known_log_keys), default=None)
+        self.logs: list[LogItem] = []
+        self.codebase: list[str] = []
+
+    def last_log_time(self) -> Optional[str]:
+        """asctime of the newest log stored or fetched so far, None if there is none."""
+        return self._last_log_time
+
+    def record_logs(self, items: Iterable[LogItem]) -> list[LogItem]:
+        """
+        Record fetched log lines.
+
+        Returns:
+            list[LogItem]: The lines that were not stored or fetched before, in input order
+        """
+        new = []
+        for item in items:
+            key = log_key(item)
+            if key not in self._known_log_keys:
+                self._known_log_keys.add(key)
+                new.append(item)
+        if new:
+            self.logs.extend(new)
+            newest = max(item.asctime for item in new)
+            self._last_log_time = max(self._last_log_time or newest, newest)
+        return new
+
+    def record_code(self, sources: Iterable[str]) -> None:
+        """Record fetched source code snippets."""
+        for source in sources:
+            if source not in self._known_codebase:
+                self._known_codebase.add(source)
+                self.codebase.append(source)
+
+
+_current_ledger: ContextVar[Optional[FetchLedger]] = ContextVar("fetch_ledger", default=None)
+
+
+def current_ledger() -> Optional[FetchLedger]:
+    """Ledger of the investigation running in this context, None outside of one."""
+    return _current_ledger.get()
+
+
+@contextmanager
+def fetch_ledger(known_logs: Iterable[LogItem] = (), known_codebase: Iterable[str] = ()) -> Iterator[FetchLedger]:
+    """Make a new ledger current for the duration of the block, including tasks and tools started in it."""
+    ledger = FetchLedger(known_logs, known_codebase)
+    token = _current_ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _current_ledger.reset(token)
@@ -0,0 +1,117 @@
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Iterator, Optional
+
+from langchain.chat_models import init_chat_model
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import SystemMessage
+from langchain_core.outputs import LLMResult
+
+from consts import CLAUDE_SONNET_4_LATEST
+
+logger = logging.getLogger(__name__)
+
+EPHEMERAL_CACHE_CONTROL = {"type": "ephemeral"}
+
+_chat_model_override: ContextVar[Optional[BaseChatModel]] = ContextVar("chat_model_override", default=None)
+
+
+def chat_model(model_name: str = CLAUDE_SONNET_4_LATEST) -> BaseChatModel:
+    """
+    Return the chat model for model_name, created on first use and shared by every agent.
+
+    Inside use_chat_model the overriding model is returned instead, whatever model_name is.
+
+    Args:
+        model_name: Anthropic model name
+
+    Returns:
+        BaseChatModel: Shared chat model instance
+    """
+    override = _chat_model_override.get()
+    if override is not None:
+        return override
+    return _anthropic_chat_model(model_name)
+
+
+@lru_cache(maxsize=None)
+def _anthropic_chat_model(model_name: str) -> BaseChatModel:
+    return init_chat_model(f"anthropic:{model_name}")
+
+
+def chat_model_override() -> Optional[BaseChatModel]:
+    """Model set by the enclosing use_chat_model, None outside of one."""
+    return _chat_model_override.get()
+
+
+@contextmanager
+def use_chat_model(model: BaseChatModel) -> Iterator[BaseChatModel]:
+    """
+    Make every chat_model call in the block, including in tasks and tools started in it, return model.
+
+    Used to run the agents against recorded or fake models, see replay.
+    """
+    token = _chat_model_override.set(model)
+    try:
+        yield model
+    finally:
+        _chat_model_override.reset(token)
+
+
+def cached_system_message(static_prompt: str, dynamic_prompt: Optional[str] = None) -> SystemMessage:
+    """
+    Build a system message whose static prefix carries an Anthropic cache-control breakpoint.
+
+    Per-call values go in dynamic_prompt, after the breakpoint, so they never invalidate the
+    cached prefix.
+
+    Args:
+        static_prompt: Prompt text identical across calls
+        dynamic_prompt: Optional per-call text appended after the cached prefix
+
+    Returns:
+        SystemMessage: Message with one text block per part
+    """
+    content = [{"type": "text", "text": static_prompt, "cache_control": EPHEMERAL_CACHE_CONTROL}]
+    if dynamic_prompt:
+        content.append({"type": "text", "text": dynamic_prompt})
+    return SystemMessage(content=content)
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """
+    Accumulates token usage, including prompt cache reads and writes, over every LLM call of a run.
+
+    Pass an instance in the run config's callbacks, it is propagated to sub-agents and tools.
+    """
+
+    def __init__(self):
+        self.usage = {"llm_calls": 0, "input_tokens": 0, "output_tokens": 0, "cache_read": 0, "cache_creation": 0}
+        self._lock = threading.Lock()
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if not usage:
+                    continue
+                details = usage.get("input_token_details") or {}
+                with self._lock:
+                    self.usage["llm_calls"] += 1
+                    self.usage["input_tokens"] += usage.get("input_tokens", 0)
+                    self.usage["output_tokens"] += usage.get("output_tokens", 0)
+                    self.usage["cache_read"] += details.get("cache_read") or 0
+                    self.usage["cache_creation"] += details.get("cache_creation") or 0
+
+    def report(self) -> str:
+        """One line summary of the run's token usage."""
+        usage = self.usage
+        prompt_tokens = usage["input_tokens"]
+        hit_rate = usage["cache_read"] / prompt_tokens if prompt_tokens else 0.0
+        return (f"{usage['llm_calls']} LLM calls, {prompt_tokens} input tokens "
+                f"({usage['cache_read']} cache read, {usage['cache_creation']} cache write, {hit_rate:.0%} cached), "
+                f"{usage['output_tokens']} output tokens")
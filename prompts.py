@@ -0,0 +1,125 @@
+import hashlib
+import logging
+import os
+import string
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
+
+from utils import read_file
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """An immutable prompt file loaded into memory."""
+    name: str
+    path: str
+    text: str
+    fields: frozenset[str]
+    mtime: float
+    digest: str
+
+
+def template_fields(text: str) -> frozenset[str]:
+    """Return the str.format placeholders used in text."""
+    return frozenset(field for _, field, _, _ in string.Formatter().parse(text) if field)
+
+
+class PromptRegistry:
+    """
+    Loads prompt files once, validates their placeholders and serves them from memory.
+
+    Every template is registered with the exact set of placeholders it must contain, so a
+    renamed or missing placeholder fails at startup rather than on the first tool call.
+    Files are re-read only when their mtime changes, and rendered static prompts are
+    memoized on the digests of the templates they were built from.
+    """
+
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+        self._specs: dict[str, tuple[str, frozenset[str]]] = {}
+        self._templates: dict[str, PromptTemplate] = {}
+        self._rendered: dict[tuple, str] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, relative_path: str, fields: tuple[str, ...] = ()) -> 'PromptRegistry':
+        """
+        Register and load a template.
+
+        Args:
+            name: Name used to look the template up
+            relative_path: Path of the file relative to the registry's base directory
+            fields: Placeholders the template must contain, nothing else is allowed
+
+        Returns:
+            The registry, so registrations can be chained
+
+        Raises:
+            FileNotFoundError: If the file does not exist
+            ValueError: If the placeholders in the file do not match fields
+        """
+        with self._lock:
+            self._specs[name] = (os.path.join(self.base_dir, relative_path), frozenset(fields))
+            self._templates[name] = self._load(name)
+        return self
+
+    def get(self, name: str) -> PromptTemplate:
+        """Return a template, reloading it first if its file changed on disk."""
+        with self._lock:
+            template = self._templates[name]
+            if os.path.getmtime(template.path) != template.mtime:
+                logger.info(f"Prompt {name} changed on disk, reloading {template.path}")
+                template = self._templates[name] = self._load(name)
+            return template
+
+    def render(self, name: str, **includes: str) -> str:
+        """
+        Render a template whose placeholders are filled with other registered templates.
+
+        Args:
+            name: Template to render
+            **includes: Placeholder name to the name of the template whose text fills it
+
+        Returns:
+            The rendered text, memoized until one of the involved files changes
+        """
+        template = self.get(name)
+        included = {field: self.get(include) for field, include in includes.items()}
+        key = (template.digest,) + tuple(sorted((field, t.digest) for field, t in included.items()))
+        with self._lock:
+            rendered = self._rendered.get(key)
+            if rendered is None:
+                rendered = template.text.format(**{field: t.text for field, t in included.items()})
+                self._rendered[key] = rendered
+            return rendered
+
+    def digest(self, *names: str) -> str:
+        """Combined digest of the given templates, changes whenever any of them is edited."""
+        combined = hashlib.sha256()
+        for name in names:
+            combined.update(self.get(name).digest.encode('utf-8'))
+        return combined.hexdigest()
+
+    @property
+    def templates(self) -> Mapping[str, PromptTemplate]:
+        """Read-only view of the currently loaded templates."""
+        return MappingProxyType(self._templates)
+
+    def _load(self, name: str) -> PromptTemplate:
+        path, expected = self._specs[name]
+        mtime = os.path.getmtime(path)
+        text = read_file(path)
+        fields = template_fields(text) if expected else frozenset()
+        if fields != expected:
+            raise ValueError(f"Prompt {name} at {path} has placeholders {sorted(fields)}, expected {sorted(expected)}")
+        return PromptTemplate(
+            name=name,
+            path=path,
+            text=text,
+            fields=fields,
+            mtime=mtime,
+            digest=hashlib.sha256(text.encode('utf-8')).hexdigest()
+        )
@@ -0,0 +1,624 @@
+"""Record and replay of LLM responses, Loki pages, MCP tool results and indexed code, to run the agents fully offline."""
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Optional, Sequence
+from urllib.parse import urlparse, parse_qs
+
+import httpx
+import requests
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.tools import ToolException
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import Field
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from CodebaseAgent.code_index import CodeIndex, shared_code_index, use_code_indexes
+from CodebaseAgent.mcp_session import MCPSessionManager
+from LoggingAgent.fake_loki import FakeLoki, QUERY_RANGE_PATH
+from LoggingAgent.log_decode import decode_query_range
+from LoggingAgent.loki_async import set_async_client
+from LoggingAgent.loki_client import get_session, set_session
+from LoggingAgent.loki_result_cache import get_loki_result_cache, normalize_logql
+from consts import DEEPWIKI_MCP_SSE_ENDPOINT, LOGS_HTTP_POOL_SIZE, LOGS_HTTP_TIMEOUT_SECONDS
+from instrumentation import span
+from models import chat_model, use_chat_model
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_VERSION = 1
+
+
+class ReplayMissError(Exception):
+    """A request was made that the cassette holds no recording for."""
+
+
+@dataclass
+class InjectedLatency:
+    """
+    Delays added to replayed calls, the recorded latency of each call when a fixed value is not set.
+
+    All delays are multiplied by scale, 0 replays as fast as possible.
+    """
+    llm_seconds: Optional[float] = None
+    loki_seconds: Optional[float] = None
+    mcp_seconds: Optional[float] = None
+    scale: float = 1.0
+
+    def delay(self, fixed: Optional[float], recorded: float) -> float:
+        return (fixed if fixed is not None else recorded) * self.scale
+
+
+class Cassette:
+    """
+    Recordings of one investigation, kept in one JSON fixture file.
+
+    LLM responses are recorded per scope, the bound tools and the first human message of the
+    conversation, and replayed in order within a scope, so agents running concurrently on
+    different tasks replay deterministically. Loki lines are kept per normalized query and
+    served like Loki would from any window, whatever the paging, sharding or caching of the
+    replaying run. Results of metric queries are replayed in order per normalized query. MCP
+    results are replayed in order per tool name and arguments. The code of every repository the
+    code index tools looked at is kept as a snapshot of its indexed files, which the replay
+    indexes again instead of cloning the repository.
+    """
+
+    def __init__(self, path: str, data: Optional[dict] = None):
+        self.path = path
+        self.data = data or {
+            "version": CASSETTE_VERSION, "recorded_at_ns": time.time_ns(), "recorded_until_ns": None,
+            "llm": {}, "loki": {"queries": {}, "latencies": []}, "loki_matrix": {},
+            "mcp": {"tools": [], "calls": {}}, "code": {},
+        }
+        # Cassettes recorded before metric queries or the code index existed have no results of them
+        self.data.setdefault("loki_matrix", {})
+        self.data.setdefault("code", {})
+        self.stats = {"llm_calls": 0, "loki_requests": 0, "loki_bytes": 0, "mcp_calls": 0, "mcp_bytes": 0}
+        self._cursors: dict[tuple[str, str], int] = defaultdict(int)
+        self._loki_seen: dict[str, set[tuple[int, str]]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> 'Cassette':
+        """
+        Load a recorded cassette.
+
+        Raises:
+            ValueError: If the file is not a cassette of this version
+        """
+        with open(path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        if data.get("version") != CASSETTE_VERSION:
+            raise ValueError(f"{path} is not a version {CASSETTE_VERSION} cassette")
+        return cls(path, data)
+
+    def save(self) -> None:
+        self.data["recorded_until_ns"] = time.time_ns()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as file:
+            json.dump(self.data, file)
+        logger.info(f"Saved cassette {self.path}: {self.stats}")
+
+    def record_llm(self, scope: str, message: AIMessage, latency: float) -> None:
+        with self._lock:
+            self.data["llm"].setdefault(scope, []).append({"message": message_to_dict(message), "latency": latency})
+            self.stats["llm_calls"] += 1
+
+    def replay_llm(self, scope: str) -> tuple[AIMessage, float]:
+        record = self._next("llm", scope)
+        self.stats["llm_calls"] += 1
+        return messages_from_dict([record["message"]])[0], record["latency"]
+
+    def record_loki(self, logql_query: str, entries: list[tuple[int, str]], nbytes: int, latency: float) -> None:
+        query = normalize_logql(logql_query)
+        with self._lock:
+            seen = self._loki_seen.setdefault(query, set())
+            stored = self.data["loki"]["queries"].setdefault(query, [])
+            for entry in entries:
+                if entry not in seen:
+                    seen.add(entry)
+                    stored.append(list(entry))
+            self.data["loki"]["latencies"].append(latency)
+            self.stats["loki_requests"] += 1
+            self.stats["loki_bytes"] += nbytes
+
+    def record_loki_matrix(self, logql_query: str, result: dict, nbytes: int, latency: float) -> None:
+        with self._lock:
+            self.data["loki_matrix"].setdefault(normalize_logql(logql_query), []).append({"result": result})
+            self.data["loki"]["latencies"].append(latency)
+            self.stats["loki_requests"] += 1
+            self.stats["loki_bytes"] += nbytes
+
+    def replay_loki_matrix(self, logql_query: str) -> dict:
+        return self._next("loki_matrix", normalize_logql(logql_query))["result"]
+
+    def loki_entries(self, logql_query: str) -> list[tuple[int, str]]:
+        entries = self.data["loki"]["queries"].get(normalize_logql(logql_query))
+        if entries is None:
+            raise ReplayMissError(f"No Loki lines recorded for {logql_query} in {self.path}")
+        return [(int(ts), line) for ts, line in entries]
+
+    def loki_latency(self) -> float:
+        latencies = self.data["loki"]["latencies"]
+        return sum(latencies) / len(latencies) if latencies else 0.0
+
+    def replay_window(self, start_ns: int, end_ns: int) -> tuple[int, int]:
+        """
+        Window of a replayed Loki request in recording time.
+
+        Windows ending after the recording finished can only be relative to now, like the default
+        lookback, and are moved back by the time elapsed since the recording. Absolute windows,
+        e.g. times the recorded LLM picked, are served as they are.
+        """
+        offset = time.time_ns() - self.data["recorded_at_ns"]
+        if end_ns > (self.data["recorded_until_ns"] or self.data["recorded_at_ns"]):
+            return start_ns - offset, end_ns - offset
+        return start_ns, end_ns
+
+    def record_mcp(self, name: str, arguments: dict, text: str, latency: float, error: bool = False) -> None:
+        with self._lock:
+            self.data["mcp"]["calls"].setdefault(_mcp_key(name, arguments), []).append(
+                {"text": text, "latency": latency, "error": error})
+            self.stats["mcp_calls"] += 1
+            self.stats["mcp_bytes"] += len(text.encode('utf-8'))
+
+    def replay_mcp(self, name: str, arguments: dict) -> dict:
+        record = self._next("mcp", _mcp_key(name, arguments))
+        self.stats["mcp_calls"] += 1
+        self.stats["mcp_bytes"] += len(record["text"].encode('utf-8'))
+        return record
+
+    def record_code(self, index: CodeIndex) -> None:
+        """Snapshot the indexed files of a repository, once per cassette."""
+        with self._lock:
+            if index.repo in self.data["code"]:
+                return
+        snapshot = {"commit": index.commit, "files": index.sources()}
+        with self._lock:
+            self.data["code"].setdefault(index.repo, snapshot)
+
+    def code_snapshot(self, repo: str) -> dict:
+        snapshot = self.data["code"].get(repo)
+        if snapshot is None:
+            raise ReplayMissError(f"No code recorded for {repo} in {self.path}")
+        return snapshot
+
+    def _next(self, section: str, key: str) -> dict:
+        recordings = self.data[section]["calls"] if section == "mcp" else self.data[section]
+        with self._lock:
+            position = self._cursors[(section, key)]
+            records = recordings.get(key, [])
+            if position >= len(records):
+                raise ReplayMissError(f"No {section} recording #{position + 1} for {key[:80]} in {self.path}")
+            self._cursors[(section, key)] += 1
+            return records[position]
+
+
+def _mcp_key(name: str, arguments: dict) -> str:
+    return json.dumps([name, arguments], sort_keys=True)
+
+
+class _CassetteChatModel(BaseChatModel):
+    """Chat model bound to a cassette, keeps bind_tools arguments to scope its recordings."""
+    cassette: Any
+    bound_tools: list = []
+    bind_kwargs: dict = {}
+
+    def bind_tools(self, tools: Sequence[Any], *, parallel_tool_calls: Optional[bool] = None,
+                   **kwargs: Any) -> '_CassetteChatModel':
+        if parallel_tool_calls is not None:
+            kwargs["parallel_tool_calls"] = parallel_tool_calls
+        return self.model_copy(update={"bound_tools": list(tools), "bind_kwargs": kwargs})
+
+    def scope(self, messages: list[BaseMessage]) -> str:
+        """Recording scope of a call, the bound tool names and the conversation's first human message."""
+        tool_names = sorted(convert_to_openai_tool(tool)["function"]["name"] for tool in self.bound_tools)
+        task = next((message.text() for message in messages if message.type == "human"), "")
+        digest = hashlib.sha256(json.dumps([tool_names, task]).encode('utf-8')).hexdigest()[:16]
+        return f"{','.join(tool_names)[:120]}#{digest}"
+
+
+class RecordingChatModel(_CassetteChatModel):
+    """Calls the real model and records every response in the cassette."""
+    inner: BaseChatModel
+
+    @property
+    def _llm_type(self) -> str:
+        return "recording"
+
+    def _bound(self):
+        return self.inner.bind_tools(self.bound_tools, **self.bind_kwargs) if self.bound_tools else self.inner
+
+    def _generate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager: Any = None,
+                  **kwargs: Any) -> ChatResult:
+        started = time.monotonic()
+        # Without callbacks, the outer call already reports this one to the run's handlers
+        message = self._bound().invoke(messages, stop=stop, config={"callbacks": []})
+        self.cassette.record_llm(self.scope(messages), message, time.monotonic() - started)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager: Any = None,
+                         **kwargs: Any) -> ChatResult:
+        started = time.monotonic()
+        message = await self._bound().ainvoke(messages, stop=stop, config={"callbacks": []})
+        self.cassette.record_llm(self.scope(messages), message, time.monotonic() - started)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class ReplayChatModel(_CassetteChatModel):
+    """Answers every call with the next response recorded for its scope, after the injected latency."""
+    latency: InjectedLatency = Field(default_factory=InjectedLatency)
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def _generate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager: Any = None,
+                  **kwargs: Any) -> ChatResult:
+        message, recorded = self.cassette.replay_llm(self.scope(messages))
+        time.sleep(self.latency.delay(self.latency.llm_seconds, recorded))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager: Any = None,
+                         **kwargs: Any) -> ChatResult:
+        message, recorded = self.cassette.replay_llm(self.scope(messages))
+        await asyncio.sleep(self.latency.delay(self.latency.llm_seconds, recorded))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def _is_query_range(url: str) -> bool:
+    return urlparse(url).path.endswith(QUERY_RANGE_PATH)
+
+
+def _query_params(url: str) -> dict[str, str]:
+    return {key: values[-1] for key, values in parse_qs(urlparse(url).query).items()}
+
+
+def _rebased(url: str, base_url: Optional[str]) -> str:
+    """url sent to the scheme and host of base_url instead, when one is given."""
+    if base_url is None:
+        return url
+    base = urlparse(base_url)
+    return urlparse(url)._replace(scheme=base.scheme, netloc=base.netloc).geturl()
+
+
+def _record_body(cassette: 'Cassette', url: str, body: bytes, latency: float) -> None:
+    """Record a query_range response, the lines of a log query or the whole result of a metric query."""
+    params = _query_params(url)
+    if "step" in params:
+        cassette.record_loki_matrix(params["query"], json.loads(body), len(body), latency)
+        return
+    _, entries = decode_query_range([body])
+    cassette.record_loki(params["query"], entries, len(body), latency)
+
+
+def _replay_body(cassette: 'Cassette', url: str) -> bytes:
+    """query_range response to a request URL from what was recorded for its query, counted in the stats."""
+    if not _is_query_range(url):
+        raise ReplayMissError(f"Only query_range requests are replayed, not {url}")
+    params = _query_params(url)
+    start_ns = int(params["start"])
+    params["start"], params["end"] = map(str, cassette.replay_window(start_ns, int(params["end"])))
+    if "step" in params:
+        result = cassette.replay_loki_matrix(params["query"])
+        # Samples are moved like the window, to the times of the replaying request
+        shift = (start_ns - int(params["start"])) / 1e9
+        for series in result.get("data", {}).get("result", []):
+            series["values"] = [[ts + shift, value] for ts, value in series["values"]]
+        body = json.dumps(result).encode('utf-8')
+    else:
+        body = json.dumps(FakeLoki(cassette.loki_entries(params["query"])).query_range(params)).encode('utf-8')
+    cassette.stats["loki_requests"] += 1
+    cassette.stats["loki_bytes"] += len(body)
+    return body
+
+
+class RecordingLokiAdapter(HTTPAdapter):
+    """Sends Loki requests for real, to base_url when given, and records every query_range response."""
+
+    def __init__(self, cassette: Cassette, base_url: Optional[str] = None, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+        self.base_url = base_url
+
+    def send(self, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:
+        request.url = _rebased(request.url, self.base_url)
+        started = time.monotonic()
+        response = super().send(request, **kwargs)
+        if response.status_code == 200 and _is_query_range(request.url):
+            _record_body(self.cassette, request.url, response.content, time.monotonic() - started)
+        return response
+
+
+class ReplayLokiAdapter(BaseAdapter):
+    """Answers query_range requests from the cassette, after the injected latency."""
+
+    def __init__(self, cassette: Cassette, latency: InjectedLatency):
+        super().__init__()
+        self.cassette = cassette
+        self.latency = latency
+
+    def send(self, request: requests.PreparedRequest, stream: bool = False, timeout: Any = None, verify: Any = True,
+             cert: Any = None, proxies: Any = None) -> requests.Response:
+        body = _replay_body(self.cassette, request.url)
+        time.sleep(self.latency.delay(self.latency.loki_seconds, self.cassette.loki_latency()))
+
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.headers = CaseInsensitiveDict({"Content-Type": "application/json", "Content-Length": str(len(body))})
+        response.encoding = "utf-8"
+        response.raw = io.BytesIO(body)
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self) -> None:
+        pass
+
+
+class RecordingLokiTransport(httpx.AsyncBaseTransport):
+    """Async RecordingLokiAdapter, for the httpx client of the async log tools."""
+
+    def __init__(self, cassette: Cassette, base_url: Optional[str] = None):
+        self.cassette = cassette
+        self.base_url = base_url
+        self._inner = httpx.AsyncHTTPTransport(limits=httpx.Limits(max_connections=LOGS_HTTP_POOL_SIZE))
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.base_url is not None:
+            request.url = httpx.URL(_rebased(str(request.url), self.base_url))
+            request.headers["Host"] = request.url.netloc.decode('ascii')
+        started = time.monotonic()
+        response = await self._inner.handle_async_request(request)
+        if response.status_code != 200 or not _is_query_range(str(request.url)):
+            return response
+        body = await response.aread()
+        _record_body(self.cassette, str(request.url), body, time.monotonic() - started)
+        return httpx.Response(response.status_code, headers=response.headers, content=body, request=request)
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
+
+
+class ReplayLokiTransport(httpx.AsyncBaseTransport):
+    """Async ReplayLokiAdapter, for the httpx client of the async log tools."""
+
+    def __init__(self, cassette: Cassette, latency: InjectedLatency):
+        self.cassette = cassette
+        self.latency = latency
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = _replay_body(self.cassette, str(request.url))
+        await asyncio.sleep(self.latency.delay(self.latency.loki_seconds, self.cassette.loki_latency()))
+        return httpx.Response(200, headers={"Content-Type": "application/json"}, content=body, request=request)
+
+
+class RecordingMCPManager(MCPSessionManager):
+    """Serves tool calls over a real MCP session and records the tool list and every result."""
+
+    def __init__(self, cassette: Cassette, url: str = DEEPWIKI_MCP_SSE_ENDPOINT):
+        super().__init__(url)
+        self.cassette = cassette
+
+    async def get_tools(self):
+        tools = await super().get_tools()
+        self.cassette.data["mcp"]["tools"] = self._tool_specs
+        return tools
+
+    async def call_tool(self, name: str, arguments: dict[str, Any]) -> str:
+        started = time.monotonic()
+        try:
+            text = await super().call_tool(name, arguments)
+        except ToolException as e:
+            self.cassette.record_mcp(name, arguments, str(e), time.monotonic() - started, error=True)
+            raise
+        self.cassette.record_mcp(name, arguments, text, time.monotonic() - started)
+        return text
+
+
+class ReplayMCPManager(MCPSessionManager):
+    """Serves the recorded tool list and results without connecting to any server."""
+
+    def __init__(self, cassette: Cassette, latency: InjectedLatency, url: str = DEEPWIKI_MCP_SSE_ENDPOINT):
+        super().__init__(url)
+        self.cassette = cassette
+        self.latency = latency
+        self._tool_specs = cassette.data["mcp"]["tools"]
+
+    def _load_tool_cache(self) -> None:
+        pass
+
+    def start(self) -> None:
+        pass
+
+    async def get_tools(self):
+        return [self._to_langchain_tool(spec) for spec in self._tool_specs]
+
+    async def call_tool(self, name: str, arguments: dict[str, Any]) -> str:
+        with span(f"mcp.{name}", "mcp") as call_span:
+            record = self.cassette.replay_mcp(name, arguments)
+            await asyncio.sleep(self.latency.delay(self.latency.mcp_seconds, record["latency"]))
+            call_span.count("bytes_fetched", len(record["text"].encode('utf-8')))
+            if record["error"]:
+                raise ToolException(record["text"])
+            return record["text"]
+
+
+def _read_checkout(directory: str) -> dict:
+    """Snapshot of the Python files of a local directory, as Cassette.record_code keeps them."""
+    files = {}
+    for parent, _, names in os.walk(directory):
+        for name in names:
+            if name.endswith('.py'):
+                path = os.path.join(parent, name)
+                with open(path, 'r', encoding='utf-8', errors='replace') as file:
+                    files[os.path.relpath(path, directory).replace(os.sep, '/')] = file.read()
+    return {"commit": None, "files": files}
+
+
+class _SnapshotCodeIndexes:
+    """
+    Resolves repositories to indexes of code snapshots written to a temporary directory, never cloning or pulling.
+
+    snapshot(repo) returns the files to index, see Cassette.record_code.
+    """
+
+    def __init__(self, snapshot: Callable[[str], dict]):
+        self.snapshot = snapshot
+        self._directory = tempfile.TemporaryDirectory(prefix='replay-code-')
+        self._indexes: dict[str, CodeIndex] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, repo: str) -> CodeIndex:
+        with self._lock:
+            index = self._indexes.get(repo)
+            if index is None:
+                index = self._indexes[repo] = self._index(repo, self.snapshot(repo))
+            return index
+
+    def _index(self, repo: str, snapshot: dict) -> CodeIndex:
+        index_dir = os.path.join(self._directory.name, str(len(self._indexes)))
+        index = CodeIndex(repo, index_dir=index_dir)
+        for path, source in snapshot["files"].items():
+            full = os.path.join(index.root, path)
+            os.makedirs(os.path.dirname(full), exist_ok=True)
+            with open(full, 'w', encoding='utf-8') as file:
+                file.write(source)
+        index.refresh()
+        index.commit = snapshot["commit"]
+        return index
+
+    def close(self) -> None:
+        self._directory.cleanup()
+
+
+class RecordingCodeIndexes(_SnapshotCodeIndexes):
+    """
+    Serves the shared code indexes and snapshots every repository looked at into the cassette.
+
+    Repositories in checkouts are indexed from those local directories instead of their GitHub clones.
+    """
+
+    def __init__(self, cassette: Cassette, checkouts: Optional[dict[str, str]] = None):
+        self.checkouts = checkouts or {}
+        super().__init__(lambda repo: _read_checkout(self.checkouts[repo]))
+        self.cassette = cassette
+
+    def __call__(self, repo: str) -> CodeIndex:
+        index = super().__call__(repo) if repo in self.checkouts else shared_code_index(repo)
+        self.cassette.record_code(index)
+        return index
+
+
+class ReplayCodeIndexes(_SnapshotCodeIndexes):
+    """Indexes the code snapshots of the cassette, repositories it holds none for raise ReplayMissError."""
+
+    def __init__(self, cassette: Cassette):
+        super().__init__(cassette.code_snapshot)
+
+
+@dataclass
+class ReplaySession:
+    """What to build the agents with inside record_session or replay_session."""
+    cassette: Cassette
+    model: BaseChatModel
+    mcp_manager: MCPSessionManager
+
+
+@asynccontextmanager
+async def record_session(path: str, model: Optional[BaseChatModel] = None,
+                         mcp_url: str = DEEPWIKI_MCP_SSE_ENDPOINT,
+                         checkouts: Optional[dict[str, str]] = None,
+                         loki_url: Optional[str] = None) -> AsyncIterator[ReplaySession]:
+    """
+    Run against the real LLM, Loki and MCP server, recording everything into a cassette saved at path.
+
+    Build the agents with the session's model and mcp_manager, e.g. orchestrator(model=..., mcp_manager=...).
+    Tools calling chat_model() directly, every Loki request and the code of every repository
+    indexed in the block are recorded too.
+
+    Args:
+        path: Fixture file to write
+        model: Model to record, the shared chat_model() by default
+        mcp_url: MCP server to record
+        checkouts: Local directories to index for some repositories instead of their GitHub clones
+        loki_url: Loki to send every request to instead of the requested one, e.g. a FakeLoki
+
+    Yields:
+        ReplaySession: Recording model and MCP session
+    """
+    cassette = Cassette(path)
+    live = get_session()
+    session = requests.Session()
+    session.auth = live.auth
+    adapter = RecordingLokiAdapter(cassette, loki_url, pool_connections=LOGS_HTTP_POOL_SIZE,
+                                   pool_maxsize=LOGS_HTTP_POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    client = httpx.AsyncClient(auth=live.auth, transport=RecordingLokiTransport(cassette, loki_url),
+                               timeout=LOGS_HTTP_TIMEOUT_SECONDS)
+    recording = ReplaySession(cassette, RecordingChatModel(cassette=cassette, inner=model or chat_model()),
+                              RecordingMCPManager(cassette, mcp_url))
+    async with _installed(session, client, recording, RecordingCodeIndexes(cassette, checkouts)):
+        yield recording
+    cassette.save()
+
+
+@asynccontextmanager
+async def replay_session(path: str, latency: Optional[InjectedLatency] = None,
+                         mcp_url: str = DEEPWIKI_MCP_SSE_ENDPOINT) -> AsyncIterator[ReplaySession]:
+    """
+    Replay a cassette recorded by record_session, fully offline.
+
+    Args:
+        path: Fixture file to read
+        latency: Delays injected into replayed calls, the recorded ones by default
+        mcp_url: URL the replayed MCP session reports
+
+    Yields:
+        ReplaySession: Replaying model and MCP session, requests with no recording raise ReplayMissError
+    """
+    latency = latency or InjectedLatency()
+    cassette = Cassette.load(path)
+    session = requests.Session()
+    session.auth = ("replay", "replay")
+    adapter = ReplayLokiAdapter(cassette, latency)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    client = httpx.AsyncClient(auth=("replay", "replay"), transport=ReplayLokiTransport(cassette, latency))
+    replaying = ReplaySession(cassette, ReplayChatModel(cassette=cassette, latency=latency),
+                              ReplayMCPManager(cassette, latency, mcp_url))
+    async with _installed(session, client, replaying, ReplayCodeIndexes(cassette)):
+        yield replaying
+
+
+@asynccontextmanager
+async def _installed(session: requests.Session, client: httpx.AsyncClient, replay: ReplaySession,
+                     code_indexes: _SnapshotCodeIndexes) -> AsyncIterator[None]:
+    # Lines cached by earlier runs would hide requests from the cassette, and the other way round
+    get_loki_result_cache().clear()
+    previous, previous_client = set_session(session), set_async_client(client)
+    try:
+        with use_chat_model(replay.model), use_code_indexes(code_indexes):
+            yield
+    finally:
+        code_indexes.close()
+        set_session(previous)
+        set_async_client(previous_client)
+        session.close()
+        await client.aclose()
+        await replay.mcp_manager.close()
+        get_loki_result_cache().clear()
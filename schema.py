@@ -1,10 +1,68 @@
-from typing import Annotated
+from typing import Annotated, Any, Literal
 
-from langgraph.graph import MessagesState
+from langgraph.graph import MessagesState, StateGraph
 from langgraph.graph.message import add_messages
+from langgraph.managed import RemainingSteps
+from langgraph_supervisor import create_supervisor
+from pydantic import BaseModel, Field
 
 from LoggingAgent.schema import LogItem
+from ledger import log_key
+
+def add_new_logs(left: list[LogItem], right: list[LogItem]) -> list[LogItem]:
+    """Append the log lines of right that are not in left yet, subgraphs return the whole list on every step."""
+    seen = {log_key(item) for item in left}
+    new = [item for item in right if log_key(item) not in seen]
+    return left + new if new else left
+
+
+def add_new_snippets(left: list[str], right: list[str]) -> list[str]:
+    """Append the source snippets of right that are not in left yet."""
+    seen = set(left)
+    new = [source for source in right if source not in seen]
+    return left + new if new else left
+
 
 class RootAgentState(MessagesState):
-    logs: list[LogItem]
-    codebase: list[str]
\ No newline at end of file
+    logs: Annotated[list[LogItem], add_new_logs]
+    codebase: Annotated[list[str], add_new_snippets]
+    # Required by the supervisor's ReAct loop, dropped from the graph around it, see create_root_supervisor
+    remaining_steps: RemainingSteps
+
+
+def create_root_supervisor(**kwargs: Any) -> StateGraph:
+    """
+    create_supervisor running the supervisor and the graph around it on RootAgentState.
+
+    The supervisor's ReAct loop reads remaining_steps to stop before the recursion limit,
+    but the outer graph cannot take it back: managed values are not channels, so every
+    supervisor turn would log a write to an unknown channel. The outer graph drops it and
+    the supervisor subgraph keeps computing its own.
+
+    Args:
+        **kwargs: Arguments of create_supervisor other than state_schema
+
+    Returns:
+        StateGraph: Workflow to compile
+    """
+    workflow = create_supervisor(state_schema=RootAgentState, **kwargs)
+    workflow.managed.pop('remaining_steps', None)
+    for channels in workflow.schemas.values():
+        channels.pop('remaining_steps', None)
+    return workflow
+
+
+class SubTask(BaseModel):
+    """One independent piece of work for a sub-agent"""
+    agent: str = Field(description="Name of the agent to run the task, e.g. logs_agent or codebase_agent")
+    task: str = Field(description="Self-contained instruction for the agent, it does not see the rest of the conversation")
+
+
+class SubTaskResult(BaseModel):
+    """Outcome of one sub-task of a parallel dispatch"""
+    index: int = Field(description="Position of the task in the dispatched batch")
+    agent: str
+    task: str
+    status: Literal['ok', 'timeout', 'error']
+    output: str = Field(description="Final answer of the agent, or the reason it failed")
+    elapsed_seconds: float
@@ -0,0 +1,54 @@
+"""Fake chat models shared by the tests and the benchmarks, answering without any network."""
+import asyncio
+import time
+from typing import Any, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+class SleepyModel(BaseChatModel):
+    """Answers every call with a fixed text after sleeping."""
+    delay_seconds: float
+    answer: str
+
+    @property
+    def _llm_type(self) -> str:
+        return "sleepy"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> 'SleepyModel':
+        return self
+
+    def _generate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager: Any = None,
+                  **kwargs: Any) -> ChatResult:
+        time.sleep(self.delay_seconds)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager: Any = None,
+                         **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.delay_seconds)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+
+class ScriptedModel(BaseChatModel):
+    """Replays a fixed list of AI messages, one per call."""
+    script: list[AIMessage]
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> 'ScriptedModel':
+        return self
+
+    def _generate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager: Any = None,
+                  **kwargs: Any) -> ChatResult:
+        message = self.script[min(self.calls, len(self.script) - 1)]
+        self.calls += 1
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def tool_call(name: str, args: dict, call_id: str) -> AIMessage:
+    return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": call_id, "type": "tool_call"}])
@@ -0,0 +1,87 @@
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from context_budget import ContextBudget, recall_context
+
+QUESTION = HumanMessage("Market data was reported stale at 15:35:47", id="question")
+
+
+def investigation(results: int, result_chars: int = 4_000) -> list:
+    """The question, then results turns each calling get_logs and getting result_chars of lines back."""
+    messages = [QUESTION]
+    for turn in range(results):
+        messages.append(AIMessage("", id=f"ai-{turn}", tool_calls=[
+            {"name": "get_logs", "args": {"turn": turn}, "id": f"call-{turn}", "type": "tool_call"}]))
+        messages.append(ToolMessage(f"lines of turn {turn} " + "x" * result_chars, id=f"result-{turn}",
+                                    name="get_logs", tool_call_id=f"call-{turn}"))
+    return messages
+
+
+def test_history_under_the_budget_is_sent_unchanged():
+    messages = investigation(3)
+    budget = ContextBudget(max_tokens=100_000)
+
+    assert budget.fit(messages) == messages
+    assert budget.stats["compacted_calls"] == 0
+
+
+def test_oldest_results_are_compacted_first_and_the_question_and_last_turn_are_kept():
+    messages = investigation(6)
+    budget = ContextBudget(max_tokens=3_500, min_tokens=100, preview_chars=200)
+
+    fitted = budget.fit(messages)
+
+    assert sum(budget.message_tokens(message) for message in fitted) <= 3_500
+    assert [message.id for message in fitted] == [message.id for message in messages]
+    assert fitted[0] is QUESTION
+    assert fitted[-2:] == messages[-2:]
+    assert fitted[2].content.startswith("[Compacted result of get_logs")
+    assert 'ref="result-0"' in fitted[2].content
+    assert fitted[2].tool_call_id == "call-0"
+    assert [message.tool_calls for message in fitted[1::2]] == [message.tool_calls for message in messages[1::2]]
+    assert fitted[10] is messages[10]
+    assert messages[2].content.startswith("lines of turn 0 xxx")
+
+
+def test_previews_are_dropped_when_compacting_with_them_is_not_enough():
+    messages = investigation(6)
+
+    loose = ContextBudget(max_tokens=3_500, min_tokens=100, preview_chars=200).fit(messages)
+    tight = ContextBudget(max_tokens=1_500, min_tokens=100, preview_chars=200).fit(messages)
+
+    assert "Preview: lines of turn 0" in loose[2].content
+    assert "Preview:" not in tight[2].content
+    assert 'ref="result-0"' in tight[2].content
+
+
+def test_small_messages_and_messages_without_id_are_never_compacted():
+    messages = investigation(4)
+    messages[2] = ToolMessage("no lines", id="small", name="get_logs", tool_call_id="call-0")
+    messages[4] = messages[4].model_copy(update={"id": None})
+    budget = ContextBudget(max_tokens=1, min_tokens=100)
+
+    fitted = budget.fit(messages)
+
+    assert fitted[2] is messages[2]
+    assert fitted[4] is messages[4]
+    assert fitted[6].content.startswith("[Compacted")
+    assert budget.stats["messages_compacted"] == 1
+
+
+def test_reserved_tokens_shrink_the_budget():
+    messages = investigation(3)
+    total = sum(ContextBudget().message_tokens(message) for message in messages)
+
+    assert ContextBudget(max_tokens=total, min_tokens=100).fit(messages) == messages
+    assert ContextBudget(max_tokens=total, reserved_tokens=500, min_tokens=100).fit(messages) != messages
+
+
+def test_recall_context_reads_the_full_text_back_in_pages():
+    messages = investigation(2, result_chars=30_000)
+    state = {"messages": messages}
+
+    first = recall_context.func(ref="result-0", state=state)
+    rest = recall_context.func(ref="result-0", state=state, offset=20_000)
+
+    assert first.endswith(f"[Cut at 20000 of {len(messages[2].content)} characters, call again with offset=20000]")
+    assert first[:20_000] + rest == messages[2].content
+    assert recall_context.func(ref="missing", state=state) == "No message with ref missing in this conversation"
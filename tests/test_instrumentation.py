@@ -0,0 +1,32 @@
+import json
+
+from instrumentation import append_spans, instrumented_run, span
+
+
+def test_spans_file_is_rotated_when_it_would_exceed_the_limit(tmp_path):
+    path = str(tmp_path / "spans.jsonl")
+
+    for run in range(5):
+        append_spans(path, json.dumps({"run": run}) + "\n", max_bytes=30)
+
+    with open(path, encoding='utf-8') as file:
+        current = [json.loads(line)["run"] for line in file]
+    with open(f"{path}.1", encoding='utf-8') as file:
+        rotated = [json.loads(line)["run"] for line in file]
+    assert current == [4]
+    assert rotated == [2, 3]
+    assert not (tmp_path / "spans.jsonl.2").exists()
+
+
+def test_run_appends_its_spans(tmp_path):
+    path = str(tmp_path / "spans.jsonl")
+
+    with instrumented_run("first", jsonl_path=path):
+        with span("step", "tool"):
+            pass
+    with instrumented_run("second", jsonl_path=path):
+        pass
+
+    with open(path, encoding='utf-8') as file:
+        records = [json.loads(line) for line in file]
+    assert {"first", "second"} <= {record.get("run") for record in records}
@@ -0,0 +1,31 @@
+import json
+
+from langchain_anthropic import ChatAnthropic
+from langchain_core.messages import HumanMessage
+
+from consts import CLAUDE_SONNET_4_LATEST
+from models import cached_system_message
+
+
+def request_payload(messages) -> dict:
+    """Body ChatAnthropic would send to the Messages API, built without any network call."""
+    model = ChatAnthropic(model_name=CLAUDE_SONNET_4_LATEST, api_key="test")
+    return model._get_request_payload(messages)
+
+
+def test_only_the_static_system_block_is_cached():
+    payload = request_payload([cached_system_message("static guide", "now: 2025-01-01 00:00:00"),
+                               HumanMessage(content="why is data stale?")])
+
+    assert payload["system"] == [
+        {"type": "text", "text": "static guide", "cache_control": {"type": "ephemeral"}},
+        {"type": "text", "text": "now: 2025-01-01 00:00:00"},
+    ]
+    assert json.dumps(payload).count('"cache_control"') == 1
+    assert payload["messages"] == [{"role": "user", "content": "why is data stale?"}]
+
+
+def test_static_prompt_alone_is_one_cached_block():
+    payload = request_payload([cached_system_message("static guide"), HumanMessage(content="q")])
+
+    assert payload["system"] == [{"type": "text", "text": "static guide", "cache_control": {"type": "ephemeral"}}]
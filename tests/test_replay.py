@@ -0,0 +1,55 @@
+import asyncio
+import json
+import os
+import socket
+
+import pytest
+
+from CodebaseAgent.code_index import CodeIndex
+from Orchestrator.incidents import investigate
+from Orchestrator.orchestrator import orchestrator
+from benchmarks.bench_replay import CORPUS_PATH, load_corpus
+from consts import REPLAY_FIXTURES_DIR
+from replay import InjectedLatency, replay_session
+
+INCIDENTS = load_corpus(CORPUS_PATH)
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    """Fail any connection or repository sync the replay would make."""
+    def refuse(*args, **kwargs):
+        raise AssertionError("replay went to the network")
+
+    monkeypatch.setattr(socket.socket, 'connect', refuse)
+    monkeypatch.setattr(CodeIndex, '_sync_checkout', refuse)
+
+
+async def replay(incident: dict) -> tuple[list[dict], dict]:
+    fixture = os.path.join(REPLAY_FIXTURES_DIR, f"{incident['incident_id']}.json")
+    async with replay_session(fixture, InjectedLatency(scale=0)) as session:
+        graph = await orchestrator(model=session.model, mcp_manager=session.mcp_manager)
+        chunks = [chunk async for chunk in investigate(graph, incident["incident_id"], incident["query"])]
+    return chunks, session.cassette.stats
+
+
+@pytest.mark.parametrize("incident", INCIDENTS, ids=[incident["incident_id"] for incident in INCIDENTS])
+def test_committed_fixtures_replay_offline(incident, offline):
+    fixture = os.path.join(REPLAY_FIXTURES_DIR, f"{incident['incident_id']}.json")
+    with open(fixture, 'r', encoding='utf-8') as file:
+        recorded = json.load(file)
+
+    chunks, stats = asyncio.run(replay(incident))
+
+    answer = [chunk for chunk in chunks if 'supervisor' in chunk][-1]['supervisor']['messages'][-1]
+    assert answer.content.startswith("Root cause:")
+    assert stats["llm_calls"] == sum(len(calls) for calls in recorded["llm"].values())
+    assert stats["mcp_calls"] == sum(len(calls) for calls in recorded["mcp"]["calls"].values())
+    assert list(recorded["code"]) == ["abhimanyu891998/cluestackmvpserver"]
+
+
+def test_replay_is_deterministic(offline):
+    first, second = asyncio.run(replay(INCIDENTS[0])), asyncio.run(replay(INCIDENTS[0]))
+
+    assert first[1] == second[1]
+    assert [list(chunk) for chunk in first[0]] == [list(chunk) for chunk in second[0]]
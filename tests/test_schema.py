@@ -0,0 +1,23 @@
+import asyncio
+import logging
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.prebuilt import create_react_agent
+
+from schema import create_root_supervisor
+from tests.fake_models import ScriptedModel, SleepyModel, tool_call
+
+
+def test_supervisor_turns_write_only_known_channels(caplog):
+    agents = [create_react_agent(model=SleepyModel(delay_seconds=0, answer=f"result {index}"), tools=[],
+                                 name=f"agent_{index}") for index in range(2)]
+    script = [tool_call("transfer_to_agent_0", {}, "call_0"), tool_call("transfer_to_agent_1", {}, "call_1"),
+              AIMessage(content="done")]
+    graph = create_root_supervisor(agents=agents, model=ScriptedModel(script=script)).compile()
+
+    with caplog.at_level(logging.WARNING):
+        state = asyncio.run(graph.ainvoke({"messages": [HumanMessage("investigate")]}))
+
+    assert state["messages"][-1].content == "done"
+    assert "remaining_steps" not in state
+    assert not [record for record in caplog.records if "unknown channel" in record.getMessage()]
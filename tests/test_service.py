@@ -0,0 +1,118 @@
+import asyncio
+import time
+from typing import Any, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.tools import tool
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.prebuilt import create_react_agent
+
+from LoggingAgent.schema import LogItem
+from Orchestrator.incidents import dangling_tool_results
+from Orchestrator.service import InvestigationService
+from ledger import current_ledger
+from schema import create_root_supervisor
+from tests.fake_models import SleepyModel
+
+LOOKUP_SECONDS = 0.2
+STALE = LogItem(asctime="2025-06-15 14:30:00", name="publisher", levelname="ERROR", filename="publisher.py",
+                lineno=42, funcName="check_staleness", message="Orderbook stale")
+running = {"now": 0, "most": 0}
+
+
+@tool
+async def lookup_logs() -> str:
+    """Fetch the incident's logs."""
+    current_ledger().record_logs([STALE])
+    running["now"] += 1
+    running["most"] = max(running["most"], running["now"])
+    try:
+        await asyncio.sleep(LOOKUP_SECONDS)
+    finally:
+        running["now"] -= 1
+    return "1 stale orderbook"
+
+
+class LookupModel(BaseChatModel):
+    """Calls lookup_logs once per question and answers when it returned."""
+
+    @property
+    def _llm_type(self) -> str:
+        return "lookup"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> 'LookupModel':
+        return self
+
+    def _generate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager: Any = None,
+                  **kwargs: Any) -> ChatResult:
+        if isinstance(messages[-1], ToolMessage):
+            message = AIMessage(content="root cause found")
+        else:
+            message = AIMessage(content="", tool_calls=[{"name": "lookup_logs", "args": {},
+                                                         "id": f"call_{time.monotonic_ns()}", "type": "tool_call"}])
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def build_graph():
+    agent = create_react_agent(model=SleepyModel(delay_seconds=0, answer="logs"), tools=[], name="logs_agent")
+    return create_root_supervisor(agents=[agent], model=LookupModel(), tools=[lookup_logs]).compile(
+        checkpointer=InMemorySaver())
+
+
+async def serve(graph, requests: list[dict], workers: int = 2, deadline_seconds: float = 30) -> list[dict]:
+    events = []
+    service = InvestigationService(graph, events.append, workers=workers, deadline_seconds=deadline_seconds)
+    service.start()
+    for request in requests:
+        service.submit(request["request_id"], "Market data was reported stale", incident_id=request.get("incident_id"))
+    await service.drain()
+    return events
+
+
+def test_requests_without_an_incident_id_start_new_incidents():
+    events = asyncio.run(serve(build_graph(), [{"request_id": "q-1"}, {"request_id": "q-2"}]))
+
+    incidents = {event["request_id"]: event["incident_id"] for event in events if event["event"] == "started"}
+    assert incidents["q-1"] != incidents["q-2"]
+    assert "q-1" not in incidents.values()
+
+
+def test_requests_of_one_incident_run_one_at_a_time():
+    requests = [{"request_id": "q-1", "incident_id": "inc-1"}, {"request_id": "q-2", "incident_id": "inc-1"},
+                {"request_id": "q-3", "incident_id": "inc-2"}]
+    running["most"] = 0
+
+    events = asyncio.run(serve(build_graph(), requests, workers=3))
+
+    assert [event["request_id"] for event in events if event["event"] == "done"][-1] == "q-2"
+    assert running["most"] == 2
+
+
+def test_deadline_keeps_fetched_logs_and_the_incident_resumes():
+    graph = build_graph()
+
+    async def run():
+        timed_out = await serve(graph, [{"request_id": "q-1", "incident_id": "inc-1"}],
+                                deadline_seconds=LOOKUP_SECONDS / 2)
+        saved = (await graph.aget_state({"configurable": {"thread_id": "inc-1"}})).values
+        resumed = await serve(graph, [{"request_id": "q-2", "incident_id": "inc-1"}])
+        return timed_out, saved, resumed
+
+    timed_out, saved, resumed = asyncio.run(run())
+
+    assert timed_out[-1]["event"] == "timeout"
+    assert saved["logs"] == [STALE]
+    assert resumed[-1]["event"] == "done"
+
+
+def test_unanswered_tool_calls_get_an_error_result():
+    call = {"name": "lookup_logs", "args": {}, "id": "call_1", "type": "tool_call"}
+    answered = {"name": "lookup_logs", "args": {}, "id": "call_0", "type": "tool_call"}
+    messages = [AIMessage(content="", tool_calls=[answered]), ToolMessage(content="ok", tool_call_id="call_0"),
+                AIMessage(content="", tool_calls=[call])]
+
+    results = dangling_tool_results(messages)
+
+    assert [(result.tool_call_id, result.status) for result in results] == [("call_1", "error")]